@@ -48,7 +48,8 @@ if _env.PY_CONSOLE_USE_TERMINFO.truthy or _env.SSH_CLIENT:
                 'terminfo not available, try installing ncurses.'
                 ' On Windows, install the package from PyPI named "jinxed".'
             )
-    _curses.setupterm()
+    from .terminfo import load_snapshot as _load_snapshot
+    _load_snapshot()  # of capabilities, from a disk cache or curses setup
     using_terminfo = True
 
 
@@ -0,0 +1,809 @@
+# -*- coding: future_fstrings -*-
+'''
+    .. console - Comprehensive utility library for ANSI terminals.
+    .. © 2018, Mike Miller - Released under the LGPL, version 3+.
+
+    Micro-benchmarks of the hot paths of the library,
+    run all or a selection via command-line::
+
+        ▶ python3 -m console.benchmarks [name…]
+
+    Timings are the best of several repeats, per call.
+'''
+import sys
+from timeit import Timer
+
+from .constants import CSI, TermLevel
+
+
+REPEAT = 3
+
+
+def _time(func, number=1):
+    ''' Returns the best time per call of func, in seconds. '''
+    return min(Timer(func).repeat(REPEAT, number)) / number
+
+
+def _report(label, seconds, baseline=None):
+    ''' Print a line of results, with speedup relative to baseline. '''
+    line = f'  {label:<40} {seconds * 1e3:10.3f} ms'
+    if baseline:
+        line += f'  {baseline / seconds:8.1f}x'
+    print(line)
+
+
+def bench_proximity_batch(count=20000):
+    ''' Batch downgrade vs. calling find_nearest_color_index per color. '''
+    from random import Random
+    from . import proximity
+
+    rand = Random(0)
+    colors = [(rand.randrange(256), rand.randrange(256), rand.randrange(256))
+              for _ in range(count)]
+    if not proximity.color_table8:
+        proximity.build_color_tables()
+    print(f'proximity_batch: {count} random colors')
+
+    for name in ('color_table8', 'color_table4'):
+        table = getattr(proximity, name)
+        proximity._get_lookup_table(table)  # don't time the build
+
+        def scalar():
+            find = proximity.find_nearest_color_index
+            return [find(*color, color_table=table) for color in colors]
+
+        def scalar_scan():
+            find = proximity.find_nearest_color_index
+            copy = list(table)  # not an active table, no lookup table
+            return [find(*color, color_table=copy) for color in colors[:2000]]
+
+        baseline = _time(scalar_scan) * count / 2000
+        _report(f'{name} scalar, linear scan (est.)', baseline)
+        _report(f'{name} scalar', _time(scalar), baseline)
+        _report(f'{name} batch, python',
+                _time(lambda: proximity._find_nearest_indexes_python(
+                    colors, table)), baseline)
+        try:
+            import numpy
+            array = numpy.array(colors, dtype=numpy.uint8)
+            _report(f'{name} batch, numpy',
+                    _time(lambda: proximity._find_nearest_indexes_numpy(
+                        numpy, array, table)), baseline)
+        except ImportError:
+            print('  (numpy not available)')
+
+
+def bench_proximity_methods(count=2000):
+    ''' Lookups by distance method, vs. the Euclidean linear scan. '''
+    from random import Random
+    from . import proximity
+
+    rand = Random(0)
+    colors = [(rand.randrange(256), rand.randrange(256), rand.randrange(256))
+              for _ in range(count)]
+    proximity.build_color_tables()
+    table = proximity.color_table8
+    find = proximity.find_nearest_color_index
+    print(f'proximity_methods: {count} random colors, color_table8')
+
+    copy = list(table)  # not an active table, no lookup table
+    baseline = _time(lambda: [find(*color, color_table=copy)
+                              for color in colors[:200]]) * count / 200
+    _report('euclid, linear scan (est.)', baseline)
+
+    for method in proximity.distance_methods:
+        def lookup():
+            return [find(*color, method=method) for color in colors]
+
+        def cold():
+            proximity.build_color_tables()  # fresh tables, memo
+            lookup()
+
+        _report(f'{method}, first use', _time(cold), baseline)
+        _report(f'{method}, again', _time(lookup), baseline)
+
+        try:
+            import numpy
+            array = numpy.array(colors, dtype=numpy.uint8)
+            _report(f'{method}, batch numpy',
+                    _time(lambda: proximity._find_nearest_indexes_numpy(
+                        numpy, array, table, method)), baseline)
+        except ImportError:
+            pass
+
+
+def _measure_entries(entry_class, count):
+    ''' Returns bytes allocated per entry, and the entries. '''
+    import tracemalloc
+    from .style import ForegroundPalette
+
+    parent = ForegroundPalette(level=TermLevel.THE_FULL_MONTY)
+
+    codes = [f'38;5;{i % 256}' for i in range(count)]  # outside measurement
+    tracemalloc.start()
+    try:
+        start = tracemalloc.get_traced_memory()[0]
+        entries = [entry_class(parent, 'NAME', code) for code in codes]
+        used = tracemalloc.get_traced_memory()[0] - start
+    finally:
+        tracemalloc.stop()
+    return used / len(entries), entries
+
+
+def bench_palette_entry(count=10000):
+    ''' Memory and str() throughput of slotted palette entries.
+        See test_palette_entry_compact for a comparison to the legacy class.
+    '''
+    from .core import _PaletteEntry
+
+    print(f'palette_entry: {count} entries')
+    size, entries = _measure_entries(_PaletteEntry, count)
+    seconds = _time(lambda: [str(entry) for entry in entries], number=10)
+    print(f'  {"slotted":<10} {size:8.1f} bytes/entry'
+          f'  str(): {seconds / count * 1e9:7.1f} ns/entry')
+
+
+def bench_palette_stream(count=200000):
+    ''' Peak memory and time of styling a large text, call vs. stream. '''
+    import io
+    import tracemalloc
+    from .style import ForegroundPalette
+
+    style = ForegroundPalette(level=TermLevel.THE_FULL_MONTY).red
+    text = 'The quick brown fox jumps over the lazy dog.\n' * count
+    print(f'palette_stream: {len(text) / 1e6:.1f}M chars, {count} lines')
+
+    class Sink:
+        def write(self, data):
+            return len(data)
+
+    source = io.StringIO(text)  # outside measurement
+
+    def call():
+        Sink().write(style(text))
+
+    def stream():
+        source.seek(0)
+        style.stream(source, file=Sink())
+
+    for label, func in (('call', call), ('stream', stream)):
+        tracemalloc.start()
+        try:
+            func()
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+        seconds = _time(func)
+        print(f'  {label:<10} {peak / 1e6:8.1f} MB peak'
+              f'  {seconds * 1e3:10.3f} ms')
+
+
+def bench_framebuffer(frames=100, width=80, height=24):
+    ''' Bytes per frame of a dashboard, redrawn fully vs. diffed. '''
+    import io
+    from .framebuffer import FrameBuffer
+    from .screen import Screen
+
+    sc = Screen(force=True)
+    styles = (f'{CSI}1;37;44m', f'{CSI}32m', f'{CSI}2m', None)
+
+    def draw(put, i):  # a header, a table of changing numbers, a clock
+        put(0, 0, f' Dashboard{"":{width - 10}}', styles[0])
+        for row in range(1, height - 1):
+            value = (row * 7919 + i * (row % 3)) % 10000
+            put(0, row, f'service-{row:02}', styles[2])
+            put(20, row, f'{value:6} req/s', styles[1])
+            put(36, row, '█' * (value // 400) + ' ' * 25)
+        put(0, height - 1, f'frame {i:5}', styles[3])
+
+    def full_redraw(stream):
+        for i in range(frames):  # clear and write everything, styled
+            output = [sc.ed(2)]
+            draw(lambda x, y, text, style=None: output.append(
+                f'{sc.move_to(x, y)}{style or ""}{text}{CSI}0m'), i)
+            stream.write(''.join(output))
+
+    def diffed(stream):
+        frame = FrameBuffer(width, height, stream=stream, screen=sc)
+        for i in range(frames):
+            draw(frame.put, i)
+            frame.flush()
+        return frame
+
+    stream = io.StringIO()
+    full_redraw(stream)
+    full_bytes = len(stream.getvalue().encode('utf8')) / frames
+    frame = diffed(io.StringIO())
+    print(f'framebuffer: {width}x{height}, {frames} frames')
+    print(f'  full redraw:  {full_bytes:10.0f} bytes/frame')
+    print(f'  diffed:       {frame.bytes_written / frames:10.0f} bytes/frame,'
+          f' {frame.frame_bytes} in the last, '
+          f'{full_bytes * frames / frame.bytes_written:.1f}x less')
+    _report('full redraw', _time(lambda: full_redraw(io.StringIO())))
+    _report('diffed', _time(lambda: diffed(io.StringIO())))
+
+
+def bench_line_writer(count=5000):
+    ''' Writes issued by a style context, per-line vs. single vs. buffered. '''
+    import io
+    from .core import _LineWriter
+
+    class CountingIO(io.StringIO):
+        writes = 0
+        def write(self, data):
+            self.writes += 1
+            return super().write(data)
+
+    red = f'{CSI}31m'
+    text = '\n'.join(f'line {i}' for i in range(100))
+    print(f'line_writer: {count} prints of {text.count(chr(10)) + 1} lines')
+
+    def run(threshold):
+        stream = CountingIO()
+        writer = _LineWriter(red, stream, f'{CSI}39m', threshold)
+        for _ in range(count):
+            print(text, file=writer)
+        writer.flush()
+        return stream.writes
+
+    per_line = count * (text.count('\n') + 2)  # as before, plus print's end
+    for label, threshold in (('single write', 0), ('buffered 64k', 65536)):
+        seconds = _time(lambda: run(threshold))
+        print(f'  {label:<14} {run(threshold):8} writes (was {per_line})'
+              f'  {seconds * 1e3:10.3f} ms')
+
+
+def bench_palette_lookup(count=2000):
+    ''' Cache misses of computed palette entries, by kind of name. '''
+    from .core import _get_color_name_index, _web_color_map
+    from .style import ForegroundPalette
+
+    pal = ForegroundPalette(level=TermLevel.THE_FULL_MONTY)
+    index = _get_color_name_index()
+    kinds = dict(
+        index = [f'i{i % 256}' for i in range(count)],
+        truecolor = [f't_{i:06x}' for i in range(count)],
+        bare_web = list(_web_color_map),
+        bare_x11 = [name for name in index if name not in _web_color_map],
+        unknown = [f'nope{i % 100}' for i in range(count)],
+    )
+    print('palette_lookup: names by kind, uncached')
+
+    def lookup(names):
+        for name in names:
+            try:
+                getattr(pal, name)
+            except AttributeError:
+                pass
+
+    for kind, names in kinds.items():
+        def miss():
+            pal._clear()
+            lookup(names)
+        # unknown names are negative-cached after their first miss:
+        seconds = _time(miss) if kind != 'unknown' else _time(
+                                                    lambda: lookup(names))
+        print(f'  {kind:<12} {seconds / len(names) * 1e6:8.2f} µs/name'
+              f'  ({len(names)})')
+
+
+def bench_palette_numeric(count=20000):
+    ''' Coloring from data: formatted attribute names vs. numeric forms. '''
+    from random import Random
+    from .style import ForegroundPalette
+
+    pal = ForegroundPalette(level=TermLevel.THE_FULL_MONTY)
+    rand = Random(0)
+    indexes = [rand.randrange(256) for _ in range(count)]
+    colors = [(rand.randrange(8) * 32, rand.randrange(8) * 32,
+               rand.randrange(8) * 32) for _ in range(count)]  # 512, cached
+    print(f'palette_numeric: {count} lookups')
+
+    baseline = _time(lambda: [getattr(pal, f'i{i}') for i in indexes])
+    _report('getattr(fg, f"i{i}")', baseline)
+    _report('fg[i]', _time(lambda: [pal[i] for i in indexes]), baseline)
+
+    baseline = _time(lambda: [getattr(pal, f't_{r:02x}{g:02x}{b:02x}')
+                              for r, g, b in colors])
+    _report('getattr(fg, f"t_{r:02x}{g:02x}{b:02x}")', baseline)
+    _report('fg.rgb(r, g, b)',
+            _time(lambda: [pal.rgb(*rgb) for rgb in colors]), baseline)
+
+
+def bench_render_spans(count=20000):
+    ''' Styled spans of a dashboard-like frame, called vs. rendered. '''
+    from random import Random
+    from .sgr import render_spans
+    from .style import ForegroundPalette, BackgroundPalette, EffectsPalette
+
+    level = TermLevel.THE_FULL_MONTY
+    fg = ForegroundPalette(level=level)
+    bg = BackgroundPalette(level=level)
+    fx = EffectsPalette(level=level)
+    styles = [fg.red, fg.red, fg.green, fg.red + fx.bold, fg.i208 + bg.i236,
+              bg.i236, fx.dim, fx.dim + fg.green]
+    rand = Random(0)
+    spans = [(f'{rand.randrange(1000):4} ', rand.choice(styles))
+             for _ in range(count)]
+    print(f'render_spans: {count} spans')
+
+    called = ''.join(style(text) for text, style in spans)
+    rendered = render_spans(spans)
+    baseline = _time(lambda: ''.join(style(text) for text, style in spans))
+    _report(f'call per span    {len(called):8} chars', baseline)
+    _report(f'render_spans     {len(rendered):8} chars',
+            _time(lambda: render_spans(spans)), baseline)
+
+
+def bench_fit_text(count=200):
+    ''' Fitting styled text to columns, one pass vs. strip-measure-restyle,
+        which loses the inner styles in the bargain.
+    '''
+    import textwrap
+    from . import text as ansitext
+    from .sgr import sgr_finder
+    from .utils import len_stripped, strip_ansi
+
+    line = (f'The {CSI}31mquick {CSI}1mbrown{CSI}0m fox jumps over the '
+            f'{CSI}34mlazy dog{CSI}0m, {CSI}3mnaïvely{CSI}0m. ')
+    paragraph = line * 20
+    texts = [line * (i % 4 + 1) for i in range(count)]
+    print(f'fit_text: {count} styled strings, {len(paragraph)} char paragraph')
+
+    def restyle(text, plain):  # by hand, with the opening styles
+        return ''.join(sgr_finder.findall(text)[:1]) + plain + f'{CSI}0m'
+
+    def legacy_truncate():
+        for text in texts:
+            plain = strip_ansi(text)
+            if len(plain) > 40:
+                restyle(text, plain[:39] + '…')
+
+    def legacy_ljust():
+        for text in texts:
+            text + ' ' * (400 - len_stripped(text))
+
+    def legacy_wrap():
+        plain = strip_ansi(paragraph)
+        return [restyle(paragraph, line)
+                for line in textwrap.wrap(plain, 60)]
+
+    cases = (
+        ('truncate', legacy_truncate,
+         lambda: [ansitext.truncate(text, 40) for text in texts]),
+        ('ljust', legacy_ljust,
+         lambda: [ansitext.ljust(text, 400) for text in texts]),
+        ('wrap', legacy_wrap, lambda: ansitext.wrap(paragraph, 60)),
+    )
+    for name, legacy, func in cases:
+        baseline = _time(legacy, 10)
+        _report(f'{name}, strip-measure-restyle', baseline)
+        _report(f'{name}, one pass', _time(func, 10), baseline)
+
+
+def bench_batch_writer(count=2000):
+    ''' Write syscalls of the utils helpers, printing vs. batched. '''
+    import io, os
+    from . import utils
+    from .screen import Screen
+
+    class CountingFileIO(io.FileIO):
+        writes = 0
+        def write(self, data):
+            self.writes += 1
+            return super().write(data)
+
+    def frame(i):
+        utils.clear_screen()
+        utils.set_title(f'frame {i}')
+        utils.notify_cwd('/tmp')
+        utils.clear_line()
+
+    def run(mode):
+        raw = CountingFileIO(os.devnull, 'w')
+        stream = io.TextIOWrapper(io.BufferedWriter(raw), encoding='utf8')
+        orig_stdout, sys.stdout = sys.stdout, stream
+        writes = 0
+        try:
+            if mode == 'print':
+                for i in range(count):
+                    frame(i)
+            elif mode == 'per frame':
+                for i in range(count):
+                    with utils.BatchWriter() as out:
+                        frame(i)
+                    writes += out.write_count
+            else:
+                with utils.BatchWriter() as out:
+                    for i in range(count):
+                        frame(i)
+                writes += out.write_count
+            stream.flush()
+        finally:
+            sys.stdout = orig_stdout
+            stream.close()
+        return writes + raw.writes
+
+    orig_capable, utils._ansi_capable = utils._ansi_capable, True
+    orig_sc, utils.sc = utils.sc, Screen(force=True)
+    print(f'batch_writer: {count} frames of 4 helper calls')
+    try:
+        baseline = _time(lambda: run('print'))
+        for mode in ('print', 'per frame', 'buffered 64k'):
+            seconds = _time(lambda: run(mode))
+            print(f'  {mode:<14} {run(mode):8} writes'
+                  f'  {seconds * 1e3:10.3f} ms  {baseline / seconds:6.1f}x')
+    finally:
+        utils._ansi_capable = orig_capable
+        utils.sc = orig_sc
+
+
+def bench_cursor(count=2000, width=80, height=24):
+    ''' Bytes of cursor moves of redraw workloads, cup vs. planned. '''
+    from random import Random
+    from .cursor import CursorPlanner
+    from .screen import Screen
+
+    sc = Screen(force=True)
+    rand = Random(0)
+
+    def editor():  # type a line, then to the start of the next
+        for i in range(count):
+            y = i % height
+            yield 0, y, 'x' * rand.randrange(width // 2)
+
+    def status():  # a counter & a spinner on the last line
+        for i in range(count):
+            yield 10, height - 1, f'{i:6}'
+            yield 0, height - 1, '|/-\\'[i % 4]
+
+    def table():  # a column of numbers, top to bottom
+        for i in range(count):
+            yield 20, 1 + i % (height - 2), f'{i * 7919 % 10000:6}'
+
+    def scattered():  # random cells
+        for i in range(count):
+            yield rand.randrange(width), rand.randrange(height), '*'
+
+    print(f'cursor: {width}x{height}, {count} updates per workload')
+    for workload in (editor, status, table, scattered):
+        moves = list(workload())
+
+        def run():
+            cursor = CursorPlanner(sc)
+            for x, y, text in moves:
+                cursor.move_to(x, y)
+                cursor.advance(text)
+            return cursor
+
+        cursor = run()
+        full = sum(len(sc.move_to(x, y)) for x, y, text in moves)
+        print(f'  {workload.__name__:<10} {full:8} cup bytes → '
+              f'{cursor.bytes_planned:6} planned, '
+              f'{full / cursor.bytes_planned:4.1f}x less'
+              f'  {_time(run) / len(moves) * 1e6:6.2f} µs/move')
+
+
+def bench_display_width(count=10000):
+    ''' Measuring styled strings, display_width vs. len_stripped. '''
+    from . import utils
+
+    cases = dict(
+        ascii = 'Hang Loose, Hawaii',
+        styled = f'Hang {CSI}34;4;5mLoose{CSI}0m, Hawaii',
+        wide = f'{CSI}1m日本語{CSI}0m 😎 cafe\u0301',
+    )
+    print(f'display_width: {count} calls, repeated strings are cached')
+    for name, text in cases.items():
+        legacy = _time(lambda: [utils.len_stripped(text) for _ in range(count)])
+        _report(f'{name}, len_stripped', legacy)
+
+        def measure():
+            utils._width_cache.clear()  # one miss per run
+            return [utils.display_width(text) for _ in range(count)]
+        _report(f'{name}, display_width', _time(measure), legacy)
+
+
+def bench_downgrade_ansi(count=50000):
+    ''' Re-encoding a truecolor log to lesser levels, cached per stream. '''
+    from random import Random
+    from . import proximity
+    from .utils import downgrade_ansi
+
+    if not proximity.color_table8:
+        proximity.build_color_tables()
+    rand = Random(0)
+    palette = [tuple(rand.randrange(256) for _ in range(3)) for _ in range(64)]
+    lines = []
+    for i in range(count):
+        r, g, b = rand.choice(palette)
+        lines.append(f'{CSI}38;2;{r};{g};{b}m{i:08} INFO{CSI}0m message\n')
+    text = ''.join(lines)
+    print(f'downgrade_ansi: {count} lines, {len(palette)} distinct colors')
+
+    for level in (TermLevel.ANSI_EXTENDED, TermLevel.ANSI_BASIC):
+        seconds = _time(lambda: downgrade_ansi(text, level))
+        result = downgrade_ansi(text, level)
+        print(f'  {level.name:<14} {len(text) / seconds / 1e6:6.1f}M chars/s'
+              f'  {len(text):9} → {len(result):9} chars')
+
+
+def _legacy_strip_ansi(text, c1=False, osc=False):
+    ''' strip_ansi prior to the combined pattern, to compare against. '''
+    import re
+    text = re.sub(r'\x1b\[[0-?]*[ -/]*[@-~]', '', text)
+    if osc:
+        text = re.sub(r'\x1b\].*?(\a|\x1b\\)', '', text)
+    if c1:
+        text = re.sub(r'\x9b[0-?]*[ -/]*[@-~]', '', text)
+        if osc:
+            text = re.sub(r'\x9b.*?(\a|\x9d)', '', text)
+    return text
+
+
+def bench_strip_ansi(sizes=(1000, 2000, 4000)):
+    ''' Worst-case inputs, e.g. unterminated OSCs, legacy vs. linear. '''
+    from .utils import strip_ansi
+
+    cases = dict(
+        unterminated_osc = lambda n: '\x1b]0;truncated log line ' * n,
+        csi_params = lambda n: '\x1b[' + '1;' * n,
+        styled_text = lambda n: '\x1b[1;31mHello\x1b[0m World \x1b]0;t\a' * n,
+    )
+    print('strip_ansi: c1=True, osc=True, per input size')
+    for name, make in cases.items():
+        print(f'  {name}')
+        for size in sizes:
+            text = make(size)
+            legacy = _time(lambda: _legacy_strip_ansi(text, c1=True, osc=True))
+            _report(f'  {len(text):8} chars, legacy', legacy)
+            _report(f'  {len(text):8} chars, linear',
+                    _time(lambda: strip_ansi(text, c1=True, osc=True)), legacy)
+
+
+def bench_templates(count=20000, width=80, height=24):
+    ''' Renders of screen templates, uncached vs. cached, and hit rates. '''
+    from random import Random
+    from . import screen
+
+    sc = screen.Screen(force=True)
+    rand = Random(0)
+    moves = [(rand.randrange(width), rand.randrange(height))
+             for _ in range(count)]
+    steps = [rand.randrange(1, width) for _ in range(count)]
+    print(f'templates: {count} renders, {width}x{height} coordinates')
+
+    for label, template, args in (('move_to(x, y)', sc.move_to, moves),
+                                  ('cuf(n)', sc.cuf, [(n,) for n in steps])):
+        render = template._render
+        baseline = _time(lambda: [render(*arg) for arg in args])
+        _report(f'{label} uncached', baseline)
+        _report(f'{label} cached', _time(lambda: [template(*arg)
+                                                 for arg in args]), baseline)
+
+    counts = {True: 0, False: 0}
+    def hook(template, args, hit):
+        counts[hit] += 1
+
+    sc = screen.Screen(force=True)  # start cold
+    screen.render_hook = hook
+    try:
+        for x, y in moves:
+            sc.move_to(x, y)
+            sc.cuf(x or 1)
+    finally:
+        screen.render_hook = None
+    print(f'  hit rate:  {counts[True] / (counts[True] + counts[False]):.1%}'
+          f' of {counts[True] + counts[False]} renders')
+
+
+def bench_terminfo(runs=20):
+    ''' Loading the terminfo snapshot in a new process,
+        via curses setup vs. the disk cache.
+    '''
+    import os, subprocess, tempfile
+    from importlib.util import find_spec
+    from statistics import median
+
+    if not find_spec('curses'):
+        print('terminfo: curses not available')
+        return
+    code = ('import time, curses, console; console._curses = curses; '
+            'from console import terminfo; start = time.perf_counter(); '
+            'terminfo.load_snapshot(cache=%s); '
+            'print(time.perf_counter() - start, len(terminfo._snapshot))')
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+    with tempfile.TemporaryDirectory() as dirname:
+        environ = dict(os.environ, XDG_CACHE_HOME=dirname, PYTHONPATH=root)
+        environ.pop('PY_CONSOLE_USE_TERMINFO', None)
+
+        def run(cache):
+            output = subprocess.run([sys.executable, '-c', code % cache],
+                                    env=environ, stdout=subprocess.PIPE,
+                                    universal_newlines=True, check=True).stdout
+            seconds, count = output.split()
+            return float(seconds), count
+
+        seconds, count = run(True)  # fills the cache
+        print(f'terminfo: TERM={os.environ.get("TERM")!r}, '
+              f'{count} capabilities, median of {runs} processes')
+        baseline = median(run(False)[0] for _ in range(runs))
+        _report('curses setup & snapshot', baseline)
+        _report('snapshot from disk cache',
+                median(run(True)[0] for _ in range(runs)), baseline)
+
+
+def bench_tokenize(count=20000, chunk_size=65536):
+    ''' Tokenizer throughput over str, bytes & chunks, and stripping built
+        on it vs. the regex substitution of strip_ansi.
+    '''
+    from .tokens import tokenize, tokenize_stream
+    from .utils import strip_ansi
+
+    line = (f'{CSI}2m2021-04-21{CSI}0m {CSI}1;32mINFO{CSI}0m '
+            f'request served in {CSI}38;5;208m42ms{CSI}0m, '
+            f'\x1b]8;;http://x.org\x1b\\naïve\x1b]8;;\x1b\\\n')
+    text = line * count
+    data = text.encode('utf8')
+    chunks = [data[i:i+chunk_size] for i in range(0, len(data), chunk_size)]
+    tokens = sum(1 for token in tokenize(text))
+    print(f'tokenize: {len(data) / 1e6:.1f} MB, {tokens} tokens')
+
+    def consume(tokens):
+        for token in tokens:
+            pass
+
+    for label, func in (
+            ('str', lambda: consume(tokenize(text))),
+            ('bytes', lambda: consume(tokenize(data))),
+            ('bytes, chunked', lambda: consume(tokenize_stream(chunks))),
+        ):
+        seconds = _time(func)
+        print(f'  {label:<16} {len(data) / seconds / 1e6:7.1f} MB/s'
+              f'  {tokens / seconds / 1e6:5.2f} M tokens/s')
+
+    baseline = _time(lambda: strip_ansi(text, osc=True))
+    _report('strip, strip_ansi', baseline)
+    _report('strip, tokenize', _time(lambda: ''.join(
+        token.data for token in tokenize(text) if token.kind == 'text'
+    )), baseline)
+
+
+def bench_ansi_stripper(count=100000, chunk_size=65536):
+    ''' Stripping a log incrementally, bytes natively vs. decoded to str. '''
+    import io
+    import tracemalloc
+    from .utils import AnsiStripper
+
+    line = (f'{CSI}2m2021-04-21{CSI}0m {CSI}1;32mINFO{CSI}0m '
+            f'request served in {CSI}38;5;208m42ms{CSI}0m, naïve\n')
+    data = (line * count).encode('utf8')
+    print(f'ansi_stripper: {len(data) / 1e6:.1f} MB, '
+          f'{chunk_size // 1024}k chunks')
+
+    class Sink:
+        def write(self, data):
+            return len(data)
+
+    def strip_bytes():
+        sink = Sink()
+        for chunk in AnsiStripper()(io.BytesIO(data), chunk_size):
+            sink.write(chunk)
+
+    def strip_str():
+        sink = Sink()
+        infile = io.TextIOWrapper(io.BytesIO(data), encoding='utf8')
+        for chunk in AnsiStripper()(infile, chunk_size):
+            sink.write(chunk.encode('utf8'))
+
+    for label, func in (('str, decoded', strip_str), ('bytes', strip_bytes)):
+        tracemalloc.start()
+        try:
+            func()
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+        seconds = _time(func)
+        print(f'  {label:<14} {len(data) / seconds / 1e6:7.1f} MB/s'
+              f'  {peak / 1e6:6.2f} MB peak')
+
+
+def bench_ansi_file(count=400000, max_workers=None):
+    ''' Throughput of stripping & downgrading a file, per count of workers. '''
+    import os
+    import tempfile
+    from .utils import downgrade_ansi_file, strip_ansi_file
+
+    max_workers = max_workers or os.cpu_count() or 1
+    line = (f'{CSI}2m2021-04-21{CSI}0m {CSI}1;32mINFO{CSI}0m '
+            f'request served in {CSI}38;2;255;128;0m42ms{CSI}0m, naïve\n')
+    data = (line * count).encode('utf8')
+    print(f'ansi_file: {len(data) / 1e6:.1f} MB, 1 to {max_workers} workers')
+
+    with tempfile.TemporaryDirectory() as tempdir:
+        inpath = os.path.join(tempdir, 'in.log')
+        outpath = os.path.join(tempdir, 'out.log')
+        with open(inpath, 'wb') as infile:
+            infile.write(data)
+
+        for label, func, kwargs in (
+                ('strip', strip_ansi_file, {}),
+                ('downgrade', downgrade_ansi_file, dict(level='extended')),
+            ):
+            for workers in range(1, max_workers + 1):
+                seconds = _time(lambda: func(inpath, outpath, workers, **kwargs))
+                print(f'  {label:<10} {workers:2} workers'
+                      f' {len(data) / seconds / 1e6:8.1f} MB/s')
+
+
+def _get_demo_output():
+    ''' Capture the output of the demos, with color forced on. '''
+    import os
+    import subprocess
+
+    environ = dict(os.environ, CLICOLOR_FORCE='1', COLORTERM='truecolor',
+                   TERM='xterm-256color')
+    return subprocess.run([sys.executable, '-m', 'console.demos'],
+                          stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+                          env=environ, check=True).stdout.decode('utf8')
+
+
+def bench_optimize_ansi(repeat=10):
+    ''' Bytes saved rewriting demo output, plus concatenated styled spans. '''
+    from .style import ForegroundPalette, EffectsPalette
+    from .utils import optimize_ansi
+
+    fg = ForegroundPalette(level=TermLevel.THE_FULL_MONTY)
+    fx = EffectsPalette(level=TermLevel.THE_FULL_MONTY)
+    texts = dict(
+        demos = _get_demo_output() * repeat,
+        concatenated = ''.join(
+            (fg.red('ab') + fg.red('cd') + fx.dim('ef') + fx.dim(fg.green('g')))
+            for _ in range(5000)),
+    )
+    print('optimize_ansi:')
+    for label, text in texts.items():
+        optimized = optimize_ansi(text)
+        before, after = len(text.encode('utf8')), len(optimized.encode('utf8'))
+        seconds = _time(lambda: optimize_ansi(text))
+        print(f'  {label:<14} {before:8} → {after:8} bytes'
+              f'  {(before - after) / before:6.1%} saved'
+              f'  {seconds * 1e3:8.3f} ms')
+
+
+benchmarks = dict(
+    ansi_file = bench_ansi_file,
+    ansi_stripper = bench_ansi_stripper,
+    batch_writer = bench_batch_writer,
+    cursor = bench_cursor,
+    display_width = bench_display_width,
+    downgrade_ansi = bench_downgrade_ansi,
+    fit_text = bench_fit_text,
+    framebuffer = bench_framebuffer,
+    line_writer = bench_line_writer,
+    optimize_ansi = bench_optimize_ansi,
+    palette_entry = bench_palette_entry,
+    palette_lookup = bench_palette_lookup,
+    palette_numeric = bench_palette_numeric,
+    palette_stream = bench_palette_stream,
+    proximity_batch = bench_proximity_batch,
+    proximity_methods = bench_proximity_methods,
+    render_spans = bench_render_spans,
+    strip_ansi = bench_strip_ansi,
+    templates = bench_templates,
+    terminfo = bench_terminfo,
+    tokenize = bench_tokenize,
+)
+
+
+if __name__ == '__main__':
+
+    names = sys.argv[1:] or list(benchmarks)
+    for name in names:
+        try:
+            bench = benchmarks[name]
+        except KeyError:
+            sys.exit(f'unknown benchmark: {name!r}, try: {" ".join(benchmarks)}')
+        bench()
+        print()
@@ -33,6 +33,10 @@ actions = dict(
     progress            = 'console.progress',
 
     clear_lines         = 'console.utils',
+    _downgrade_pipe     = 'console.utils',  # hide
+    downgrade           = ['_downgrade_pipe'],  # alias
+    _filter_file        = 'console.utils',  # hide
+    filter              = ['_filter_file'],  # alias
     flash               = 'console.utils',
     get_clipboard       = 'console.utils',
     #~ len_stripped        = 'console.utils',
@@ -47,10 +47,9 @@ ANSI_RESET = CSI + '0m'
 
 # update several constants via terminfo, needs improvement
 if _using_terminfo:
-    from . import _curses
+    from .terminfo import get_capability as _get_capability
     def _get_val(name, default):  # walrus >= 3.8
-        value = _curses.tigetstr(name)
-        return value.decode('ascii') if value else default
+        return _get_capability(name) or default
 
     BEL = _get_val('bel', BEL)
     BS = _get_val('kbs', BS)
@@ -10,7 +10,7 @@
 '''
 import sys
 import logging
-import re
+from collections import OrderedDict, namedtuple
 
 from . import term_level as _term_level
 from .constants import (CSI, ANSI_BG_LO_BASE, ANSI_FG_LO_BASE, ANSI_RESET,
@@ -18,8 +18,8 @@ from .constants import (CSI, ANSI_BG_LO_BASE, ANSI_FG_LO_BASE, ANSI_RESET,
 from .disabled import empty_bin, empty
 from .detection import is_fbterm, color_sep
 from .meta import defaults
-from .proximity import (color_table4, find_nearest_color_hexstr,
-                        find_nearest_color_index)
+from .proximity import (color_table4, distance_methods,
+                        find_nearest_color_hexstr, find_nearest_color_index)
 
 try:
     import webcolors
@@ -28,7 +28,10 @@ except ImportError:
 
 
 log = logging.getLogger(__name__)
-MAX_NL_SEARCH = defaults.MAX_NL_SEARCH
+MAX_NL_SEARCH = defaults.MAX_NL_SEARCH  # deprecated, unused
+STREAM_CHUNK_SIZE = defaults.STREAM_CHUNK_SIZE
+MAX_COMPOSITES = defaults.PALETTE_CACHE_SIZE
+_composites = {}  # rendered style additions, e.g.: fx.dim + fg.green
 _string_plus_call_warning_template = '''
 
     Ambiguous and/or inefficient addition operation used:
@@ -42,14 +45,13 @@ _string_plus_call_warning_template = '''
         pal.style2(msg, pal.style1)     # via "mixins"
 '''
 
-# Palette attribute name finders.  Now we've got two problems.
-# Not a huge fan of regex but they nicely enforce the attribute naming rules:
-_hd = '[0-9A-Fa-f]'  # hex digits
-_index_finder = re.compile(r'^i_?\d{1,3}$', re.A)                   # i_DDD
-_nearest_finder = re.compile(f'^n_?{_hd}{{3}}$', re.A)              # n_HHH
-_true_finder = re.compile(f'^t_?({_hd}{{3}}|{_hd}{{6}})$', re.A)    # t_HHH+
-_x11_finder = re.compile(r'^x_\w{4,64}$', re.A)                     # x_NAME
-_web_finder = re.compile(r'^w_\w{4,64}$', re.A)                     # w_NAME
+# Palette attribute name characters, for prefix dispatch:
+_digits = '0123456789'
+_hex_digits = '0123456789ABCDEFabcdef'
+_word_chars = 'ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz_' + _digits
+_web_color_map = {}         # webcolors name to rgb, built on first use
+_color_name_index = {}      # bare names, X11 and web, built on first use
+_CacheInfo = namedtuple('CacheInfo', 'hits misses maxsize currsize')
 
 
 class _BasicPaletteBuilder:
@@ -61,7 +63,7 @@ class _BasicPaletteBuilder:
 
         Used for the basic 8/16 color and fx palettes.
     '''
-    def __new__(cls, color_sep=None, level=Ellipsis):
+    def __new__(cls, color_sep=None, level=Ellipsis, **kwargs):
         ''' Override new() to replace the class entirely on deactivation.
 
             Arguments:
@@ -122,14 +124,123 @@ class _HighColorPaletteBuilder(_BasicPaletteBuilder):
         Unlike the Basic palette builder, this one computes attributes on the
         fly.
     '''
-    def __init__(self, downgrade_method='euclid', **kwargs):
+    def __init__(self, downgrade_method='euclid',
+                 cache_size=defaults.PALETTE_CACHE_SIZE, **kwargs):
+        ''' Arguments:
+                downgrade_method    - Name of the distance method used to
+                                      find the nearest color on downgrade,
+                                      see proximity.distance_methods.
+                cache_size          - Max number of computed entries to
+                                      keep, least recently used are evicted.
+                                      None for unbounded.
+        '''
         super().__init__(**kwargs)
+        if downgrade_method not in distance_methods:
+            raise ValueError(f'downgrade_method: {downgrade_method!r} '
+                             'was unrecognized.')
         self._dg_method = downgrade_method
+        self._cache = OrderedDict()
+        self._cache_size = cache_size
+        self._cache_hits = self._cache_misses = 0
+        self._unknown = {}  # negative cache, name: error message
+        self._index_table = [None] * 256  # entries by index, built on use
 
     def __getattr__(self, name):
-        ''' Traffic cop - called only when an attribute is missing,
-            i.e. once per palette entry attribute.  The "basic" palette
-            attributes will never get here, as they are already defined.
+        ''' Called only when an attribute is missing, i.e. for computed
+            entries.  The "basic" palette attributes will never get here,
+            as they are already defined, and therefore are never evicted.
+
+            Computed entries are kept in a bounded cache,
+            the least recently used are dropped first.
+        '''
+        if name.startswith('_'):  # not a color, e.g. during copy/pickle
+            raise AttributeError(name)
+
+        cache = self._cache
+        entry = cache.get(name)
+        if entry is None:
+            unknown = self._unknown
+            if name in unknown:  # fail fast
+                raise AttributeError(unknown[name])
+            self._cache_misses += 1
+            try:
+                entry = self._get_palette_entry(name)
+            except AttributeError as err:
+                if self._cache_size is not None and (
+                   len(unknown) >= self._cache_size):
+                    del unknown[next(iter(unknown))]  # oldest
+                unknown[name] = str(err)
+                raise
+            self._cache_put(name, entry)
+        else:
+            self._cache_hits += 1
+            cache.move_to_end(name)
+        return entry
+
+    def __getitem__(self, index):
+        ''' Returns an indexed entry by integer, e.g. fg[196] is fg.i196,
+            from a table rendered for the level of this palette.
+        '''
+        if not 0 <= index <= 255:
+            raise IndexError(f'palette index out of range: {index!r}')
+        entry = self._index_table[index]
+        if entry is None:
+            entry = self._index_table[index] = (
+                self._get_extended_palette_entry(f'i{index}', str(index)))
+        return entry
+
+    def rgb(self, red, green, blue):
+        ''' Returns a direct color entry from three ints, 0-255, e.g.:
+
+                fg.rgb(187, 0, 187)     # same as fg.t_bb00bb
+        '''
+        for value in (red, green, blue):
+            if not 0 <= value <= 255:
+                raise ValueError(f'color value out of range: {value!r}')
+        return self._get_packed_entry((red << 16) | (green << 8) | blue)
+
+    def hex(self, value):
+        ''' Returns a direct color entry from a packed int or hex string:
+
+                fg.hex(0xbb00bb)        # same as fg.t_bb00bb
+                fg.hex('#bb00bb')
+                fg.hex('b0b')
+        '''
+        if type(value) is str:
+            digits = value[1:] if value.startswith('#') else value
+            if len(digits) == 3:
+                digits = ''.join(ch + ch for ch in digits)
+            if len(digits) != 6 or digits.strip(_hex_digits):
+                raise ValueError(f'hex color not valid: {value!r}')
+            value = int(digits, 16)
+        elif not 0 <= value <= 0xFFFFFF:
+            raise ValueError(f'hex color out of range: {value!r}')
+        return self._get_packed_entry(value)
+
+    def _get_packed_entry(self, packed):
+        ''' Direct color entries are cached by their 24-bit int. '''
+        cache = self._cache
+        entry = cache.get(packed)
+        if entry is None:
+            self._cache_misses += 1
+            rgb = (packed >> 16, packed >> 8 & 255, packed & 255)
+            entry = self._get_direct_palette_entry(f't_{packed:06x}', rgb)
+            self._cache_put(packed, entry)
+        else:
+            self._cache_hits += 1
+            cache.move_to_end(packed)
+        return entry
+
+    def _cache_put(self, key, entry):
+        ''' Add a computed entry to the cache, evicting the oldest. '''
+        cache = self._cache
+        cache[key] = entry
+        if self._cache_size is not None and len(cache) > self._cache_size:
+            cache.popitem(last=False)
+
+    def _get_palette_entry(self, name):
+        ''' Traffic cop - called once per palette entry attribute,
+            while it remains in the cache.
 
             Data flow: look up the name by its prefix (or not), then convert to
             a RGB three-tuple, for optional calculation and output.
@@ -162,44 +273,39 @@ class _HighColorPaletteBuilder(_BasicPaletteBuilder):
             Final Output:
                 - wrap in _PaletteEntry(output)
         '''
-        key = name[1:].lstrip('_')  # rm prefix from key
-        result = None
+        prefix = name[:1]
+        key = name[2:] if name[1:2] == '_' else name[1:]  # rm prefix from key
 
         # follow the yellow brick road…
-        if _index_finder.match(name):       # Indexed aka Extended
-            result = self._get_extended_palette_entry(name, key)
-
-        elif _nearest_finder.match(name):   # Nearest index
-            result = self._get_extended_palette_entry(name, key, is_hex=True)
-
-        elif _true_finder.match(name):      # Direct color
-            result = self._get_direct_palette_entry(name, key)
-
-        elif _x11_finder.match(name):       # X11, forced via prefix
-            result = self._get_X11_palette_entry(key)
-
-        elif _web_finder.match(name):       # Webcolors, forced via prefix
-            result = self._get_web_palette_entry(key)
-
-        else:  # look for bare names (without prefix)
-            if webcolors:
-                try:
-                    return self._get_web_palette_entry(name)
-                except AttributeError:
-                    pass  # nope, didn't find…
-
-            try:  # try X11
-                result = self._get_X11_palette_entry(name)
-                if result:
-                    return result
-            except AttributeError:
-                pass  # nada
-
-            # Emerald city
-            cname = self.__class__.__name__
-            raise AttributeError(f'{cname} - {name!r} is not a recognized '
-                                 'color name or format.')
-        return result
+        if prefix == 'i':                   # Indexed aka Extended: i_DDD
+            if 0 < len(key) < 4 and not key.strip(_digits):
+                return self._get_extended_palette_entry(name, key)
+
+        elif prefix == 'n':                 # Nearest index: n_HHH
+            if len(key) == 3 and not key.strip(_hex_digits):
+                return self._get_extended_palette_entry(name, key,
+                                                        is_hex=True)
+
+        elif prefix == 't':                 # Direct color: t_HHH+
+            if len(key) in (3, 6) and not key.strip(_hex_digits):
+                return self._get_direct_palette_entry(name, key)
+
+        elif prefix in 'xw' and name[1:2] == '_':   # forced via prefix
+            if 3 < len(key) < 65 and not key.strip(_word_chars):
+                if prefix == 'x':           # X11: x_NAME
+                    return self._get_X11_palette_entry(key)
+                else:                       # Webcolors: w_NAME
+                    return self._get_web_palette_entry(key)
+
+        # look for bare names (without prefix), webcolors first, then X11
+        color = _get_color_name_index().get(name.lower())
+        if color:
+            return self._get_direct_palette_entry(name, color)
+
+        # Emerald city
+        cname = self.__class__.__name__
+        raise AttributeError(f'{cname} - {name!r} is not a recognized '
+                             'color name or format.')
 
     def _get_extended_palette_entry(self, name, index, is_hex=False):
         ''' Compute extended entry. '''
@@ -293,18 +399,17 @@ class _HighColorPaletteBuilder(_BasicPaletteBuilder):
 
     def _get_web_palette_entry(self, name):
         ''' Look up colors from webcolors module. '''
-        result = None
-        try:  # wc: returns tuple of "decimal" int: (1, 2, 3)
-            color = webcolors.name_to_rgb(name)
-            result = self._get_direct_palette_entry(name, color)
-        except (ValueError, AttributeError):  # convert to AttributeError
+        _get_color_name_index()
+        try:  # wc: tuple of "decimal" int: (1, 2, 3)
+            color = _web_color_map[name.lower()]
+        except KeyError:  # convert to AttributeError
             raise AttributeError(
                 f'{name!r} not found in webcolors palette.')
-        return result
+        return self._get_direct_palette_entry(name, color)
 
     def _create_entry(self, name, values):
         ''' Render first values as string and place as first code,
-            save, and return attr.
+            and return attr.
         '''
         if is_fbterm:
             str_values = ';'.join(values)  # always semi-colon
@@ -312,7 +417,6 @@ class _HighColorPaletteBuilder(_BasicPaletteBuilder):
         else:
             str_values = self._color_sep.join(values)
             attr = _PaletteEntry(self, name.upper(), str_values)
-        setattr(self, name, attr)  # now cached
         return attr
 
     def _index_to_ansi_values(self, index):
@@ -335,37 +439,103 @@ class _HighColorPaletteBuilder(_BasicPaletteBuilder):
                 index += 92                     # (ANSI_BG_HI_BASE - 8)
         return [str(index)]
 
+    def _cache_info(self):
+        ''' Returns statistics of the computed entry cache, a la lru_cache. '''
+        return _CacheInfo(self._cache_hits, self._cache_misses,
+                          self._cache_size, len(self._cache))
+
     def _clear(self):
         ''' "Cleanse the palette" to free memory.
-            Useful for direct color, perhaps.
+            Drops computed entries and statistics, basic entries remain.
         '''
-        self.__dict__.clear()
+        self._cache.clear()
+        self._unknown.clear()
+        self._index_table[:] = [None] * 256
+        self._cache_hits = self._cache_misses = 0
+
+
+def _get_color_name_index():
+    ''' Returns the index of bare color names to rgb tuples, X11 overridden
+        by webcolors as it is searched first.  Built once, on first use.
+    '''
+    if not _color_name_index:
+        from .color_tables_x11 import x11_color_map
+        if webcolors:
+            try:
+                names = webcolors.names('css3')
+            except AttributeError:  # older versions
+                names = webcolors.CSS3_NAMES_TO_HEX
+            for name in names:
+                _web_color_map[name] = tuple(webcolors.name_to_rgb(name))
+
+        _color_name_index.update(x11_color_map)
+        _color_name_index.update(_web_color_map)
+    return _color_name_index
 
 
 class _LineWriter(object):
     ''' Writes each line with escape sequences terminated so paging works
         correctly, a la Pygments.
+
+        Arguments:
+            start           Opening sequence, e.g. a palette entry.
+            stream          Underlying stream to write to.
+            default         Closing sequence.
+            flush_threshold Characters to buffer before writing through.
+                            Zero writes once per call, an integer buffers
+                            output across calls until exceeded or flushed.
+
+        Counters of write calls issued and characters written to the
+        underlying stream are kept in write_count and bytes_written.
     '''
-    def __init__(self, start, stream, default):
+    flush_threshold = defaults.LINE_FLUSH_THRESHOLD
+
+    def __init__(self, start, stream, default, flush_threshold=None):
         self.start = start
         self.stream = stream
         self.default = default
+        if flush_threshold is not None:
+            self.flush_threshold = flush_threshold
+        self.bytes_written = 0
+        self.write_count = 0
+        self._buffer = []
+        self._buffered = 0
 
     def write(self, data):
-        ''' This could be a bit less clumsy. '''
-        if data == '\n':  # print does this
-            return self.stream.write(data)
+        ''' Styles each line of data, then writes them out in one go. '''
+        if not data:
+            return 0
+        elif data == '\n':  # print does this
+            styled = data
         else:
-            bytes_written = 0
-            for line in data.splitlines(True):  # keep ends: True
-                end = ''
+            start, default = str(self.start), self.default
+            lines = data.splitlines(True)  # keep ends: True
+            for i, line in enumerate(lines):
                 if line.endswith('\n'):  # mv nl to end:
-                    line = line[:-1]
-                    end = '\n'
-                bytes_written += self.stream.write(
-                                    f'{self.start}{line}{self.default}{end}'
-                                 ) or 0  # in case None returned (on Windows)
-            return bytes_written
+                    lines[i] = f'{start}{line[:-1]}{default}\n'
+                else:
+                    lines[i] = f'{start}{line}{default}'
+            styled = ''.join(lines)
+
+        self._buffer.append(styled)
+        self._buffered += len(styled)
+        if self._buffered > self.flush_threshold:
+            self._write_buffer()
+        return len(data)
+
+    def _write_buffer(self):
+        ''' Issue a single write of all pending output. '''
+        if self._buffer:
+            data = ''.join(self._buffer)
+            self._buffer.clear()
+            self._buffered = 0
+            self.write_count += 1
+            # in case None returned (on Windows)
+            self.bytes_written += self.stream.write(data) or 0
+
+    def flush(self):
+        self._write_buffer()
+        self.stream.flush()
 
     def __getattr__(self, attr):
          return getattr(self.stream, attr)
@@ -384,9 +554,14 @@ class _PaletteEntry:
         Arguments:
             parent  - Parent palette
             name    - Display name, used in demos.
-            code    - Associated ANSI code number.
+            code    - Associated ANSI code number.
             stream  - Stream to print to, when using a context manager.
+
+        Entries are numerous, so they are slotted and compact.
+        The escape sequence and its default are rendered once, on creation.
     '''
+    __slots__ = ('_parent', 'name', '_stream', '_sequence', 'default',
+                 '_orig_stdout', '_writer')
     _end_code = 'm'
 
     def __init__(self, parent, name, code, stream=sys.stdout):
@@ -397,18 +572,29 @@ class _PaletteEntry:
         # find initial code and default
         default = None
         if type(code) in (int, str):
-            self._codes = [str(code)]
+            pass
         elif type(code) is tuple:
-            self._codes = [str(code[0])]
-            default = f'{CSI}{code[1]}m'    # pre-render
+            code, default = code
+            default = f'{CSI}{default}m'    # pre-render
         else:
-            TypeError('code not valid: %r' % code)
+            raise TypeError('code not valid: %r' % code)
 
-        self.default = default or (parent.default if hasattr(parent, 'default')
-                                                  else parent.end)  # style
+        self._sequence = f'{CSI}{code}{self._end_code}'
+        if not default:
+            default = (parent.default if hasattr(parent, 'default')
+                                      else parent.end)  # style
+            if type(default) is int:        # the default entry itself
+                default = self._sequence
+        self.default = str(default)
 
     def __add__(self, other):
-        ''' Add: self + other '''
+        ''' Add: self + other
+
+            Note:
+                Only the composite sequence is interned, each addition
+                returns a new entry, as entries carry their own output
+                stream and context state.
+        '''
         if isinstance(other, str):
             if other.startswith(CSI) and other.endswith(self._end_code):
                 return self._handle_ambiguous_op(other)
@@ -419,15 +605,34 @@ class _PaletteEntry:
             return _CallableFBString(str(self) + str(other))
 
         elif isinstance(other, _PaletteEntry):
-            # Make a copy, so codes don't pile up after each addition
-            # Render initial values once as string and place as first code:
-            newcodes = self._codes + other._codes
-            new_entry = _PaletteEntry(self._parent, self.name,
-                                      ';'.join(newcodes))   # _not_ color_sep
-                                                            # different type
-            if not self.default == other.default:   # not in same class,
-                new_entry.default = ANSI_RESET      # switch to full reset
+            # composite sequences are interned, rather than entries,
+            # which may be redirected by set_output or used as a context
+            key = (self._sequence, other._sequence)
+            sequence = _composites.get(key)
+            if sequence is None:
+                # Render initial values once as string, place as first code:
+                sequence = f'{CSI}{self._codes};{other._codes}m'
+                                                    # ^ _not_ color_sep
+                                                    #   different type
+                if len(_composites) >= MAX_COMPOSITES:  # drop the oldest
+                    # tolerant of other threads dropping it first:
+                    _composites.pop(next(iter(_composites), None), None)
+                _composites[key] = sequence
+
+            if self.default == other.default:       # same class, its default
+                parent = self._parent
+                default = str(parent.default if hasattr(parent, 'default')
+                                             else parent.end)  # style
+            else:                                   # not in same class,
+                default = ANSI_RESET                # switch to full reset
 
+            # Make a copy, so codes don't pile up after each addition
+            new_entry = _PaletteEntry.__new__(_PaletteEntry)
+            new_entry._parent = self._parent
+            new_entry.name = self.name
+            new_entry._stream = self._stream
+            new_entry._sequence = sequence
+            new_entry.default = default
             return new_entry
         else:
             raise TypeError(f'Addition to type {type(other)} not supported.')
@@ -437,23 +642,28 @@ class _PaletteEntry:
         return other + str(self)
 
     def __bool__(self):
-        return bool(self._codes)
+        return bool(self._sequence)
 
     def __enter__(self):
         ''' Wrap output streams. '''
         log.debug(repr(str(self)))
         # wrap originals
         self._orig_stdout = sys.stdout
-        sys.stdout = _LineWriter(self, self._stream, self.default)
+        sys.stdout = self._writer = _LineWriter(self, self._stream,
+                                                self.default)
         return sys.stdout
 
     def __exit__(self, type, value, traceback):
-        sys.stdout = sys.stdout.stream
+        writer = self._writer  # stdout may have been reassigned since
+        writer._write_buffer()
+        if sys.stdout is writer:
+            sys.stdout = writer.stream
         log.debug(repr(str(self.default)))
         self._stream.write(str(self.default))  # just in case
 
     def __call__(self, text, *styles, save_length=False):
-        ''' Formats text.  Not appropriate for *huge* input strings.
+        ''' Formats text.  Not appropriate for *huge* input strings,
+            see stream() instead.
 
             Arguments:
                 text                Original text.
@@ -478,22 +688,67 @@ class _PaletteEntry:
             self += attr
 
         # add and end styles per line, to facilitate paging:
-        pos = text.find('\n', 0, MAX_NL_SEARCH)  # if '\n' in text, w/limit
-        if pos == -1:  # not found
+        if '\n' not in text:
             result = f'{self}{text}{self.default}'
         else:
-            lines = text.splitlines()
-            for i, line in enumerate(lines):
-                lines[i] = f'{self}{line}{self.default}'  # add styles, see tip
-            result = '\n'.join(lines)
+            result = (f'{self}'
+                      + f'{self.default}\n{self}'.join(text.splitlines())
+                      + self.default)
 
         if save_length:
             return _LengthyString(len(text), result)
         else:
             return result
 
+    def stream(self, source, *styles, file=None,
+               chunk_size=STREAM_CHUNK_SIZE):
+        ''' Formats text incrementally, for huge inputs such as logs.
+            Memory use is bounded by the chunk size,
+            rather than the size of the input.
+
+            Arguments:
+                source              An iterable of strings, e.g. a list of
+                                    chunks or lines, or a file object
+                                    opened in text mode.
+                *styles             Add "mix-in" styles, per invocation.
+                file                If given, write output to this stream
+                                    rather than yielding it.
+                chunk_size          Characters to read at a time from files.
+
+            Returns:
+                A generator of styled strings, one per chunk.
+                Or, the count of characters written if file was given.
+
+            Note:
+                Unlike the call form, lines are split at newlines only,
+                and they are kept, trailing one included.
+        '''
+        if (self._parent.__class__.__name__ == 'EffectsTerminator' or
+            self.name in ('DEFAULT', 'END')):
+            raise NotImplementedError("stream form undefined for "
+                                      "EffectsTerminator or 'default'.")
+        for attr in styles:
+            self += attr
+
+        if hasattr(source, 'read'):
+            source = _read_text(source, chunk_size)
+
+        chunks = _stream_lines(source, str(self), self.default)
+        if file is None:
+            return chunks
+
+        written = 0
+        for chunk in chunks:
+            written += file.write(chunk) or 0  # None returned on Windows
+        return written
+
     def __str__(self):
-        return f'{CSI}{";".join(self._codes)}m'  # not color_sep, styles also
+        return self._sequence
+
+    @property
+    def _codes(self):
+        ''' The codes of the sequence, joined by semi-colons. '''
+        return self._sequence[2:-1]         # strip CSI and end code
 
     def __repr__(self):
         return repr(self.__str__())
@@ -516,15 +771,12 @@ class _PaletteEntry:
             lines = other.splitlines()
             for i, line in enumerate(lines):
                 tokens = [CSI]
-                tokens.append(';'.join(self._codes))            # if multiple
+                tokens.append(self._codes)                      # if multiple
                 tokens.append(';')
                 tokens.append(CSI.join(line.split(CSI)[1:-1]))  # if multiple
 
-                # figure end code:
-                try:
-                    end_code = self.default._codes[0]
-                except AttributeError:  # already rendered
-                    end_code = self.default.strip('\x1b[m')
+                # figure end code, default is pre-rendered:
+                end_code = self.default[2:-1]
 
                 if end_code == other[-3:-1]:    # same category
                     tokens.append(str(self.default))
@@ -556,16 +808,18 @@ class _PaletteEntry:
             Note:
                 This function is experimental and may not survive.
         '''
-        if self._orig_stdout:  # restore Usted
+        if getattr(self, '_orig_stdout', None):  # restore Usted
             sys.stdout = self._orig_stdout
 
         self._stream = outfile
-        sys.stdout = _LineWriter(self, self._stream, self.default)
+        sys.stdout = self._writer = _LineWriter(self, self._stream,
+                                                self.default)
 
 
 class _PaletteEntryFBTerm(_PaletteEntry):
     ''' Help fbterm show 256 colors. '''
-    _end_code = '}'
+    __slots__ = ()
+    _end_code = '}'                 # note '}' at end not std 'm'
 
     def __add__(self, other):
         ''' Add: self + other '''
@@ -575,9 +829,6 @@ class _PaletteEntryFBTerm(_PaletteEntry):
         else:
             return super().__add__(other)
 
-    def __str__(self):  # outer sep, not color_sep
-        return f'{CSI}{";".join(self._codes)}}}'  # note '}' at end not std 'm'
-
 
 class _CallableFBString(str):
     ''' String that is callable, only needed in the very specific instance of
@@ -589,17 +840,51 @@ class _CallableFBString(str):
             return ''
 
         # add and end styles per line, to facilitate paging:
-        pos = text.find('\n', 0, MAX_NL_SEARCH)  # if '\n' in text, w/limit
-        if pos == -1:  # not found
+        if '\n' not in text:
             result = f'{self}{text}{ANSI_RESET}'
         else:
-            lines = text.splitlines()
-            for i, line in enumerate(lines):
-                lines[i] = f'{self}{line}{ANSI_RESET}'  # add styles, see tip
-            result = '\n'.join(lines)
+            result = (f'{self}'
+                      + f'{ANSI_RESET}\n{self}'.join(text.splitlines())
+                      + ANSI_RESET)
         return result
 
 
+def _read_text(infile, size):
+    ''' Read a text file in chunks, until the end.
+        Binary files are refused, as bytes can't be styled.
+    '''
+    while True:
+        chunk = infile.read(size)
+        if not chunk:
+            break
+        if not isinstance(chunk, str):
+            raise TypeError('stream source must be opened in text mode, '
+                            f'read returned {type(chunk).__name__}')
+        yield chunk
+
+
+def _stream_lines(chunks, start, end):
+    ''' Wrap each line of a stream of text chunks with start and end codes,
+        lines may span chunks.  Yields one string per non-empty chunk.
+    '''
+    line_end = f'{end}\n{start}'
+    in_line = False                             # whether start was emitted
+    for chunk in chunks:
+        if not chunk:
+            continue
+        if not in_line:
+            chunk = start + chunk
+        if chunk.endswith('\n'):                # stop at the last one
+            yield chunk[:-1].replace('\n', line_end) + end + '\n'
+            in_line = False
+        else:
+            yield chunk.replace('\n', line_end)
+            in_line = True
+
+    if in_line:
+        yield end
+
+
 class _LengthyString(str):
     ''' String that saves and returns the length of its bare string, before
         escape sequences were added.
@@ -0,0 +1,169 @@
+# -*- coding: future_fstrings -*-
+'''
+    .. console - Comprehensive utility library for ANSI terminals.
+    .. © 2018, Mike Miller - Released under the LGPL, version 3+.
+
+    A cursor motion planner, that tracks the position of the cursor and
+    finds the fewest bytes to move it, rather than a full ``move_to``
+    every time::
+
+        from console.cursor import CursorPlanner
+
+        cursor = CursorPlanner()
+        print(cursor.move_to(0, 5), 'Hello', sep='', end='')
+        cursor.advance('Hello')
+        print(cursor.move_to(0, 6), 'World', sep='', end='')   # '\\r\\x1b[B'
+
+    Moves are composed of a vertical part, one of cuu, cud, cnl, cpl, vpa,
+    and a horizontal part, one of CR, BS, cub, cuf, hpa, compared with cup.
+    Capabilities the screen lacks, e.g. cnl under terminfo, are skipped.
+    Line feeds are not used, as they may scroll or be translated.
+'''
+import logging
+
+from .constants import CR, CSI
+from .screen import Screen, _TemplateString
+from .utils import display_width
+
+
+log = logging.getLogger(__name__)
+MAX_MOVE_CACHE = 4096
+_BS = '\b'                          # constants.BS may be kbs, a key
+_MAX_BACKSPACES = 3                 # beyond, cub is shorter
+
+
+class CursorPlanner:
+    ''' Tracks the cursor and plans the shortest moves to a location.
+
+        Arguments:
+            screen:     Screen or ScreenTermInfo - to render sequences with,
+                        defaults to one forced on.
+            x, y:       int - 0-based location of the cursor,
+                        None when unknown, the first move is absolute.
+            width:      int - of the terminal, to notice a pending wrap.
+
+        Attributes:
+            bytes_planned:  int - bytes of the moves returned.
+            bytes_absolute: int - bytes as cup moves, for comparison.
+
+        Coordinates are given in standard (x, y) order,
+        whichever order the screen uses.
+    '''
+    def __init__(self, screen=None, x=None, y=None, width=None):
+        self._screen = screen or Screen(force=True)
+        self._cache = {}                        # (name, arg): sequence
+        self.width = width
+        self.bytes_planned = self.bytes_absolute = 0
+        self.set_position(x, y)
+
+    def set_position(self, x, y):
+        ''' Tell where the cursor is, None when unknown. '''
+        if x is None or y is None:
+            self.x = self.y = None
+        else:
+            self.x, self.y = x, y
+
+    def invalidate(self):
+        ''' Forget where the cursor is, e.g. after other output. '''
+        self.x = self.y = None
+
+    def advance(self, text):
+        ''' Move the tracked position past printed text,
+            a str without newlines, or a count of columns.
+        '''
+        if self.x is None:
+            return
+        columns = text if type(text) is int else display_width(text)
+        self.x += columns
+        if self.width is not None and self.x >= self.width:
+            self.invalidate()                   # wrap pending, don't rely
+
+    def _render(self, name, arg):
+        ''' Render a capability once, None when unavailable. '''
+        key = (name, arg)
+        try:
+            return self._cache[key]
+        except KeyError:
+            pass
+        template = getattr(self._screen, name, None)
+        if not template:
+            sequence = None
+        elif type(template) is _TemplateString:  # ANSI, 1-based
+            if name in ('hpa', 'vpa'):
+                arg += 1
+            if arg == 1:                            # the default, omit
+                sequence = CSI + template.endcode
+            else:
+                sequence = template(arg)
+        else:                                   # terminfo, offsets in caps
+            sequence = template(arg)
+        if len(self._cache) >= MAX_MOVE_CACHE:
+            self._cache.clear()
+        self._cache[key] = sequence
+        return sequence
+
+    def _get_vertical(self, y):
+        ''' Yield the ways to reach line y, as (sequence, column after). '''
+        x0, y0 = self.x, self.y
+        dy = y - y0
+        if not dy:
+            yield '', x0
+            return
+        if dy > 0:
+            candidates = (('cud', dy, x0), ('cnl', dy, 0), ('vpa', y, x0))
+        else:
+            candidates = (('cuu', -dy, x0), ('cpl', -dy, 0), ('vpa', y, x0))
+        for name, arg, column in candidates:
+            sequence = self._render(name, arg)
+            if sequence:
+                yield sequence, column
+
+    def _get_horizontal(self, x0, x):
+        ''' Returns the shortest way from column x0 to x. '''
+        dx = x - x0
+        if not dx:
+            return ''
+        if not x:
+            return CR
+        candidates = []
+        if dx > 0:
+            candidates.append(self._render('cuf', dx))
+        else:
+            if -dx <= _MAX_BACKSPACES:
+                candidates.append(_BS * -dx)
+            candidates.append(self._render('cub', -dx))
+        candidates.append(self._render('hpa', x))
+        cuf = self._render('cuf', x)
+        candidates.append(cuf and CR + cuf)
+        return min((seq for seq in candidates if seq), key=len, default=None)
+
+    def _render_cup(self, x, y):
+        ''' Render an absolute move, in standard order. '''
+        template = self._screen.move_to
+        if type(template) is _TemplateString and not x:  # omit col 1
+            return f'{CSI}{y + 1 if y else ""}H'
+        return template(x, y) if template._swap else template(y, x)
+
+    def move_to(self, x, y):
+        ''' Returns the shortest sequence to move the cursor to x, y,
+            which becomes the tracked position.
+        '''
+        absolute = best = self._render_cup(x, y)
+        if (x, y) == (self.x, self.y):
+            best = ''
+        elif self.x is not None:
+            for vertical, column in self._get_vertical(y):
+                horizontal = self._get_horizontal(column, x)
+                if horizontal is not None:
+                    sequence = vertical + horizontal
+                    if len(sequence) < len(best):
+                        best = sequence
+
+        self.x, self.y = x, y
+        self.bytes_planned += len(best)
+        self.bytes_absolute += len(absolute)
+        return best
+
+    def __repr__(self):
+        return (f'{self.__class__.__name__}(x={self.x}, y={self.y}, '
+                f'bytes={self.bytes_planned}/{self.bytes_absolute})')
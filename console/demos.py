@@ -13,7 +13,7 @@ def build_demos(caption, obj, extra_style=''):
     '''
     items = []
     for name in dir(obj):
-        if not name.startswith('_') and not name == 'clear':  # types !work
+        if not name.startswith('_') and name not in ('hex', 'rgb'):  # methods
             attr = getattr(obj, name)
             if extra_style:
                 items.append(f'{attr + extra_style}{attr.name}{fx.end}')
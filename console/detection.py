@@ -265,16 +265,18 @@ def detect_terminal_level_terminfo():
     level = TermLevel.DUMB
     _color_sep = None
     try:
-        from . import _curses
+        from .terminfo import get_capability
 
-        has_underline = _curses.tigetstr('smul')
+        has_underline = get_capability('smul')
         if has_underline:   # This first test could be more granular,
                             # but it is so rare today we won't bother:
-            if has_underline.startswith(bytes(CSI, 'ascii')):
+            if has_underline.startswith(CSI):
                 level = TermLevel.ANSI_MONOCHROME
 
-            num_colors = _curses.tigetnum('colors')
-            log.debug('tigetnum("colors") = %s', num_colors)
+            num_colors = get_capability('colors')
+            log.debug('terminfo colors = %s', num_colors)
+            if num_colors is None:
+                num_colors = -1
             # -1 means not set, leaving level unchanged from above.
             if -1 < num_colors < 50:
                 level = TermLevel.ANSI_BASIC
@@ -290,8 +292,8 @@ def detect_terminal_level_terminfo():
 
             # finding color_sep is a bit problematic
             if level >= TermLevel.ANSI_EXTENDED:
-                setaf = (_curses.tigetstr('setaf') or b'').decode('ascii')
-                # log.debug('tigetstr setaf: %r', setaf)
+                setaf = get_capability('setaf') or ''
+                # log.debug('terminfo setaf: %r', setaf)
                 suffix = setaf.partition('38')[2]
                 if suffix:
                     _color_sep = suffix[0]  # first char after 38
@@ -645,6 +647,46 @@ def get_color(name, number=None, timeout=defaults.READ_TIMEOUT):
     return color
 
 
+def get_mode(number, timeout=defaults.READ_TIMEOUT):
+    ''' Query the state of a DEC private mode, via DECRQM.
+
+        Arguments:
+            number: int, the mode, e.g. 2026 for synchronized output.
+            timeout: float secs, how long to wait for a response.
+
+        - `Control sequences
+          <https://invisible-island.net/xterm/ctlseqs/ctlseqs.html#h4-Functions-using-CSI-_-ordered-by-the-final-character-lparen-s-rparen:CSI-?-Ps-$-p.1F4B>`_
+
+        Returns:
+            int:  0 - not recognized, 1 - set, 2 - reset,
+                  3 - permanently set, 4 - permanently reset,
+            or None if the terminal did not respond.
+
+        Note:
+            Query blocks until timeout if terminal does not support DECRQM.
+    '''
+    value, resp = None, ''
+    try:
+        with TermStack() as fd:
+            termios.tcflush(fd, termios.TCIFLUSH)   # clear input
+            tty.setcbreak(fd, termios.TCSANOW)      # shut off echo
+            sys.stdout.write(f'{CSI}?{number}$p')
+            sys.stdout.flush()
+            log.debug('about to read get_mode response…')
+            resp = _read_until_select(max_bytes=16, end='y', timeout=timeout)
+    except (AttributeError, EnvironmentError):  # no .fileno(), or Windows
+        return value
+
+    # parse response: CSI ? number ; value $
+    try:
+        value = int(resp.rstrip('$').partition(';')[2])
+    except ValueError as err:
+        log.debug('parse error: %s on %r', err, resp)
+
+    log.debug('mode %s: %r', number, value)
+    return value
+
+
 def get_position(fallback=defaults.CURSOR_POS_FALLBACK):
     ''' Return the current column number of the terminal cursor.
         Used to figure out if we need to print an extra newline.
@@ -57,6 +57,14 @@ class _EmptyBin:
         setattr(self, name, attr)   # ready next time
         return attr
 
+    def __getitem__(self, index):
+        return self.an_empty
+
+    def rgb(self, *args):
+        return self.an_empty
+
+    hex = rgb
+
     def __enter__(self):
         return self
 
@@ -0,0 +1,273 @@
+# -*- coding: future_fstrings -*-
+'''
+    .. console - Comprehensive utility library for ANSI terminals.
+    .. © 2018, Mike Miller - Released under the LGPL, version 3+.
+
+    A double-buffered frame of character cells, for full-screen programs.
+
+    Draw into the frame, then flush it.  Only cells that changed since the
+    last frame are written, with the cheapest cursor moves and
+    SGR transitions found, which avoids flicker and is friendly to slow
+    connections such as SSH::
+
+        from console.framebuffer import FrameBuffer
+
+        with sc.fullscreen():
+            frame = FrameBuffer()
+            frame.put(0, 0, 'Hello World', fg.green)
+            frame.flush()                       # returns the byte count
+
+    Cells hold a character and a style id.
+    The frame assumes it alone writes to the screen;
+    after other output, call invalidate() to redraw fully on the next flush.
+'''
+import logging
+import sys
+
+from .constants import CSI
+from .cursor import CursorPlanner
+from .detection import get_size
+from .screen import Screen
+from .sgr import parse_sgr, transition
+from .utils import _iter_char_widths
+
+
+log = logging.getLogger(__name__)
+_erasable_slots = ('bg',)       # styles that erase (ECH, EL) can reproduce
+_unknown_state = (('?', '?'),)  # transitions from it begin with a reset
+_MAX_GAP_BYTES = 3              # rewrite unchanged cells up to, not move
+# unparameterized under terminfo, so fixed here:
+_clear_screen = CSI + '2J'
+_clear_line_end = CSI + 'K'
+
+
+class FrameBuffer:
+    ''' A grid of cells, and a copy of what is on screen, to diff them.
+
+        Arguments:
+            width, height:  int - size in cells, defaults to the terminal.
+            stream:         file - to write frames to.
+            screen:         Screen - to render sequences with,
+                            defaults to one forced on.
+
+        Attributes:
+            frame_count:    int - frames flushed.
+            frame_bytes:    int - bytes written by the last frame.
+            bytes_written:  int - in total.
+    '''
+    def __init__(self, width=None, height=None, stream=sys.stdout,
+                 screen=None):
+        if width is None or height is None:
+            size = get_size()
+            width = width or size.columns
+            height = height or size.lines
+        self._stream = stream
+        self._screen = screen or Screen(force=True)
+        self._cursor = CursorPlanner(self._screen)
+        self._style_ids = {None: 0}             # style: id
+        self._style_states = [()]               # by id
+        self.frame_count = self.frame_bytes = self.bytes_written = 0
+        self.resize(width, height)
+
+    def resize(self, width, height):
+        ''' Change the size of the frame, clearing it. '''
+        self.width = width
+        self.height = height
+        self._chars = [[' '] * width for _ in range(height)]
+        self._styles = [[0] * width for _ in range(height)]
+        self.invalidate()
+
+    def invalidate(self):
+        ''' Forget what is on screen, to clear & redraw on the next flush. '''
+        self._screen_chars = [[' '] * self.width for _ in range(self.height)]
+        self._screen_styles = [[0] * self.width for _ in range(self.height)]
+        self._dirty = set(range(self.height))
+        self._cursor.invalidate()
+        self._state = None                      # SGR state unknown
+        self._cleared = False
+
+    def style_id(self, style):
+        ''' Returns the id of a style, a palette entry or SGR string,
+            registering it the first time.
+        '''
+        key = str(style) if style else None
+        style_id = self._style_ids.get(key)
+        if style_id is None:
+            style_id = self._style_ids[key] = len(self._style_states)
+            self._style_states.append(parse_sgr(key))
+        return style_id
+
+    def put(self, x, y, text, style=None):
+        ''' Write plain text into the frame at the given cell,
+            clipped at the right edge.  Wide characters take two cells.
+
+            Arguments:
+                x, y:       int - 0-based column and line.
+                text:       str - without escape sequences or newlines.
+                style:      palette entry, SGR string, or style id.
+        '''
+        if not 0 <= y < self.height:
+            return
+        style_id = style if type(style) is int else self.style_id(style)
+        chars = self._chars[y]
+        styles = self._styles[y]
+        width = self.width
+        for char, char_width in _iter_char_widths(text):
+            if not char_width:                  # combining, joins the last
+                if 0 < x <= width:
+                    last = x - 1 if chars[x - 1] else x - 2
+                    chars[last] += char
+                continue
+            if x + char_width > width:
+                break
+            end = x + char_width
+            if end > 0:
+                if x > 0 and not chars[x]:      # overwrites half a wide char
+                    chars[x - 1] = ' '
+                if end < width and not chars[end]:
+                    chars[end] = ' '            # and the other half
+                if x < 0:                       # half off the left edge
+                    chars[0] = ' '
+                    styles[0] = style_id
+                else:
+                    chars[x] = char
+                    styles[x] = style_id
+                    if char_width == 2:
+                        chars[x + 1] = ''       # the right half
+                        styles[x + 1] = style_id
+            x = end
+        self._dirty.add(y)
+
+    def fill(self, x=0, y=0, width=None, height=None, char=' ', style=None):
+        ''' Fill a rectangle of the frame with a character, by default all
+            of it with spaces, i.e. clear it.
+        '''
+        width = self.width - x if width is None else width
+        height = self.height - y if height is None else height
+        text = char * width
+        style_id = self.style_id(style)
+        for line in range(max(y, 0), min(y + height, self.height)):
+            self.put(x, line, text, style_id)
+
+    def clear(self):
+        ''' Clear the frame. '''
+        self.fill()
+
+    def _move(self, x, y, output, screen):
+        ''' Append the shortest sequence moving the cursor to x, y. '''
+        sequence = self._cursor.move_to(x, y)
+        if sequence:
+            output.append(sequence)
+
+    def _set_style(self, style_id, output):
+        target = self._style_states[style_id]
+        if self._state is None:                 # unknown, reset
+            output.append(transition(_unknown_state, target))
+        elif target != self._state:
+            output.append(transition(self._state, target))
+        self._state = target
+
+    def _render_line(self, y, output, screen):
+        chars, styles = self._chars[y], self._styles[y]
+        old_chars, old_styles = self._screen_chars[y], self._screen_styles[y]
+        states = self._style_states
+        width = self.width
+        x = 0
+        while x < width:
+            if chars[x] == old_chars[x] and styles[x] == old_styles[x]:
+                x += 1
+                continue
+            if not chars[x]:                    # start at the left half
+                x -= 1
+
+            # a run of spaces in one erasable style, erase it:
+            style_id = styles[x]
+            end = x
+            while end < width and chars[end] == ' ' and styles[end] == style_id:
+                end += 1
+            count = end - x
+            if (count > 4 and all(slot in _erasable_slots
+                                  for slot, code in states[style_id])):
+                self._move(x, y, output, screen)
+                self._set_style(style_id, output)
+                if end == width:
+                    output.append(_clear_line_end)
+                else:
+                    output.append(screen.ech(count))
+                x = end
+                continue
+
+            self._move(x, y, output, screen)
+            start = x
+            while x < width and (x == start or not chars[x] or
+                                 chars[x] != old_chars[x] or
+                                 styles[x] != old_styles[x]):
+                if chars[x]:                    # not the right half
+                    self._set_style(styles[x], output)
+                    output.append(chars[x])
+                x += 1
+                if x < width and chars[x] == old_chars[x] and (
+                        styles[x] == old_styles[x]):
+                    gap = self._get_gap(y, x)
+                    output.extend(gap)          # cheaper than moving over
+                    x += len(gap)
+            if x < width:
+                self._cursor.set_position(x, y)
+            else:                               # pending wrap, don't rely
+                self._cursor.invalidate()
+
+    def _get_gap(self, y, x):
+        ''' Returns the unchanged cells from x up to the next change,
+            when rewriting them is cheaper than a cursor move.
+        '''
+        chars, styles = self._chars[y], self._styles[y]
+        old_chars, old_styles = self._screen_chars[y], self._screen_styles[y]
+        states = self._style_states
+        gap = []
+        size = 0
+        for end in range(x, self.width):
+            char = chars[end]
+            if char != old_chars[end] or styles[end] != old_styles[end]:
+                return gap                      # reached the next change
+            size += len(char.encode('utf8'))
+            if (size > _MAX_GAP_BYTES or states[styles[end]] != self._state or
+                not char or end + 1 < self.width and not chars[end + 1]):
+                break                           # costly, styled, or wide
+            gap.append(char)
+        return []
+
+    def flush(self):
+        ''' Write the changes since the last frame to the stream.
+
+            Returns: count of bytes written
+        '''
+        screen = self._screen
+        output = []
+        if not self._cleared:
+            output.append(transition(_unknown_state, ()))
+            output.append(_clear_screen)
+            self._state = ()
+            self._cleared = True
+
+        for y in sorted(self._dirty):
+            if (self._chars[y] != self._screen_chars[y] or
+                self._styles[y] != self._screen_styles[y]):
+                self._render_line(y, output, screen)
+                self._screen_chars[y] = self._chars[y][:]
+                self._screen_styles[y] = self._styles[y][:]
+        self._dirty.clear()
+
+        data = ''.join(output)
+        if data:
+            self._stream.write(data)
+            self._stream.flush()
+        count = len(data.encode('utf8'))
+        self.frame_count += 1
+        self.frame_bytes = count
+        self.bytes_written += count
+        log.debug('frame %s: %s bytes', self.frame_count, count)
+        return count
+
+    def __repr__(self):
+        return (f'{self.__class__.__name__}({self.width}x{self.height}, '
+                f'frames={self.frame_count}, bytes={self.bytes_written})')
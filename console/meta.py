@@ -54,10 +54,16 @@ trove_classifiers = [
 
 defaults = _Namespace(
     CURSOR_POS_FALLBACK = (0, 0),
+    FILE_CHUNK_SIZE = 4194304,  # bytes per worker task, when processing files
+    LINE_FLUSH_THRESHOLD = 0,  # chars buffered in style contexts, 0: none
     MAX_CLIPBOARD_SIZE = 65536,  # 64k by default
-    MAX_NL_SEARCH = 4096,
+    MAX_NL_SEARCH = 4096,  # deprecated, unused: newlines are found in full
+    MAX_OSC_LEN = 131072,  # payload chars when stripping, fits OSC 52
     MAX_URL_LEN = 2083,
     MAX_VAL_LEN = 250,
+    PALETTE_CACHE_SIZE = 4096,  # dynamic entries per palette, None: unbounded
     READ_TIMEOUT = .200,  # select read timeout in float seconds
+    STREAM_CHUNK_SIZE = 65536,  # chars read at a time when styling a file
     TERM_SIZE_FALLBACK = (80, 24),
+    WRITE_BATCH_SIZE = 65536,  # bytes buffered by utils.BatchWriter
 )
@@ -22,7 +22,7 @@ from . import fg, bg, fx, sc, term_level as _term_level
 from .constants import TermLevel
 from .detection import detect_unicode_support, get_size, os_name
 from .disabled import empty as _empty
-from .utils import len_stripped, notify_progress
+from .utils import display_width, notify_progress
 
 DEF_TOTAL = 99
 DEF_WIDTH = 32
@@ -291,7 +291,7 @@ class ProgressBar:
         _icons = self.icons
         if self.width < self._min_width:
             self.width = self._min_width
-        self.padding = len(_icons[_if]) + len(_icons[_il])  # bookends
+        self.padding = display_width(_icons[_if] + _icons[_il])  # bookends
         self._bwidth = self._set_bar_width()
         if self._clear_left is True:
             self.clear_left = self._clear_left  # render
@@ -364,7 +364,7 @@ class ProgressBar:
                 f'⇱ r:{self.ratio:5.3f} ncc:{self._num_complete_chars:2d} '
                 f'rm:{self._remainder!r} '
                 f'nec:{self._num_empty_chars:2d} '
-                f'l:{len_stripped(rendered.lstrip(chr(13)))}'  # '\r' aka CR
+                f'l:{display_width(rendered.lstrip(chr(13)))}'  # '\r' aka CR
             )
             self._cached_str = rendered = ''.join(pieces)  # again :-/
 
@@ -480,7 +480,7 @@ class ProgressBar:
         self._lbl = label
         # dynamic resizing of the bar, depending on label length:
         if label and label_mode != 'internal':
-            self._bwidth = self._bwidth_base - len(label_unstyled) # or label)
+            self._bwidth = self._bwidth_base - display_width(label_unstyled)
         else:
             self._bwidth = self._bwidth_base
 
@@ -23,14 +23,57 @@
 
     Note:
         An experiment was done using a more accurate CIELAB distance algorithm,
-        but the solution was quite heavy and therefore removed.
+        with third-party libraries, but the solution was quite heavy and
+        therefore removed.
+        Perceptual methods are now implemented here instead,
+        see ``distance_methods``.
+        The coordinates of the palette are computed once per color table,
+        and lookups narrowed by lookup tables as below,
+        or for ciede2000, which can't be bounded by a box, memoized.
+
+    Lookups against the active color tables are accelerated by quantized
+    lookup tables (LUTs).
+    The RGB cube is cut into cells and each cell records either the single
+    palette index that is nearest to every color inside it,
+    or a short list of candidates to check when it straddles a boundary.
+    Results are identical to a full scan of the table.
+
+    The tables of the other methods are finer, and their cells resolved on
+    first use, from bounds of the coordinates of each cell.
 '''
+import hashlib
+import logging
+import struct
+from array import array
+from bisect import bisect_left, bisect_right
+from math import atan2, cos, degrees, exp, hypot, radians, sin, sqrt
+from os.path import join
+
 from . import color_tables
 
 
 color_table4 = []   # 16 colors
 color_table8 = []   # 265 colors
 
+BATCH_SIZE = 4096   # rows per chunk in vectorized lookups, bounds memory use
+LUT_BITS = 4        # bits per channel of the quantized lookup tables
+_LUT_SHIFT = 8 - LUT_BITS
+_LUT_HEADER = struct.Struct('<4sBII')  # magic, bits, len(cells), len(pool)
+_LUT_MAGIC = b'CLUT'
+_lookup_tables = {}  # id(color_table): (cells, pool)
+_lut_cache_dir = None
+METHOD_LUT_BITS = 5  # of the other methods, their cells resolved on use
+_METHOD_SHIFT = 8 - METHOD_LUT_BITS
+_UNRESOLVED = 0xFFFFFFFF
+_method_tables = {}  # (id(color_table), method): (cells, pool)
+MEMO_SIZE = 65536   # max ciede2000 results remembered per table
+_MAX_LIGHTNESS_WEIGHT = 1.75  # SL of ciede2000, at L 0 or 100: 1.747
+_MIN_ROTATED = 1 - sqrt(3) / 2  # of ciede2000 chroma and hue terms, w/ RT
+_lightness_orders = {}  # id(color_table): ([lightness, …], [index, …])
+_palette_coords = {}  # (id(color_table), method): [coords, …]
+_method_results = {}  # (id(color_table), method): {(r, g, b): index}
+log = logging.getLogger(__name__)
+
 
 def _build_color_table(base, extended=True):
     # start with first 16 colors
@@ -55,12 +98,524 @@ def _build_color_table(base, extended=True):
     return color_table
 
 
-def build_color_tables(base=color_tables.vga_palette4):
+def _build_lookup_table(color_table):
+    ''' Build a quantized lookup table for the given color table.
+
+        Each cell of the quantized RGB cube is checked against the palette
+        using the distance bounds of its box.
+        Candidates that can't be nearest anywhere in the box are pruned,
+        when another candidate is as close or closer at every point of it.
+        Ties go to the lower index, as with the linear scan.
+
+        Returns:
+            tuple: (cells, pool)
+
+            - cells: array of uint16, one per cell.  Values below 256 are the
+              nearest index, otherwise an offset (+256) into the pool.
+            - pool: array of uint8, a count followed by candidate indexes.
+    '''
+    levels = 1 << LUT_BITS
+    width = 1 << _LUT_SHIFT
+    bounds = [(lv << _LUT_SHIFT, (lv << _LUT_SHIFT) + width - 1)
+              for lv in range(levels)]
+
+    def get_axis_distances(channel):
+        ''' Min and max squared distances per level, per palette entry. '''
+        values = [color[channel] for color in color_table]
+        mins, maxes = [], []
+        for lo, hi in bounds:
+            mins.append([(lo - v) ** 2 if v < lo else
+                         (v - hi) ** 2 if v > hi else 0 for v in values])
+            maxes.append([max(v - lo, hi - v) ** 2 for v in values])
+        return mins, maxes
+
+    (rmins, rmaxes), (gmins, gmaxes), (bmins, bmaxes) = (
+        get_axis_distances(channel) for channel in range(3)
+    )
+    cells = array('H')
+    pool = array('B')
+
+    for r, rbounds in enumerate(bounds):
+        for g, gbounds in enumerate(bounds):
+            rgmins = [rd + gd for rd, gd in zip(rmins[r], gmins[g])]
+            rgmaxes = [rd + gd for rd, gd in zip(rmaxes[r], gmaxes[g])]
+
+            for b, bbounds in enumerate(bounds):
+                # nothing farther than the closest worst case can win:
+                limit = min([rgd + bd for rgd, bd in zip(rgmaxes, bmaxes[b])])
+                candidates = [i for i, (rgd, bd)
+                              in enumerate(zip(rgmins, bmins[b]))
+                              if rgd + bd <= limit]
+                if len(candidates) > 1:
+                    candidates = _prune_candidates(
+                        color_table, candidates, (rbounds, gbounds, bbounds)
+                    )
+                if len(candidates) == 1:
+                    cells.append(candidates[0])
+                else:
+                    cells.append(256 + len(pool))
+                    pool.append(len(candidates))
+                    pool.extend(candidates)
+
+    return cells, pool
+
+
+def _prune_candidates(color_table, candidates, box):
+    ''' Remove candidates dominated by another across the whole box.
+
+        The difference of two squared distances is linear in each channel,
+        so its maximum over the box may be found at the channel bounds.
+    '''
+    keepers = []
+    for j in candidates:
+        cj = color_table[j]
+        for k in candidates:
+            if k == j:
+                continue
+            ck = color_table[k]
+            worst = 0  # max of: dist(p, k) - dist(p, j)
+            for (lo, hi), kv, jv in zip(box, ck, cj):
+                base = kv * kv - jv * jv
+                slope = 2 * (jv - kv)
+                worst += max(base + slope * lo, base + slope * hi)
+            if worst < 0 or (worst == 0 and k < j):  # k always wins
+                break
+        else:
+            keepers.append(j)
+    return keepers
+
+
+def _get_lut_path(color_table, cache_dir):
+    ''' Name the cache file after the table contents, so stale data is never
+        loaded.
+    '''
+    digest = hashlib.sha1(repr((LUT_BITS, color_table)).encode('ascii'))
+    return join(cache_dir, f'console-lut-{digest.hexdigest()[:16]}.bin')
+
+
+def _load_lookup_table(path):
+    ''' Read a lookup table from disk, returns None if not usable. '''
+    try:
+        with open(path, 'rb') as infile:
+            magic, bits, num_cells, num_pool = _LUT_HEADER.unpack(
+                infile.read(_LUT_HEADER.size)
+            )
+            if magic != _LUT_MAGIC or bits != LUT_BITS:
+                return None
+            cells, pool = array('H'), array('B')
+            cells.fromfile(infile, num_cells)
+            pool.fromfile(infile, num_pool)
+        return cells, pool
+    except (OSError, EOFError, struct.error) as err:
+        log.debug('lookup table not loaded: %s', err)
+        return None
+
+
+def _save_lookup_table(path, lut):
+    ''' Write a lookup table to disk, in native byte order. '''
+    cells, pool = lut
+    try:
+        with open(path, 'wb') as outfile:
+            outfile.write(
+                _LUT_HEADER.pack(_LUT_MAGIC, LUT_BITS, len(cells), len(pool))
+            )
+            cells.tofile(outfile)
+            pool.tofile(outfile)
+    except OSError as err:
+        log.debug('lookup table not saved: %s', err)
+
+
+def _get_lookup_table(color_table):
+    ''' Find the lookup table for an active color table, building it on
+        first use.
+    '''
+    lut = _lookup_tables.get(id(color_table))
+    if lut is None:
+        if _lut_cache_dir:
+            path = _get_lut_path(color_table, _lut_cache_dir)
+            lut = _load_lookup_table(path)
+            if lut is None:
+                lut = _build_lookup_table(color_table)
+                _save_lookup_table(path, lut)
+        else:
+            lut = _build_lookup_table(color_table)
+        _lookup_tables[id(color_table)] = lut
+    return lut
+
+
+# sRGB companding, from 8-bit channel values to linear light:
+_srgb_to_linear = tuple(
+    (v / 255) / 12.92 if v <= 10 else ((v / 255 + 0.055) / 1.055) ** 2.4
+    for v in range(256)
+)
+
+
+def _lab_f(t):
+    return t ** (1 / 3) if t > 216 / 24389 else (24389 / 27 * t + 16) / 116
+
+
+def rgb_to_lab(r, g, b):
+    ''' Convert 8-bit sRGB to CIELAB coordinates, D65 white point. '''
+    r, g, b = _srgb_to_linear[r], _srgb_to_linear[g], _srgb_to_linear[b]
+    fx = _lab_f((0.4124564 * r + 0.3575761 * g + 0.1804375 * b) / 0.95047)
+    fy = _lab_f( 0.2126729 * r + 0.7151522 * g + 0.0721750 * b)
+    fz = _lab_f((0.0193339 * r + 0.1191920 * g + 0.9503041 * b) / 1.08883)
+    return (116 * fy - 16, 500 * (fx - fy), 200 * (fy - fz))
+
+
+def rgb_to_oklab(r, g, b):
+    ''' Convert 8-bit sRGB to OKLab coordinates.
+        https://bottosson.github.io/posts/oklab/
+    '''
+    r, g, b = _srgb_to_linear[r], _srgb_to_linear[g], _srgb_to_linear[b]
+    l = (0.4122214708 * r + 0.5363325363 * g + 0.0514459929 * b) ** (1 / 3)
+    m = (0.2119034982 * r + 0.6806995451 * g + 0.1073969566 * b) ** (1 / 3)
+    s = (0.0883024619 * r + 0.2817188376 * g + 0.6299787005 * b) ** (1 / 3)
+    return (
+        0.2104542553 * l + 0.7936177850 * m - 0.0040720468 * s,
+        1.9779984951 * l - 2.4285922050 * m + 0.4505937099 * s,
+        0.0259040371 * l + 0.7827717662 * m - 0.8086757660 * s,
+    )
+
+
+def _to_rgb(r, g, b):
+    return (r, g, b)
+
+
+def _squared_distance(c1, c2):
+    ''' Euclidean, squared as only the order matters. '''
+    d0 = c1[0] - c2[0]
+    d1 = c1[1] - c2[1]
+    d2 = c1[2] - c2[2]
+    return d0 * d0 + d1 * d1 + d2 * d2
+
+
+def _redmean_distance(c1, c2):
+    ''' Weighted RGB, a low-cost approximation.
+        https://www.compuphase.com/cmetric.htm
+    '''
+    rmean = (c1[0] + c2[0]) / 2
+    rd = c1[0] - c2[0]
+    gd = c1[1] - c2[1]
+    bd = c1[2] - c2[2]
+    return ((2 + rmean / 256) * rd * rd + 4 * gd * gd +
+            (2 + (255 - rmean) / 256) * bd * bd)
+
+
+def _ciede2000_distance(lab1, lab2):
+    ''' CIEDE2000 color difference of two CIELAB colors.
+        https://en.wikipedia.org/wiki/Color_difference#CIEDE2000
+    '''
+    L1, a1, b1 = lab1
+    L2, a2, b2 = lab2
+    cbar7 = ((hypot(a1, b1) + hypot(a2, b2)) / 2) ** 7
+    g = 0.5 * (1 - sqrt(cbar7 / (cbar7 + 25 ** 7)))
+    a1, a2 = a1 * (1 + g), a2 * (1 + g)
+    c1, c2 = hypot(a1, b1), hypot(a2, b2)
+    h1 = degrees(atan2(b1, a1)) % 360 if (a1 or b1) else 0
+    h2 = degrees(atan2(b2, a2)) % 360 if (a2 or b2) else 0
+
+    # differences
+    dl = L2 - L1
+    dc = c2 - c1
+    if c1 * c2:
+        dh = h2 - h1
+        if dh > 180:
+            dh -= 360
+        elif dh < -180:
+            dh += 360
+        hbar = h1 + h2
+        if abs(h1 - h2) > 180:
+            hbar += 360 if hbar < 360 else -360
+        hbar /= 2
+    else:
+        dh = 0
+        hbar = h1 + h2
+    dh = 2 * sqrt(c1 * c2) * sin(radians(dh / 2))
+
+    # weights
+    lbar50 = ((L1 + L2) / 2 - 50) ** 2
+    cbar = (c1 + c2) / 2
+    cbar7 = cbar ** 7
+    t = (1 - 0.17 * cos(radians(hbar - 30)) + 0.24 * cos(radians(2 * hbar))
+           + 0.32 * cos(radians(3 * hbar + 6))
+           - 0.20 * cos(radians(4 * hbar - 63)))
+    rt = (-2 * sqrt(cbar7 / (cbar7 + 25 ** 7)) *
+          sin(radians(60 * exp(-(((hbar - 275) / 25) ** 2)))))
+    dl /= 1 + 0.015 * lbar50 / sqrt(20 + lbar50)
+    dc /= 1 + 0.045 * cbar
+    dh /= 1 + 0.015 * cbar * t
+    return sqrt(dl * dl + dc * dc + dh * dh + rt * dc * dh)
+
+
+# Downgrade methods, name: (coordinate conversion, distance function)
+distance_methods = dict(
+    euclid      = (_to_rgb, _squared_distance),     # the default
+    redmean     = (_to_rgb, _redmean_distance),
+    cielab      = (rgb_to_lab, _squared_distance),  # aka CIE76
+    ciede2000   = (rgb_to_lab, _ciede2000_distance),
+    oklab       = (rgb_to_oklab, _squared_distance),
+)
+
+
+def _combine(coeffs, intervals):
+    ''' Interval of a linear combination of intervals. '''
+    lo = hi = 0.0
+    for coeff, (vlo, vhi) in zip(coeffs, intervals):
+        if coeff < 0:
+            vlo, vhi = vhi, vlo
+        lo += coeff * vlo
+        hi += coeff * vhi
+    return lo, hi
+
+
+def _get_lab_box(box):
+    ''' Bounds of the CIELAB coordinates of an RGB box.
+        The intermediate values increase with each channel.
+    '''
+    (r0, r1), (g0, g1), (b0, b1) = (
+        (_srgb_to_linear[lo], _srgb_to_linear[hi]) for lo, hi in box)
+    fx0 = _lab_f((0.4124564 * r0 + 0.3575761 * g0 + 0.1804375 * b0) / 0.95047)
+    fx1 = _lab_f((0.4124564 * r1 + 0.3575761 * g1 + 0.1804375 * b1) / 0.95047)
+    fy0 = _lab_f( 0.2126729 * r0 + 0.7151522 * g0 + 0.0721750 * b0)
+    fy1 = _lab_f( 0.2126729 * r1 + 0.7151522 * g1 + 0.0721750 * b1)
+    fz0 = _lab_f((0.0193339 * r0 + 0.1191920 * g0 + 0.9503041 * b0) / 1.08883)
+    fz1 = _lab_f((0.0193339 * r1 + 0.1191920 * g1 + 0.9503041 * b1) / 1.08883)
+    return ((116 * fy0 - 16, 116 * fy1 - 16),
+            (500 * (fx0 - fy1), 500 * (fx1 - fy0)),
+            (200 * (fy0 - fz1), 200 * (fy1 - fz0)))
+
+
+def _get_oklab_box(box):
+    ''' Bounds of the OKLab coordinates of an RGB box. '''
+    rgb = [(_srgb_to_linear[lo], _srgb_to_linear[hi]) for lo, hi in box]
+    lms = [
+        tuple(v ** (1 / 3) for v in _combine(coeffs, rgb)) for coeffs in (
+            (0.4122214708, 0.5363325363, 0.0514459929),
+            (0.2119034982, 0.6806995451, 0.1073969566),
+            (0.0883024619, 0.2817188376, 0.6299787005),
+        )
+    ]
+    return (
+        _combine((0.2104542553, 0.7936177850, -0.0040720468), lms),
+        _combine((1.9779984951, -2.4285922050, 0.4505937099), lms),
+        _combine((0.0259040371, 0.7827717662, -0.8086757660), lms),
+    )
+
+
+def _get_coords_sphere(coord_box, coords):
+    ''' Distances of palette entries to the center of a box of coordinates,
+        its radius, and 1, as it is Euclidean there.
+    '''
+    (l0, h0), (l1, h1), (l2, h2) = coord_box
+    c0, c1, c2 = (l0 + h0) / 2, (l1 + h1) / 2, (l2 + h2) / 2
+    distances = [sqrt((c0 - v0) ** 2 + (c1 - v1) ** 2 + (c2 - v2) ** 2)
+                 for v0, v1, v2 in coords]
+    return distances, sqrt((h0 - l0) ** 2 + (h1 - l1) ** 2 +
+                           (h2 - l2) ** 2) / 2, 1
+
+
+def _get_redmean_sphere(box, coords):
+    ''' Distances of palette entries to the center of an RGB box,
+        under the weights of redmean there, its radius, and the bound of
+        the ratio of distances under the weights of any other point of it.
+
+        The weights are within 2…3, green's 4, and those of red and blue
+        change by 1/512 per step of red, so by a factor within 1 ± h/1024
+        over a half width h.
+    '''
+    half = (box[0][1] - box[0][0]) / 2
+    cr, cg, cb = ((lo + hi) / 2 for lo, hi in box)
+    slack = half / 1024
+    distances = [  # _redmean_distance, inline
+        sqrt((2 + (cr + r) / 512) * (cr - r) ** 2 + 4 * (cg - g) ** 2 +
+             (2 + (255 - (cr + r) / 2) / 256) * (cb - b) ** 2)
+        for r, g, b in coords
+    ]
+    return distances, half * sqrt(10), sqrt((1 + slack) / (1 - slack))
+
+
+# Bounds of distances of palette entries to an RGB box, by method:
+_cell_bounds = dict(
+    redmean     = _get_redmean_sphere,
+    cielab      = lambda box, coords: _get_coords_sphere(
+                                        _get_lab_box(box), coords),
+    oklab       = lambda box, coords: _get_coords_sphere(
+                                        _get_oklab_box(box), coords),
+)
+
+
+def _get_cell_candidates(key, coords, get_bounds, r, g, b):
+    ''' Returns the candidate indexes of the cell of a color,
+        resolving the cell on first use.
+
+        Distances from any color inside the cell differ from those from its
+        center by its radius at most, by the triangle inequality.
+        Candidates are those that may be within the greatest distance of the
+        nearest to the center, no other can be nearest to any color inside.
+    '''
+    lut = _method_tables.get(key)
+    if lut is None:
+        lut = _method_tables[key] = (
+            array('I', [_UNRESOLVED]) * (1 << METHOD_LUT_BITS * 3),
+            array('H'),
+        )
+    cells, pool = lut
+    cell = ((r >> _METHOD_SHIFT << METHOD_LUT_BITS * 2) |
+            (g >> _METHOD_SHIFT << METHOD_LUT_BITS) | (b >> _METHOD_SHIFT))
+    value = cells[cell]
+
+    if value == _UNRESOLVED:
+        width = (1 << _METHOD_SHIFT) - 1
+        box = [(v >> _METHOD_SHIFT << _METHOD_SHIFT,
+                (v >> _METHOD_SHIFT << _METHOD_SHIFT) + width)
+               for v in (r, g, b)]
+        distances, radius, ratio = get_bounds(box, coords)
+        limit = (min(distances) + radius) * ratio + radius
+        limit += limit * 1e-9  # headroom for rounding
+        candidates = [i for i, value in enumerate(distances) if value <= limit]
+        if len(candidates) == 1:
+            value = candidates[0]
+        else:
+            value = 256 + len(pool)
+            pool.append(len(candidates))
+            pool.extend(candidates)
+        cells[cell] = value
+
+    if value < 256:  # the cell has a single answer
+        return (value,)
+    pos = value - 256
+    return pool[pos + 1:pos + 1 + pool[pos]]
+
+
+def _find_nearest_by_method(r, g, b, color_table, method):
+    ''' Search using a perceptual distance method.
+
+        For the active tables, palette coordinates are computed once, and
+        the search narrowed to the candidates of a lookup table cell.
+        Those of ciede2000 are memoized instead.
+    '''
+    try:
+        to_coords, get_distance = distance_methods[method]
+    except KeyError:
+        raise ValueError(f'unknown downgrade method: {method!r}')
+
+    candidates = results = None
+    if color_table is color_table8 or color_table is color_table4:
+        key = (id(color_table), method)
+        coords = _palette_coords.get(key)
+        if coords is None:
+            coords = _palette_coords[key] = [to_coords(*values)
+                                             for values in color_table]
+        get_bounds = _cell_bounds.get(method)
+        if get_bounds and 0 <= r < 256 and 0 <= g < 256 and 0 <= b < 256:
+            try:
+                candidates = _get_cell_candidates(key, coords, get_bounds,
+                                                  r, g, b)
+            except TypeError:  # not ints, e.g. float
+                pass
+            else:
+                if len(candidates) == 1:
+                    return candidates[0]
+        elif not get_bounds:                # ciede2000
+            results = _method_results.get(key)
+            if results is None:
+                results = _method_results[key] = {}
+            index = results.get((r, g, b))
+            if index is None:
+                index = _find_nearest_ciede2000(
+                    to_coords(*(min(max(int(v), 0), 255) for v in (r, g, b))),
+                    coords, _get_lightness_order(color_table, coords),
+                    _find_nearest_by_method(r, g, b, color_table, 'cielab'))
+                if len(results) >= MEMO_SIZE:
+                    results.clear()
+                results[(r, g, b)] = index
+            return index
+    else:
+        coords = [to_coords(*values) for values in color_table]
+
+    target = to_coords(*(min(max(int(v), 0), 255) for v in (r, g, b)))
+    shortest_distance = None
+    index = 0
+    for i in (candidates or range(len(coords))):
+        this_distance = get_distance(target, coords[i])
+        if shortest_distance is None or this_distance < shortest_distance:
+            index = i
+            shortest_distance = this_distance
+    return index
+
+
+def _get_lightness_order(color_table, coords):
+    ''' Returns the lightness of palette entries in ascending order,
+        their indexes, and chroma by index, built once per table.
+    '''
+    order = _lightness_orders.get(id(color_table))
+    if order is None:
+        pairs = sorted((values[0], i) for i, values in enumerate(coords))
+        order = _lightness_orders[id(color_table)] = (
+            [lightness for lightness, i in pairs],
+            [i for lightness, i in pairs],
+            [hypot(a, b) for lightness, a, b in coords],
+        )
+    return order
+
+
+def _find_nearest_ciede2000(target, coords, order, guess):
+    ''' Search for the nearest by CIEDE2000, narrowed by lower bounds of
+        the distance, from a good guess, e.g. the nearest by CIE76.
+
+        The distance is at least that of lightness over its weight SL,
+        1.75 at most, so only entries of lightness within that many times
+        the distance of the guess are considered.  Of those, the rest of the
+        distance is at least 1 - √3/2 of that of a and b over SC, as the
+        rotation term RT is √3 at most, and SH ≤ SC.  SC grows with the mean
+        chroma, which a' is up to 1.5x of.
+        Ties go to the lower index, as with the linear scan.
+    '''
+    index = guess
+    shortest_distance = _ciede2000_distance(target, coords[guess])
+    limit = shortest_distance * shortest_distance * (1 + 1e-9)  # rounding
+    lightness, indexes, chromas = order
+    L1, a1, b1 = target
+    c1 = hypot(a1, b1)
+    window = shortest_distance * _MAX_LIGHTNESS_WEIGHT
+    window += window * 1e-9
+    start = bisect_left(lightness, L1 - window)
+    end = bisect_right(lightness, L1 + window)
+
+    for i in indexes[start:end]:
+        L2, a2, b2 = values = coords[i]
+        lbar50 = ((L1 + L2) / 2 - 50) ** 2
+        dl = (L2 - L1) / (1 + 0.015 * lbar50 / sqrt(20 + lbar50))
+        da, db = a2 - a1, b2 - b1
+        sc = 1 + 0.045 * 0.75 * (c1 + chromas[i])
+        if dl * dl + _MIN_ROTATED * (da * da + db * db) / (sc * sc) > limit:
+            continue
+
+        this_distance = _ciede2000_distance(target, values)
+        if this_distance < shortest_distance or (
+           this_distance == shortest_distance and i < index):
+            index = i
+            shortest_distance = this_distance
+            limit = shortest_distance * shortest_distance * (1 + 1e-9)
+    return index
+
+
+def build_color_tables(base=color_tables.vga_palette4, lookup_tables=False,
+                       cache_dir=None):
     '''
         Create the color tables for palette downgrade support,
         starting with the platform-specific 16 from the color tables module.
         Save as global state. :-/
+
+        Arguments:
+            base:           The 16 color basic palette, tuple of rgb tuples.
+            lookup_tables:  bool - Build the quantized lookup tables now,
+                            rather than on first use.
+            cache_dir:      str - Optional directory to persist lookup tables
+                            in, to avoid building them again.
     '''
+    global _lut_cache_dir
     base = [] if base is None else base
 
     # make sure we have them before clearing
@@ -74,6 +629,17 @@ def build_color_tables(base=color_tables.vga_palette4):
         color_table8.clear()
         color_table8.extend(table8)
 
+    _lookup_tables.clear()  # stale now
+    _method_tables.clear()
+    _palette_coords.clear()
+    _lightness_orders.clear()
+    _method_results.clear()
+    _lut_cache_dir = cache_dir
+    if lookup_tables:
+        for color_table in (color_table4, color_table8):
+            if color_table:
+                _get_lookup_table(color_table)
+
 
 def find_nearest_color_index(r, g, b, color_table=None, method='euclid'):
     ''' Given three integers representing R, G, and B,
@@ -83,18 +649,42 @@ def find_nearest_color_index(r, g, b, color_table=None, method='euclid'):
             r:    int - of range 0…255
             g:    int - of range 0…255
             b:    int - of range 0…255
+            color_table:  sequence of rgb tuples, defaults to color_table8.
+            method:  str - name of the distance method, one of
+                           ``distance_methods``.
 
         Returns:
             int, None: index, or None on error.
     '''
-    shortest_distance = 257*257*3  # max eucl. distance from #000000 to #ffffff
-    index = 0                      # default to black
     if not color_table:
         if not color_table8:
             build_color_tables()
         color_table = color_table8
 
-    for i, values in enumerate(color_table):
+    if method != 'euclid':
+        return _find_nearest_by_method(r, g, b, color_table, method)
+
+    candidates = None
+    if ((color_table is color_table8 or color_table is color_table4) and
+        0 <= r < 256 and 0 <= g < 256 and 0 <= b < 256):
+        cells, pool = _get_lookup_table(color_table)
+        try:
+            index = cells[(r >> _LUT_SHIFT << LUT_BITS * 2) |
+                          (g >> _LUT_SHIFT << LUT_BITS) |
+                          (b >> _LUT_SHIFT)]
+        except TypeError:  # not ints, e.g. float
+            pass
+        else:
+            if index < 256:  # the cell has a single answer
+                return index
+            pos = index - 256
+            candidates = pool[pos + 1:pos + 1 + pool[pos]]
+
+    shortest_distance = 257*257*3  # max eucl. distance from #000000 to #ffffff
+    index = 0                      # default to black
+
+    for i in (candidates or range(len(color_table))):
+        values = color_table[i]
         rd = r - values[0]
         gd = g - values[1]
         bd = b - values[2]
@@ -108,6 +698,191 @@ def find_nearest_color_index(r, g, b, color_table=None, method='euclid'):
     return index
 
 
+def find_nearest_color_indexes(colors, color_table=None, method='euclid'):
+    ''' Given a sequence of RGB triplets, return the nearest color index of
+        each, in one go.  Useful for gradients, heatmaps, and images.
+
+        Euclidean distances are computed in a vectorized fashion when NumPy
+        is available, otherwise each distinct color is looked up once.
+
+        Arguments:
+            colors:     sequence of (r, g, b) of int 0…255,
+                        or an ndarray shaped (…, 3).
+
+        Returns:
+            ndarray of uint8, in the shape of colors minus its last axis,
+            when NumPy is available.  Otherwise an array of 'B'.
+    '''
+    if not color_table:
+        if not color_table8:
+            build_color_tables()
+        color_table = color_table8
+
+    try:
+        import numpy  # deferred, slow to import
+    except ImportError:
+        numpy = None
+
+    if numpy:
+        return _find_nearest_indexes_numpy(numpy, colors, color_table, method)
+    else:
+        return _find_nearest_indexes_python(colors, color_table, method)
+
+
+def _find_nearest_indexes_numpy(numpy, colors, color_table, method='euclid'):
+    ''' Vectorized search.
+
+        Squared distances expand to: |c|² - 2c·t + |t|²
+        The first term is the same for every entry of a row so may be
+        dropped from the comparison.  Values are integers well below 2⁵³,
+        therefore exact in float64 and ties resolve to the first index,
+        as with the scalar scan.
+
+        Other methods are computed by the same formulas as the scalar
+        search, element-wise.
+    '''
+    colors = numpy.asarray(colors, dtype=numpy.float64)
+    if colors.size == 0:
+        return numpy.zeros(0, dtype=numpy.uint8)
+    if colors.shape[-1] != 3:
+        raise ValueError(f'colors must be shaped (…, 3), not {colors.shape}.')
+    if method != 'euclid':
+        results = _find_nearest_indexes_numpy_by_method(
+            numpy, colors.reshape(-1, 3), color_table, method)
+        return results.reshape(colors.shape[:-1])
+
+    table = numpy.asarray(color_table, dtype=numpy.float64)
+    table_t2 = table.T * -2
+    table_sq = (table * table).sum(axis=1)
+
+    flat = colors.reshape(-1, 3)
+    results = numpy.empty(len(flat), dtype=numpy.uint8)
+    for start in range(0, len(flat), BATCH_SIZE):
+        chunk = flat[start:start + BATCH_SIZE]
+        scores = chunk @ table_t2
+        scores += table_sq
+        results[start:start + BATCH_SIZE] = scores.argmin(axis=1)
+
+    return results.reshape(colors.shape[:-1])
+
+
+def _find_nearest_indexes_numpy_by_method(numpy, flat, color_table, method):
+    ''' Vectorized search by a perceptual method, in smaller chunks,
+        as the distances have more terms.  Rounding of the math functions
+        may differ from those of the scalar search, at near-ties only.
+    '''
+    if method not in distance_methods:
+        raise ValueError(f'unknown downgrade method: {method!r}')
+    to_coords = distance_methods[method][0]
+    coords = numpy.array([to_coords(*values) for values in color_table])
+    coords = coords.T[:, numpy.newaxis, :]  # per axis, shaped (1, entries)
+    to_linear = numpy.array(_srgb_to_linear)
+    flat = numpy.clip(flat.astype(numpy.int64), 0, 255)  # as int(), clamped
+
+    batch_size = BATCH_SIZE // 16
+    results = numpy.empty(len(flat), dtype=numpy.uint8)
+    for start in range(0, len(flat), batch_size):
+        chunk = flat[start:start + batch_size]
+        if method in ('cielab', 'ciede2000'):
+            chunk = _rgb_to_lab_numpy(numpy, to_linear[chunk])
+        elif method == 'oklab':
+            chunk = _rgb_to_oklab_numpy(numpy, to_linear[chunk])
+        target = chunk.T[:, :, numpy.newaxis]  # per axis, (colors, 1)
+
+        if method == 'redmean':
+            distances = _redmean_distance(target, coords)
+        elif method == 'ciede2000':
+            distances = _ciede2000_numpy(numpy, target, coords)
+        else:
+            distances = _squared_distance(target, coords)
+        results[start:start + batch_size] = distances.argmin(axis=1)
+
+    return results
+
+
+def _rgb_to_lab_numpy(numpy, linear):
+    ''' rgb_to_lab of linear values, shaped (…, 3). '''
+    def lab_f(t):
+        return numpy.where(t > 216 / 24389, t ** (1 / 3),
+                                            (24389 / 27 * t + 16) / 116)
+    r, g, b = linear[..., 0], linear[..., 1], linear[..., 2]
+    fx = lab_f((0.4124564 * r + 0.3575761 * g + 0.1804375 * b) / 0.95047)
+    fy = lab_f( 0.2126729 * r + 0.7151522 * g + 0.0721750 * b)
+    fz = lab_f((0.0193339 * r + 0.1191920 * g + 0.9503041 * b) / 1.08883)
+    return numpy.stack((116 * fy - 16, 500 * (fx - fy), 200 * (fy - fz)),
+                       axis=-1)
+
+
+def _rgb_to_oklab_numpy(numpy, linear):
+    ''' rgb_to_oklab of linear values, shaped (…, 3). '''
+    r, g, b = linear[..., 0], linear[..., 1], linear[..., 2]
+    l = (0.4122214708 * r + 0.5363325363 * g + 0.0514459929 * b) ** (1 / 3)
+    m = (0.2119034982 * r + 0.6806995451 * g + 0.1073969566 * b) ** (1 / 3)
+    s = (0.0883024619 * r + 0.2817188376 * g + 0.6299787005 * b) ** (1 / 3)
+    return numpy.stack((
+        0.2104542553 * l + 0.7936177850 * m - 0.0040720468 * s,
+        1.9779984951 * l - 2.4285922050 * m + 0.4505937099 * s,
+        0.0259040371 * l + 0.7827717662 * m - 0.8086757660 * s,
+    ), axis=-1)
+
+
+def _ciede2000_numpy(numpy, lab1, lab2):
+    ''' _ciede2000_distance, element-wise over broadcast arrays. '''
+    L1, a1, b1 = lab1
+    L2, a2, b2 = lab2
+    cbar7 = ((numpy.hypot(a1, b1) + numpy.hypot(a2, b2)) / 2) ** 7
+    g = 0.5 * (1 - numpy.sqrt(cbar7 / (cbar7 + 25 ** 7)))
+    a1, a2 = a1 * (1 + g), a2 * (1 + g)
+    c1, c2 = numpy.hypot(a1, b1), numpy.hypot(a2, b2)
+    h1 = numpy.where((a1 != 0) | (b1 != 0),
+                     numpy.degrees(numpy.arctan2(b1, a1)) % 360, 0)
+    h2 = numpy.where((a2 != 0) | (b2 != 0),
+                     numpy.degrees(numpy.arctan2(b2, a2)) % 360, 0)
+
+    # differences
+    dl = L2 - L1
+    dc = c2 - c1
+    has_chroma = (c1 * c2) != 0
+    dh = h2 - h1
+    dh = numpy.where(dh > 180, dh - 360, numpy.where(dh < -180, dh + 360, dh))
+    dh = numpy.where(has_chroma, dh, 0)
+    hbar = h1 + h2
+    hbar = numpy.where(has_chroma & (numpy.abs(h1 - h2) > 180),
+                       numpy.where(hbar < 360, hbar + 360, hbar - 360), hbar)
+    hbar = numpy.where(has_chroma, hbar / 2, hbar)
+    dh = 2 * numpy.sqrt(c1 * c2) * numpy.sin(numpy.radians(dh / 2))
+
+    # weights
+    lbar50 = ((L1 + L2) / 2 - 50) ** 2
+    cbar = (c1 + c2) / 2
+    cbar7 = cbar ** 7
+    t = (1 - 0.17 * numpy.cos(numpy.radians(hbar - 30))
+           + 0.24 * numpy.cos(numpy.radians(2 * hbar))
+           + 0.32 * numpy.cos(numpy.radians(3 * hbar + 6))
+           - 0.20 * numpy.cos(numpy.radians(4 * hbar - 63)))
+    rt = (-2 * numpy.sqrt(cbar7 / (cbar7 + 25 ** 7)) *
+          numpy.sin(numpy.radians(60 * numpy.exp(-(((hbar - 275) / 25) ** 2)))))
+    dl = dl / (1 + 0.015 * lbar50 / numpy.sqrt(20 + lbar50))
+    dc = dc / (1 + 0.045 * cbar)
+    dh = dh / (1 + 0.015 * cbar * t)
+    return numpy.sqrt(dl * dl + dc * dc + dh * dh + rt * dc * dh)
+
+
+def _find_nearest_indexes_python(colors, color_table, method='euclid'):
+    ''' Fallback search, one lookup per distinct color. '''
+    results = array('B')
+    found = {}
+    for color in colors:
+        color = tuple(color)
+        index = found.get(color)
+        if index is None:
+            index = found[color] = find_nearest_color_index(
+                *color, color_table=color_table, method=method
+            )
+        results.append(index)
+    return results
+
+
 def find_nearest_color_hexstr(hexdigits, color_table=None, method='euclid'):
     ''' Given a three or six-character hex digit string, return the nearest
         color index.
@@ -29,12 +29,20 @@
         :license: MIT License (MIT)
 
 '''
+import re
 import sys
 from contextlib import contextmanager
 
 from . import ansi_capable as _ansi_capable, using_terminfo
 from .constants import CSI, ESC, RIS
-from .detection import get_position as _get_position, TermStack
+from .detection import (get_mode as _get_mode,
+                        get_position as _get_position, is_a_tty as _is_a_tty,
+                        TermStack)
+
+
+MAX_TEMPLATE_CACHE = 4096   # renders cached per template
+TEMPLATE_TABLE_SIZE = 128   # one-parameter renders precomputed, 0…127
+render_hook = None          # callable(template, args, hit), to instrument
 
 
 # Mapping of convenience names to terminfo capabilities,
@@ -83,6 +91,11 @@ class _ContextMixin:
     enable_bracketed_paste = CSI + '?2004h'
     disable_bracketed_paste = CSI + '?2004l'
 
+    # https://gist.github.com/christianparpart/d8a62cc1ab659194337d73e399004036
+    enable_sync_output = CSI + '?2026h'
+    disable_sync_output = CSI + '?2026l'
+    _sync_output_support = None     # detected once, on first use
+
     save_title = ('t', '22;%s')
     restore_title =  ('t', '23;%s')
 
@@ -120,6 +133,57 @@ class _ContextMixin:
             stream.write(self.disable_bracketed_paste)
             stream.flush()
 
+    @contextmanager
+    def frame(self, sync=None):
+        ''' Context Manager that gathers the output of the block into a
+            single write and flush on exit, wrapped in a synchronized update
+            (DEC private mode 2026) where supported,
+            so the terminal paints it at once, without tearing.
+
+            Output to sys.stdout is captured when it is the screen's stream,
+            or write to the yielded buffer.
+
+            .. code-block:: python
+
+                with screen.frame():
+                    print(screen.move_to(0, 0), 'Top of the world, Ma!')
+
+            Arguments:
+                sync: bool - force the synchronized update on or off,
+                      by default the terminal is queried, once.
+        '''
+        from io import StringIO  # defer
+
+        stream = self._stream
+        if sync is None:
+            sync = self._detect_sync_output()
+
+        buffer = StringIO()
+        orig_stdout = sys.stdout
+        if stream is orig_stdout:
+            sys.stdout = buffer
+        try:
+            yield buffer
+        finally:
+            sys.stdout = orig_stdout
+            data = buffer.getvalue()
+            if data:
+                if sync:
+                    data = self.enable_sync_output + data + (
+                        self.disable_sync_output)
+                stream.write(data)
+                stream.flush()
+
+    def _detect_sync_output(self):
+        ''' Whether the terminal supports synchronized output, cached. '''
+        if not _is_a_tty(self._stream):
+            return False
+        support = _ContextMixin._sync_output_support
+        if support is None:
+            support = _get_mode(2026) in (1, 2)         # set, reset
+            _ContextMixin._sync_output_support = support
+        return support
+
     @contextmanager
     def fullscreen(self):
         ''' Context Manager that enters full-screen mode and restores normal
@@ -346,7 +410,39 @@ class Screen(_ContextMixin):
             raise AttributeError(msg)
 
 
-class _TemplateString(str):
+class _RenderCache:
+    ''' Caches the renders of a template string by arguments,
+        bounded by clearing when full.  Renders of templates taking
+        one parameter are precomputed into it as a table, on first use,
+        for small values.
+
+        Set the module's render_hook to a callable to count hits, e.g.::
+
+            screen.render_hook = lambda template, args, hit: …
+    '''
+    def __call__(self, *args):
+        rendered = self._cache.get(args)
+        if rendered is None:
+            rendered = self._render_miss(args)
+            hit = False
+        else:
+            hit = True
+        if render_hook:
+            render_hook(self, args, hit)
+        return rendered
+
+    def _render_miss(self, args):
+        cache = self._cache
+        if len(cache) >= MAX_TEMPLATE_CACHE:
+            cache.clear()
+        if not cache and self._param_count == 1:  # table
+            cache.update(((value,), self._render(value))
+                         for value in range(TEMPLATE_TABLE_SIZE))
+        rendered = cache[args] = self._render(*args)
+        return rendered
+
+
+class _TemplateString(_RenderCache, str):
     ''' A template string that renders itself with given or default args. '''
     _default = 1
 
@@ -354,9 +450,11 @@ class _TemplateString(str):
         self = str.__new__(cls, CSI + arg + endcode)
         self.endcode = endcode  # used in test
         self._swap = swap
+        self._param_count = arg.count('%s')
+        self._cache = {}
         return self
 
-    def __call__(self, *args):
+    def _render(self, *args):
         if len(args) == 2:
             if self._swap:  # swap standard coordinate order backwards
                 args = args[::-1]
@@ -426,26 +524,19 @@ class ScreenTermInfo(_ContextMixin):
         if using_terminfo:
             cap_name = NAME_TO_TERMINFO_MAP.get(attr, attr)
 
-            # search terminfo
-            value = None
-            for get_cap in _ti_query_functions:
-                value = get_cap(cap_name)
-                if value is None:
-                    continue
-                elif value in (-1, -2):
-                    value = None
-                else:  # found
-                    break
+            # search the terminfo snapshot
+            value = _terminfo.get_capability(cap_name)
 
             if value is None:  # didn't find it, return None or raise?
                 #~ class_name = self.__class__.__name__
                 #~ raise AttributeError(f'{class_name!r} object has no attribute {cap_name!r}')
                 pass
             else:  # convert, cache, and return
-                if b'%' in value:  # tparm!
-                    value = _TemplateStringTermInfo(value, swap=self._swap)
-                else:
-                    value = value.decode('ascii')
+                if type(value) is not str:  # number or flag
+                    pass
+                elif '%' in value:  # tparm!
+                    value = _TemplateStringTermInfo(value.encode('latin1'),
+                                                    swap=self._swap)
 
                 setattr(self, cap_name, value)  # short name
                 if cap_name != attr:  # long name also
@@ -456,16 +547,19 @@ class ScreenTermInfo(_ContextMixin):
                                'Screen class instead.')
 
 
-class _TemplateStringTermInfo(str):
+class _TemplateStringTermInfo(_RenderCache, str):
     ''' A callable template string that renders itself with given args. '''
 
     def __new__(cls, value, swap=None):
         self = str.__new__(cls, value.decode('ascii'))  # as str
         self._byte_str = value  # orig as bytes
         self._swap = swap
+        self._param_count = max(  # highest pushed, e.g. %p2
+            map(int, re.findall(r'%p([1-9])', self)), default=0)
+        self._cache = {}
         return self
 
-    def __call__(self, *args):
+    def _render(self, *args):
         ''' Run the tparm! '''
         if len(args) == 2 and self._swap:
             args = args[::-1]  # swap standard coordinate order backwards
@@ -488,12 +582,9 @@ else:
 
 # It's Automatic:  https://youtu.be/y5ybok6ZGXk
 if using_terminfo:
-    from . import _curses
+    from . import terminfo as _terminfo
 
-    _ti_query_functions = (
-        _curses.tigetstr, _curses.tigetnum, _curses.tigetflag
-    )
-    _tparm = _curses.tparm
+    _tparm = _terminfo.tparm  # sets up curses on first use
     sc = ScreenTermInfo()
 else:
     sc = Screen()
@@ -0,0 +1,282 @@
+# -*- coding: future_fstrings -*-
+'''
+    .. console - Comprehensive utility library for ANSI terminals.
+    .. © 2018, Mike Miller - Released under the LGPL, version 3+.
+
+    Tracking of SGR (Select Graphic Rendition) state, i.e. the current
+    colors and effects of the terminal,
+    to move from one style to the next with the shortest sequence.
+
+    A state is a tuple of (slot, code) pairs in canonical order,
+    for example::
+
+        (('bold', '1'), ('fg', '38;5;196'))
+
+    which makes it hashable and cheap to compare.
+'''
+import re
+
+from .constants import CSI
+
+
+# slots in canonical order, with the code that turns each off:
+_off_codes = dict(
+    bold='22', dim='22', italic='23', underline='24', blink='25',
+    reverse='27', conceal='28', strike='29', font='10', frame='54',
+    overline='55', script='75',
+    fg='39', bg='49', ul='59',
+)
+_slot_order = {slot: i for i, slot in enumerate(_off_codes)}
+
+_code_slots = {
+    '1': 'bold', '2': 'dim', '3': 'italic', '20': 'italic',
+    '4': 'underline', '21': 'underline', '5': 'blink', '6': 'blink',
+    '7': 'reverse', '8': 'conceal', '9': 'strike',
+    '51': 'frame', '52': 'frame', '53': 'overline',
+    '73': 'script', '74': 'script',
+    '38': 'fg', '48': 'bg', '58': 'ul',
+}
+_code_slots.update((str(code), 'font') for code in range(11, 20))
+_code_slots.update((str(code), 'fg') for code in range(30, 38))
+_code_slots.update((str(code), 'fg') for code in range(90, 98))
+_code_slots.update((str(code), 'bg') for code in range(40, 48))
+_code_slots.update((str(code), 'bg') for code in range(100, 108))
+
+_off_slots = {}  # '22': ('bold', 'dim'), …
+for _slot, _code in _off_codes.items():
+    _off_slots[_code] = _off_slots.get(_code, ()) + (_slot,)
+_extended_args = {'5': 2, '2': 4}  # params consumed after 38/48/58, incl.
+
+# only SGR, no private or intermediate bytes:
+sgr_finder = re.compile(r'\x1b\[([0-9:;]*)m')
+MAX_CACHE_SIZE = 4096
+_parse_cache = {}
+_transition_cache = {}
+
+
+def _slot_key(item):
+    ''' Sort known slots in canonical order, then unknown codes. '''
+    slot = item[0]
+    return (_slot_order.get(slot, len(_slot_order)), slot)
+
+
+def freeze(state):
+    ''' Convert a state dict to its canonical, hashable, tuple form. '''
+    return tuple(sorted(state.items(), key=_slot_key))
+
+
+def split_params(params):
+    ''' Split the parameters of an SGR sequence into groups,
+        keeping extended colors together, e.g.:
+
+            '1;38;5;196;4:3' → ('1',), ('38', '5', '196'), ('4:3',)
+    '''
+    values = params.split(';')
+    i, length = 0, len(values)
+    while i < length:
+        value = values[i]
+        i += 1
+        if value in ('38', '48', '58'):         # extended color
+            count = _extended_args.get(values[i] if i < length else '', 0)
+            yield tuple(values[i-1:i+count])
+            i += count
+        else:
+            yield (value,)
+
+
+def apply_params(state, params):
+    ''' Update a state dict in place with the parameters of one SGR sequence.
+
+        Arguments:
+            state       dict of slot: code
+            params      str, e.g. '1;38;5;196', without CSI or 'm'.
+    '''
+    for group in split_params(params):
+        value = group[0]
+        if len(group) > 1:                      # extended color
+            state[_code_slots[value]] = ';'.join(group)
+
+        elif ':' in value:                      # sub-parameters, e.g. 4:3
+            head, _, tail = value.partition(':')
+            if head == '4' and tail == '0':     # underline off
+                state.pop('underline', None)
+            else:
+                state[_code_slots.get(head, head)] = value
+
+        else:
+            value = value.lstrip('0')           # '01' is '1' too
+            if not value:                       # '', '0': reset
+                state.clear()
+
+            elif value in _off_slots:
+                for slot in _off_slots[value]:
+                    state.pop(slot, None)
+
+            else:
+                state[_code_slots.get(value, value)] = value
+
+
+def parse_sgr(text, state=()):
+    ''' Returns the state that results from the SGR sequences found in text.
+
+        Arguments:
+            text        str, e.g. str(fx.bold + fg.red)
+            state       tuple, the state to start from, default none.
+    '''
+    key = (text, state)
+    result = _parse_cache.get(key)
+    if result is None:
+        current = dict(state)
+        for match in sgr_finder.finditer(text):
+            apply_params(current, match.group(1))
+        result = freeze(current)
+        if len(_parse_cache) >= MAX_CACHE_SIZE:
+            _parse_cache.clear()
+        _parse_cache[key] = result
+    return result
+
+
+def transition(current, target):
+    ''' Returns the shortest SGR sequence moving from the current state to the
+        target state, either incrementally or via a reset.
+    '''
+    if current == target:
+        return ''
+    key = (current, target)
+    result = _transition_cache.get(key)
+    if result is None:
+        result = _transition(current, target)
+        if len(_transition_cache) >= MAX_CACHE_SIZE:
+            _transition_cache.clear()
+        _transition_cache[key] = result
+    return result
+
+
+def _transition(current, target):
+    if not target:
+        return f'{CSI}m'                        # reset, 0 is the default
+    full = ['0']
+    full.extend(code for slot, code in target)
+    if not current:
+        full.pop(0)                             # nothing to reset
+        return f'{CSI}{";".join(full)}m'
+
+    wanted = dict(target)
+    offs = []
+    for slot, code in current:
+        if slot not in wanted:
+            off_code = _off_codes.get(slot)
+            if off_code is None:                # unknown, no way back
+                return f'{CSI}{";".join(full)}m'
+            if off_code not in offs:
+                offs.append(off_code)
+
+    had = dict(current)
+    codes = offs
+    for slot, code in target:                   # e.g. 22 clears bold & dim
+        if had.get(slot) != code or _off_codes.get(slot) in offs:
+            codes.append(code)
+
+    if len(';'.join(codes)) < len(';'.join(full)):
+        full = codes
+    return f'{CSI}{";".join(full)}m'
+
+
+class SGRTracker:
+    ''' Tracks the current SGR state of output, and moves it to new styles
+        with the shortest sequences possible.
+
+        Arguments:
+            state       tuple, initial state, default none.
+    '''
+    def __init__(self, state=()):
+        self.state = state
+
+    @property
+    def fg(self):
+        return dict(self.state).get('fg')
+
+    @property
+    def bg(self):
+        return dict(self.state).get('bg')
+
+    @property
+    def ul(self):
+        ''' Underline color. '''
+        return dict(self.state).get('ul')
+
+    @property
+    def effects(self):
+        return tuple(code for slot, code in self.state
+                     if slot not in ('fg', 'bg', 'ul'))
+
+    def update(self, text):
+        ''' Update the state with SGR sequences found in text,
+            e.g. output written elsewhere.
+        '''
+        self.state = parse_sgr(text, self.state)
+
+    def move_to(self, style):
+        ''' Returns the sequence to move to the given style, and tracks it.
+
+            Arguments:
+                style       Palette entry, or str of SGR sequences.
+                            A false value means no style.
+        '''
+        target = parse_sgr(str(style)) if style else ()
+        sequence = transition(self.state, target)
+        self.state = target
+        return sequence
+
+    def reset(self):
+        ''' Returns the sequence to return to no style, if needed. '''
+        return self.move_to(None)
+
+    def __repr__(self):
+        return f'{self.__class__.__name__}({self.state!r})'
+
+
+def render_spans(spans, reset=True):
+    ''' Render a sequence of (text, style) spans, with minimal transitions
+        between styles rather than a start and end sequence for each.
+
+        Arguments:
+            spans       iterable of (text, style) tuples,
+                        style is a palette entry, SGR string, or None.
+            reset       bool - Return to no style at the end.
+
+        Example::
+
+            render_spans([('a', fg.red), ('b', fg.red + fx.bold), ('c', None)])
+    '''
+    states = {}                                 # style: state, memo
+    current = ()
+    output = []
+    append = output.append
+    for text, style in spans:
+        if text:                                # no need to switch for nada
+            target = states.get(style)
+            if target is None:
+                target = states[style] = (parse_sgr(str(style)) if style
+                                          else ())
+            if target != current:
+                append(transition(current, target))
+                current = target
+            append(text)
+    if reset and current:
+        append(transition(current, ()))
+    return ''.join(output)
+
+
+if __name__ == '__main__':
+
+    from . import fg, bg, fx
+
+    spans = [('Hello ', fg.red), ('World', fg.red + fx.bold), (', ', None),
+             ('how ', bg.blue + fg.red), ('are ', bg.blue), ('you?', fx.dim)]
+    naive = ''.join(style(text) if style else text for text, style in spans)
+    rendered = render_spans(spans)
+
+    print('naive:   ', naive, len(naive), 'chars')
+    print('rendered:', rendered, len(rendered), 'chars')
+    print(repr(rendered))
@@ -0,0 +1,204 @@
+# -*- coding: future_fstrings -*-
+'''
+    .. console - Comprehensive utility library for ANSI terminals.
+    .. © 2018, Mike Miller - Released under the LGPL, version 3+.
+
+    A snapshot of the terminfo capabilities the library uses,
+    taken at once rather than probed one attribute at a time,
+    as a plain dict that serializes to JSON::
+
+        >>> load_snapshot()
+        {'am': True, 'colors': 256, 'cup': '\\x1b[%i%p1%d;%p2%dH', …}
+
+    Snapshots may be cached on disk, under $XDG_CACHE_HOME/console,
+    keyed by TERM and the modification time of its terminfo file,
+    so later sessions skip curses setup until a parameterized capability
+    must be rendered with tparm.  This is opt-in, by setting
+    PY_CONSOLE_TERMINFO_CACHE, as ncurses sets up from a local disk faster
+    than the cache is read, about 0.1 vs 0.3 ms, but it may help where
+    the terminfo database is slow to reach.
+
+    This module is imported early by the package,
+    and so shouldn't import others of the project, besides meta.
+'''
+import json
+import logging
+import os
+import re
+
+import env
+
+from .meta import __version__
+
+
+log = logging.getLogger(__name__)
+
+# flags, numbers, and strings, the latter decoded as latin1:
+bool_capnames = ('am', 'bce', 'ccc', 'km', 'msgr', 'xenl', 'Tc', 'RGB')
+num_capnames = ('colors', 'it', 'pairs')  # not cols, lines: live, by ioctl
+str_capnames = (
+    'bel', 'blink', 'bold', 'civis', 'clear', 'cnorm', 'cr', 'csr',
+    'cub', 'cub1', 'cud', 'cud1', 'cuf', 'cuf1', 'cup', 'cuu', 'cuu1',
+    'cvvis', 'dch', 'dch1', 'dim', 'dl', 'dl1', 'dsl', 'ech', 'ed', 'el',
+    'el1', 'flash', 'fsl', 'home', 'hpa', 'ht', 'ich', 'ich1', 'il', 'il1',
+    'ind', 'indn', 'invis', 'kbs', 'op', 'rc', 'rev', 'ri', 'rin', 'ritm',
+    'rmcup', 'rmkx', 'rmso', 'rmul', 'rs1', 'sc', 'setab', 'setaf', 'sgr0',
+    'sitm', 'smcup', 'smkx', 'smso', 'smul', 'smxx', 'rmxx', 'tsl', 'u6',
+    'u7', 'vpa',
+)
+# searched in order, as ncurses does:
+terminfo_dirs = ('/etc/terminfo', '/lib/terminfo', '/usr/share/terminfo',
+                 '/usr/lib/terminfo', '/usr/share/lib/terminfo',
+                 '/usr/local/share/terminfo', '/opt/homebrew/share/terminfo')
+_snapshot = None
+_is_setup = False
+
+
+def setup():
+    ''' Call curses.setupterm, once, needed before probing and tparm. '''
+    global _is_setup
+    if not _is_setup:
+        from . import _curses
+        _curses.setupterm()
+        _is_setup = True
+
+
+def tparm(template, *args):
+    ''' curses.tparm, setting up the terminal first when needed. '''
+    from . import _curses
+    setup()
+    return _curses.tparm(template, *args)
+
+
+def find_terminfo_file(term=None):
+    ''' Find the compiled terminfo entry of a terminal, by TERM.
+
+        Returns: path str, or None if not found, e.g. built-in on Windows.
+    '''
+    term = term or env.TERM.value
+    if not term:
+        return None
+
+    dirs = []
+    if env.TERMINFO:
+        dirs.append(env.TERMINFO.value)
+    dirs.append(os.path.expanduser('~/.terminfo'))
+    if env.TERMINFO_DIRS:  # an empty entry means the defaults
+        for dirname in env.TERMINFO_DIRS.value.split(':'):
+            dirs.extend([dirname] if dirname else terminfo_dirs)
+    dirs.extend(terminfo_dirs)
+
+    # first char or its hex code as a subdirectory, the latter on macOS:
+    subdirs = (term[0], f'{ord(term[0]):x}')
+    for dirname in dirs:
+        for subdir in subdirs:
+            path = os.path.join(dirname, subdir, term)
+            if os.path.isfile(path):
+                return path
+    return None
+
+
+def _get_cache_path(term):
+    cache_home = env.XDG_CACHE_HOME.value or os.path.expanduser('~/.cache')
+    name = re.sub(r'[^\w.+-]', '_', term)  # safe as a filename
+    return os.path.join(cache_home, 'console', f'terminfo-{name}.json')
+
+
+def take_snapshot():
+    ''' Query the terminfo database for the capabilities above.
+        Those absent are left out.
+
+        Returns: dict
+    '''
+    from . import _curses
+    setup()
+    snapshot = {}
+    for name in bool_capnames:
+        if _curses.tigetflag(name) > 0:             # -1 not a flag, 0 absent
+            snapshot[name] = True
+    for name in num_capnames:
+        value = _curses.tigetnum(name)
+        if value >= 0:                              # -1 absent, -2 not a num
+            snapshot[name] = value
+    for name in str_capnames:
+        value = _curses.tigetstr(name)
+        if value:
+            snapshot[name] = value.decode('latin1')
+    return snapshot
+
+
+def load_snapshot(term=None, cache=None):
+    ''' Returns the capability snapshot of the current terminal, from the
+        disk cache when its terminfo file hasn't changed since,
+        or taking and caching it.  Kept in memory after the first call.
+
+        Arguments:
+            term:   str - for the cache key, defaults to $TERM.
+            cache:  bool - read and write the cache on disk,
+                           defaults to PY_CONSOLE_TERMINFO_CACHE.
+    '''
+    global _snapshot
+    if _snapshot is not None:
+        return _snapshot
+
+    if cache is None:
+        cache = env.PY_CONSOLE_TERMINFO_CACHE.truthy
+    term = term or env.TERM.value or ''
+    path = find_terminfo_file(term) if cache else None
+    mtime = os.stat(path).st_mtime if path else None
+    cache_path = _get_cache_path(term)
+    key = dict(term=term, path=path, mtime=mtime, version=__version__)
+
+    if mtime:
+        try:
+            with open(cache_path, encoding='utf8') as infile:
+                data = json.load(infile)
+            if (isinstance(data, dict) and data.get('key') == key and
+                isinstance(data.get('capabilities'), dict)):  # not mangled
+                _snapshot = data['capabilities']
+                log.debug('terminfo snapshot loaded from %r', cache_path)
+                return _snapshot
+        except (OSError, ValueError) as err:        # missing or corrupt
+            log.debug('terminfo cache unavailable: %s', err)
+
+    _snapshot = take_snapshot()
+    if mtime:
+        try:
+            os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+            temp_path = f'{cache_path}.{os.getpid()}'
+            with open(temp_path, 'w', encoding='utf8') as outfile:
+                json.dump(dict(key=key, capabilities=_snapshot), outfile)
+            os.replace(temp_path, cache_path)       # atomic
+            log.debug('terminfo snapshot saved to %r', cache_path)
+        except OSError as err:
+            log.debug('terminfo cache not saved: %s', err)
+    return _snapshot
+
+
+def get_capability(name):
+    ''' Returns a capability of the current terminal, from the snapshot,
+        or probing terminfo for those not covered by it.
+
+        Returns: str, int, True; or None if absent.
+    '''
+    snapshot = load_snapshot()
+    if name in snapshot:
+        return snapshot[name]
+    if name in bool_capnames or name in num_capnames or name in str_capnames:
+        return None                                 # absent
+
+    from . import _curses
+    setup()
+    value = None
+    if _curses.tigetflag(name) > 0:
+        value = True
+    else:
+        number = _curses.tigetnum(name)
+        if number >= 0:
+            value = number
+        else:
+            string = _curses.tigetstr(name)
+            if string:
+                value = string.decode('latin1')
+    snapshot[name] = value                          # in memory only
+    return value
@@ -5,6 +5,7 @@
 
     Testen-Sie, bitte.  Supported under Linux with a libvte terminal.
 '''
+import sys
 from io import StringIO, UnsupportedOperation
 
 import pytest
@@ -405,6 +406,63 @@ if True:  # fold
                 text = attr(val)
                 assert repr(text) == "'\\x1b[%s%s'" % (val, attr.endcode)
 
+    def test_screen_render_cache():
+        scr = screen.Screen(force=True)
+        hits = []
+        screen.render_hook = lambda template, args, hit: hits.append(hit)
+        try:
+            assert scr.cuf(3) == CSI + '3C'         # builds the table
+            assert scr.cuf(5) == CSI + '5C'
+            assert scr.cuf(500) == CSI + '500C'
+            assert scr.cuf(500) == CSI + '500C'
+            assert scr.move_to(2, 3) == CSI + '4;3H'
+            assert scr.move_to(2, 3) == CSI + '4;3H'
+        finally:
+            screen.render_hook = None
+        assert hits == [False, True, False, True, False, True]
+        assert len(scr.cuf._cache) == screen.TEMPLATE_TABLE_SIZE + 1
+        assert len(scr.move_to._cache) == 1         # no table, two params
+
+    def test_screen_render_cache_terminfo(monkeypatch):
+        ''' tparm takes any count of args, count parameters to seed. '''
+        monkeypatch.setattr(screen, '_tparm', raising=False,
+                            value=lambda template, *args: repr(args).encode())
+        cup = screen._TemplateStringTermInfo(b'\x1b[%i%p1%d;%p2%dH')
+        cuf = screen._TemplateStringTermInfo(b'\x1b[%p1%dC')
+        assert (cup._param_count, cuf._param_count) == (2, 1)
+        assert cup(2, 3) == '(2, 3)'
+        assert cuf(5) == '(5,)'
+        assert len(cup._cache) == 1
+        assert len(cuf._cache) == screen.TEMPLATE_TABLE_SIZE
+
+    def test_screen_frame():
+        writes = []
+        class Stream(StringIO):
+            def write(self, data):
+                writes.append(data)
+                return super().write(data)
+
+        stream = Stream()
+        scr = screen.Screen(stream=stream, force=True)
+        with scr.frame(sync=True) as buffer:
+            buffer.write(scr.move_to(0, 0))
+            buffer.write('Hello')
+            assert not writes
+        assert writes == [f'{CSI}?2026h{CSI}1;1HHello{CSI}?2026l']
+
+        del writes[:]
+        with scr.frame() as buffer:  # not a tty, nor empty frames
+            pass
+        assert not writes
+
+    def test_screen_frame_stdout(capsys):
+        scr = screen.Screen(stream=sys.stdout, force=True)
+        with scr.frame(sync=False):
+            print('Hello')
+            print('World')
+            assert capsys.readouterr().out == ''
+        assert capsys.readouterr().out == 'Hello\nWorld\n'
+
 
 # Utils
 # ----------------------------------------------------------------------------
@@ -462,6 +520,56 @@ if True:  # fold
             text = utils.clear_screen(mode)
             assert text == CSI + str(i) + end
 
+    def test_utils_batch_writer():
+        import os
+        utils.sc = sc
+        read_fd, write_fd = os.pipe()
+        with open(write_fd, 'w', encoding='utf8') as stream:
+            with utils.BatchWriter(stream) as out:
+                utils.clear_screen()
+                utils.set_title('Hi ☺', mode=2)
+                out.write(b'!')
+                assert out.write_count == 0
+            assert out.write_count == 1
+            assert out.bytes_written == 17
+            assert os.read(read_fd, 64).decode('utf8') == (
+                f'{CSI}2J\x1b]2;Hi ☺\x1b\\!'
+            )
+        os.close(read_fd)
+
+        stream = StringIO()  # no fd, over threshold
+        with utils.BatchWriter(stream, flush_threshold=3) as out:
+            out.write('ab')
+            assert stream.getvalue() == ''
+            utils.clear_line()
+            assert stream.getvalue() == f'ab{CSI}2K'
+            out.write('c')
+        assert stream.getvalue() == f'ab{CSI}2Kc'
+        assert out.write_count == 2
+
+    def test_utils_batch_writer_stdout():
+        import threading
+        utils.sc = sc
+        orig_stdout = sys.stdout
+        sys.stdout = stream = StringIO()
+        try:
+            with utils.BatchWriter() as out:
+                utils.set_title('T')
+                print('hello', flush=True)          # in order, deferred
+                assert stream.getvalue() == ''
+
+                def other():                        # not gathered
+                    print('other', end='')
+                thread = threading.Thread(target=other)
+                thread.start()
+                thread.join()
+                assert stream.getvalue() == 'other'
+            assert sys.stdout is stream
+        finally:
+            sys.stdout = orig_stdout
+        assert stream.getvalue() == 'other\x1b]0;T\x1b\\hello\n'
+        assert out.write_count == 1
+
     #~ def test_notify_progress():  # only on windows
         #~ cases = (
             #~ (-1, '\x1b]9;4;2;99\x1b\\'),
@@ -503,10 +611,141 @@ if True:  # fold
         assert ('-C0-TEXT- | -C1-Text- |  |  | -OSC-C1-\x9d END'
                 == utils.strip_ansi(txt, c1=True, osc=True))
 
+    def test_strip_ansi_linear():
+        ''' Unterminated sequences don't make it scan to the end each time. '''
+        import time
+        text = '\x1b]0;truncated ' * 20000
+        start = time.perf_counter()
+        assert utils.strip_ansi(text, c1=True, osc=True) == text
+        assert time.perf_counter() - start < .5  # quadratic took minutes
+
+        osc = '\x1b]52;c;' + 'A' * 100 + '\a'
+        assert utils.strip_ansi(osc + 'x', osc=True) == 'x'
+        assert utils.strip_ansi(osc + 'x', osc=True, max_osc_len=50) == osc + 'x'
+        assert utils.strip_ansi(osc + 'x', osc=True, max_osc_len=None) == 'x'
+        assert utils.strip_ansi('\x9d0;title\x9c!', c1=True, osc=True) == '!'
+
+    def test_strip_ansi_incremental():
+        from io import BytesIO
+        text = ('\x1b[1;31mHello\x1b[0m, \x1b]8;;http://x.org\x1b\\World'
+                '\x1b]8;;\x1b\\ é\x1b[')  # unfinished
+        expected = 'Hello, World é\x1b['
+        assert utils.strip_ansi(text, osc=True) == expected
+        for size in (1, 2, 3, 7):
+            chunks = [text[i:i+size] for i in range(0, len(text), size)]
+            stripper = utils.AnsiStripper(osc=True)
+            assert ''.join(stripper(chunks)) == expected
+
+            data = BytesIO(text.encode('utf8'))  # bytes, not decoded
+            result = b''.join(stripper(data, chunk_size=size))
+            assert result == expected.encode('utf8')
+
+        stripper = utils.AnsiStripper()
+        assert stripper.strip('ab\x1b[3') == 'ab'
+        assert stripper.strip('1mcd') == 'cd'
+        assert stripper.flush() is None
+
+    def test_strip_ansi_file(tmp_path):
+        from io import BytesIO
+        line = 'a\x1b[1;31mé\x1b[0m \x1b]0;title\a\x1b[38;2;255;0;0mb\n'
+        infile = tmp_path / 'in.txt'
+        infile.write_bytes((line * 50 + 'end').encode('utf8'))
+
+        outfile = tmp_path / 'out.txt'  # split into many chunks, two workers
+        count = utils.strip_ansi_file(str(infile), str(outfile), workers=2,
+                                      osc=True, chunk_size=64)
+        expected = ('aé b\n' * 50 + 'end').encode('utf8')
+        assert outfile.read_bytes() == expected
+        assert count == len(expected)
+
+        result = BytesIO()
+        utils.downgrade_ansi_file(str(infile), result, workers=1,
+                                  level='basic', chunk_size=64)
+        expected = utils.downgrade_ansi(line * 50 + 'end', TermLevel.ANSI_BASIC)
+        assert result.getvalue() == expected.encode('utf8')
+
+        infile.write_bytes(('ěA ě\x9bm\n' * 20).encode('utf8'))  # c1 too
+        count = utils.strip_ansi_file(str(infile), str(outfile), workers=1,
+                                      c1=True, chunk_size=16)
+        expected = utils.strip_ansi('ěA ě\x9bm\n' * 20, c1=True)
+        assert expected == 'ěA ě\n' * 20
+        assert outfile.read_bytes() == expected.encode('utf8')
+
+        (tmp_path / 'empty.txt').touch()
+        assert utils.strip_ansi_file(str(tmp_path / 'empty.txt'),
+                                     str(outfile)) == 0
+
     def test_strip_ansi_len():
         text = 'Hang \x1b[34;4;5mLoose\x1b[0m, Hawaii'
         assert utils.len_stripped(text) == 18
 
+    def test_display_width():
+        width = utils.display_width
+        assert width('Hang Loose') == 10
+        assert width('Hang \x1b[34;4;5mLoose\x1b[0m, Hawaii') == 18
+        assert width('\x1b]2;title\a日本') == 4        # wide, OSC unseen
+        assert width('ｆｕｌｌ') == 8
+        assert width('cafe\u0301') == 4               # combining accent
+        assert width('😎 ok') == 5
+        assert width('\u2764\ufe0f') == 2              # emoji presentation
+        assert width('👨\u200d👩\u200d👧') == 2          # ZWJ sequence
+        assert width('\x1b[1m日本\x1b[0m') == 4        # again, cached
+
+    def test_optimize_ansi():
+        text = (fg.red('ab') + fg.red('cd') + fx.dim('ef') +
+                f'{CSI}1m{CSI}0m{CSI}2K' + fg.red(fx.b('g')))
+        result = utils.optimize_ansi(text)
+        assert result == (f'{CSI}31mabcd{CSI}0;2mef{CSI}m{CSI}2K'
+                          f'{CSI}1;31mg{CSI}m')
+        assert utils.strip_ansi(result) == utils.strip_ansi(text)
+        assert utils.optimize_ansi('plain') == 'plain'
+        assert utils.optimize_ansi(f'{CSI}1m') == f'{CSI}1m'  # end state kept
+
+        for size in (1, 2, 5):  # sequences split across chunks
+            chunks = [text[i:i+size] for i in range(0, len(text), size)]
+            assert ''.join(utils.optimize_ansi_stream(chunks)) == result
+
+    def test_optimize_ansi_minimal():
+        ''' Already minimal input should never come out longer. '''
+        from random import Random
+        samples = [f'{CSI}1ma{CSI}m', f'{CSI}31mx{CSI}39my', f'{CSI}1;31mx',
+                   f'{CSI}mx', f'a{CSI}2mb{CSI}22;1mc{CSI}m']
+        rand = Random(5)
+        codes = ('', '0', '1', '2', '22', '31', '39', '1;31', '48;5;22', '49')
+        for _ in range(200):
+            text = ''.join(f'{CSI}{rand.choice(codes)}m' + 'ab'[:rand.randrange(3)]
+                           for _ in range(rand.randrange(1, 8)))
+            samples.append(utils.optimize_ansi(text))   # minimal by now
+        for text in samples:
+            assert len(utils.optimize_ansi(text)) <= len(text), repr(text)
+
+    def test_downgrade_ansi():
+        text = (f'a{CSI}1;38;2;255;0;0mb{CSI}0m {CSI}48:2::0:0:200;58:5:196m'
+                f'c{CSI}38;5;240md{CSI}m')
+        results = {
+            TermLevel.DUMB: 'ab cd',
+            TermLevel.ANSI_MONOCHROME: f'a{CSI}1mb{CSI}0m cd{CSI}m',
+            TermLevel.ANSI_BASIC: f'a{CSI}1;91mb{CSI}0m {CSI}44mc{CSI}90md'
+                                  f'{CSI}m',
+            TermLevel.ANSI_EXTENDED: f'a{CSI}1;38;5;9mb{CSI}0m '
+                                     f'{CSI}48:5:20;58:5:196mc{CSI}38;5;240md'
+                                     f'{CSI}m',
+            TermLevel.ANSI_DIRECT: text,
+        }
+        for level, result in results.items():
+            assert utils.downgrade_ansi(text, level) == result
+            chunks = [text[i:i+3] for i in range(0, len(text), 3)]
+            assert ''.join(utils.downgrade_ansi_stream(chunks, level)) == result
+
+    def test_downgrade_ansi_edges():
+        assert utils._get_term_level('dumb') is TermLevel.DUMB  # falsy
+        assert utils._get_term_level('basic') is TermLevel.ANSI_BASIC
+        with pytest.raises(ValueError):
+            utils._get_term_level('nope')
+
+        for text in (f'{CSI}38;5;300mx', f'{CSI}48:5:999mx'):  # out of range
+            assert utils.downgrade_ansi(text, TermLevel.ANSI_BASIC) == text
+
     def test_set_cwd():
         utils._ansi_capable = True  # force for make
         result = utils.notify_cwd('/foo/bar/baz')
@@ -755,6 +994,45 @@ if True:  # fold
                   '\x1b[42;1m 1, 2, 3. \x1b[0m\n')
         assert result == outf.getvalue()
 
+    def test_context_mgr_stdout_replaced():
+        ''' Leaving the block shouldn't trip over a stdout set within it. '''
+        from contextlib import redirect_stdout
+        orig_stdout = sys.stdout
+        entry = fg.blue + fx.b
+        try:
+            with entry as writer:
+                print('styled')
+                with redirect_stdout(StringIO()):
+                    pass
+                other = sys.stdout = StringIO()     # not restored
+            assert writer.stream is orig_stdout
+            assert sys.stdout is other              # left alone
+        finally:
+            sys.stdout = orig_stdout
+
+    def test_context_mgr_buffered():
+        ''' A write is styled per line yet issued once; threshold buffers. '''
+        from .core import _LineWriter
+
+        outf = _LineWriter(str(fg.red), StringIO(), fg.red.default)
+        print('one\ntwo\nthree', file=outf)
+        assert outf.getvalue() == fg.red('one\ntwo\nthree') + '\n'
+        assert outf.write_count == 2  # print writes end separately
+
+        outf = _LineWriter(str(fg.red), StringIO(), fg.red.default,
+                           flush_threshold=1000)
+        for i in range(10):
+            print(i, file=outf)
+        assert outf.write_count == 0
+        print('x' * 1000, file=outf)
+        assert outf.write_count == 1
+        assert outf.bytes_written == len(outf.getvalue())
+        print('tail', file=outf)
+        outf.flush()
+        assert outf.write_count == 2
+        assert outf.getvalue() == fg.red('\n'.join(map(str, range(10))) +
+                                         '\n' + 'x' * 1000 + '\ntail') + '\n'
+
     def test_find_nearest_color_index():
         from .proximity import find_nearest_color_index
         values = (
@@ -796,6 +1074,129 @@ if True:  # fold
         for val in values:
             assert find_nearest_color_hexstr(val[0]) == val[1]
 
+    def test_find_nearest_color_index_lut():
+        ''' Lookup tables should agree with a full scan of the table. '''
+        from random import Random
+        from .proximity import (color_table4, color_table8,
+                                find_nearest_color_index)
+
+        def scan(r, g, b, table):
+            distances = [(r - cr) ** 2 + (g - cg) ** 2 + (b - cb) ** 2
+                         for cr, cg, cb in table]
+            return distances.index(min(distances))  # first, on a tie
+
+        rand = Random(7)
+        for table in (color_table8, color_table4):
+            for _ in range(2000):
+                rgb = rand.randrange(256), rand.randrange(256), rand.randrange(256)
+                assert find_nearest_color_index(*rgb, color_table=table) == (
+                    scan(*rgb, table))
+
+    def test_lut_cache_dir(tmp_path):
+        from . import proximity as px
+        try:
+            px.build_color_tables(color_tables.xterm_palette4,
+                                  lookup_tables=True, cache_dir=str(tmp_path))
+            files = list(tmp_path.iterdir())
+            assert len(files) == 2  # one per table
+            built = px._lookup_tables[id(px.color_table8)]
+
+            px.build_color_tables(color_tables.xterm_palette4,
+                                  lookup_tables=True, cache_dir=str(tmp_path))
+            assert px._lookup_tables[id(px.color_table8)] == built  # loaded
+            assert len(list(tmp_path.iterdir())) == 2
+        finally:
+            px.build_color_tables(color_tables.xterm_palette4)
+
+    def test_find_nearest_color_indexes():
+        from . import proximity as px
+
+        colors = [(0, 0, 0), (16, 16, 16), (176, 0, 176), (233, 84, 32),
+                  (255, 255, 255), (0, 0, 0)]
+        for table in (px.color_table8, px.color_table4):
+            expected = [px.find_nearest_color_index(*color, color_table=table)
+                        for color in colors]
+            result = px._find_nearest_indexes_python(colors, table)
+            assert list(result) == expected
+            try:
+                import numpy
+            except ImportError:
+                continue
+            result = px._find_nearest_indexes_numpy(numpy, colors, table)
+            assert result.tolist() == expected
+            result = px.find_nearest_color_indexes(  # keeps shape
+                numpy.array(colors).reshape(2, 3, 3), color_table=table)
+            assert result.shape == (2, 3)
+            assert result.ravel().tolist() == expected
+
+    def test_ciede2000():
+        from .proximity import _ciede2000_distance
+        values = (  # Sharma, Wu, Dalal test data
+            ((50, 2.6772, -79.7751), (50, 0, -82.7485), 2.0425),
+            ((50, 2.5, 0), (73, 25, -18), 27.1492),
+            ((50, -1, 2), (50, 0, 0), 2.3669),
+            ((2.0776, 0.0795, -1.135), (0.9033, -0.0636, -0.5514), 0.9082),
+        )
+        for lab1, lab2, expected in values:
+            assert round(_ciede2000_distance(lab1, lab2), 4) == expected
+
+    def test_find_nearest_color_index_methods():
+        from .proximity import (color_table4, distance_methods,
+                                find_nearest_color_index)
+        for method in distance_methods:  # obvious ones should agree
+            assert find_nearest_color_index(0, 0, 0, method=method) == 0
+            assert find_nearest_color_index(255, 255, 255, method=method) == 15
+            assert find_nearest_color_index(
+                255, 0, 0, color_table=color_table4, method=method) == 9
+
+        # memoized, same result again:
+        for i in range(2):
+            assert find_nearest_color_index(100, 149, 237, method='oklab') == 68
+            assert find_nearest_color_index(233, 84, 32, method='ciede2000') == 202
+
+        with pytest.raises(ValueError):
+            find_nearest_color_index(1, 2, 3, method='bogus')
+
+    def test_find_nearest_color_index_method_tables():
+        ''' Cell tables and the narrowed ciede2000 search should agree with
+            a full scan, done on a copy, as only palette tables are indexed.
+        '''
+        from random import Random
+        from . import proximity as px
+
+        rand = Random(11)
+        colors = [(rand.randrange(256), rand.randrange(256), rand.randrange(256))
+                  for _ in range(300)]
+        colors += [(0, 0, 0), (255, 255, 255), (7, 128, 248), (8, 127, 255)]
+        for table in (px.color_table8, px.color_table4):
+            copy = list(table)
+            for method in ('redmean', 'cielab', 'oklab', 'ciede2000'):
+                for rgb in colors:
+                    assert px.find_nearest_color_index(
+                        *rgb, color_table=table, method=method) == (
+                        px.find_nearest_color_index(
+                            *rgb, color_table=copy, method=method))
+            try:
+                import numpy
+            except ImportError:
+                continue
+            for method in px.distance_methods:  # vectorized, as one by one
+                expected = [px.find_nearest_color_index(
+                            *rgb, color_table=table, method=method)
+                            for rgb in colors]
+                assert px.find_nearest_color_indexes(
+                    numpy.array(colors), color_table=table, method=method,
+                ).tolist() == expected
+
+    def test_downgrade_method():
+        fge = style.ForegroundPalette(level=TermLevel.ANSI_EXTENDED,
+                                      downgrade_method='oklab')
+        assert str(fge.cornflowerblue) == CSI + '38;5;68m'
+
+        with pytest.raises(ValueError):
+            style.ForegroundPalette(level=TermLevel.ANSI_EXTENDED,
+                                    downgrade_method='bogus')
+
     def test_compute_attr_created_once():
         ''' Attributes should only be created once. '''
         attrid1 = id(fg.t_ff00ff)
@@ -806,6 +1207,178 @@ if True:  # fold
         assert attrid1 == attrid2
         assert attrid3 == attrid4
 
+    def test_palette_cache_bounded():
+        ''' Computed entries are evicted LRU-first, basic ones pinned. '''
+        pal = style.ForegroundPalette(level=TermLevel.THE_FULL_MONTY,
+                                      cache_size=2)
+        red = pal.red
+        first = pal.t_111
+        pal.t_222
+        assert pal.t_111 is first               # hit, now most recent
+        pal.t_333                               # evicts t_222
+        assert set(pal._cache) == {'t_111', 't_333'}
+        assert pal._cache_info() == (1, 3, 2, 2)
+        assert pal.red is red                   # never evicted
+
+        pal._clear()
+        assert pal._cache_info() == (0, 0, 2, 0)
+        assert pal.red is red
+
+        pal = style.ForegroundPalette(level=TermLevel.THE_FULL_MONTY,
+                                      cache_size=3)
+        for i in range(5):                      # repeated attribute lookups
+            pal.t_aaaaaa
+            assert pal._cache_info().hits == i
+        recent = pal.t_bbbbbb
+        for name in ('t_cccccc', 't_dddddd', 't_eeeeee', 't_ffffff'):
+            assert pal.t_bbbbbb is recent       # kept in use, survives
+            getattr(pal, name)
+        assert 't_bbbbbb' in pal._cache and 't_aaaaaa' not in pal._cache
+        assert pal._cache_info() == (8, 6, 3, 3)
+
+    def test_palette_unknown_names():
+        ''' Prefix dispatch falls through to bare names, misses are cached. '''
+        pal = style.ForegroundPalette(level=TermLevel.THE_FULL_MONTY,
+                                      cache_size=2)
+        assert str(pal.tan) == CSI + '38;2;210;180;140m'  # not t_ hex
+        assert str(pal.indigo) == CSI + '38;2;75;0;130m'  # not i_ index
+        assert str(pal.LightGoldenrod) == str(pal.x_lightgoldenrod)  # X11
+
+        for name in ('i_1234', 'n_bb', 'x_no', 'w_notacolor', 'nope', 'i²'):
+            with pytest.raises(AttributeError):
+                getattr(pal, name)
+        misses = pal._cache_info().misses
+        with pytest.raises(AttributeError, match='not a recognized'):
+            pal.nope                                # fast, from cache
+        assert pal._cache_info().misses == misses
+        assert len(pal._unknown) == 2               # bounded
+
+        pal._clear()
+        assert not pal._unknown
+
+    def test_palette_numeric_forms():
+        ''' Index and rgb forms match their attribute counterparts. '''
+        assert str(fg[196]) == str(fg.i196) == CSI + '38;5;196m'
+        assert fg[196] is fg[196]
+        assert str(bg.rgb(187, 0, 187)) == str(bg.t_bb00bb)
+        assert bg.rgb(187, 0, 187) is bg.hex(0xbb00bb) is bg.hex('#b0b')
+        assert bg.rgb(187, 0, 187).name == bg.t_bb00bb.name
+
+        for args in ((256, 0, 0), (0, -1, 0)):
+            with pytest.raises(ValueError):
+                fg.rgb(*args)
+        for value in ('#bb00b', 'xyz', 0x1000000):
+            with pytest.raises(ValueError):
+                fg.hex(value)
+        for index in (-1, 256):
+            with pytest.raises(IndexError):
+                fg[index]
+
+        pal = style.ForegroundPalette(level=TermLevel.ANSI_BASIC)
+        assert str(pal[196]) == str(pal.i196) == CSI + '91m'
+        assert str(pal.rgb(0, 0, 200)) == str(pal.t_0000c8) == CSI + '34m'
+
+        from .disabled import empty, empty_bin
+        assert empty_bin[196] is empty_bin.rgb(1, 2, 3) is empty
+
+    def test_palette_entry_compact():
+        ''' Slotted entries: pre-rendered, smaller and faster to str()
+            than they were.
+        '''
+        import tracemalloc
+        from timeit import Timer
+        from .core import _PaletteEntry
+
+        class LegacyEntry:  # prior to slots, with an instance dict
+            def __init__(self, parent, name, code, stream=sys.stdout):
+                self._parent = parent
+                self.name = name
+                self._stream = stream
+                self._codes = [str(code)]
+                self.default = parent.default
+
+            def __str__(self):  # rendered every time
+                return f'{CSI}{";".join(self._codes)}m'
+
+        def measure(entry_class, count):
+            parent = style.ForegroundPalette(level=TermLevel.THE_FULL_MONTY)
+            codes = [f'38;5;{i % 256}' for i in range(count)]
+            tracemalloc.start()
+            try:
+                start = tracemalloc.get_traced_memory()[0]
+                entries = [entry_class(parent, 'NAME', code) for code in codes]
+                used = tracemalloc.get_traced_memory()[0] - start
+            finally:
+                tracemalloc.stop()
+            return used / count, entries
+
+        entry = fg.t_123456
+        with pytest.raises(AttributeError):
+            entry.__dict__
+        assert str(entry) is str(entry)  # not rendered again
+        assert entry.default == CSI + '39m'
+        assert (fx.b + fg.red).default == CSI + '0m'
+
+        legacy_size, legacy_entries = measure(LegacyEntry, 1000)
+        size, entries = measure(_PaletteEntry, 1000)
+        assert size < legacy_size
+        assert str(entries[1]) == CSI + '38;5;1m'
+        assert [str(entry) for entry in entries] == [  # same output
+                str(entry) for entry in legacy_entries]
+
+        def throughput(entries):  # best of several, against noise
+            return min(Timer(lambda: [str(entry) for entry in entries]
+                             ).repeat(5, 10))
+        assert throughput(entries) < throughput(legacy_entries)
+
+    def test_palette_entry_interned():
+        ''' Repeated additions share a sequence, not the entry. '''
+        from . import core
+
+        style = fx.dim + fg.green
+        other = fx.dim + fg.green
+        assert style is not other
+        assert style._sequence is other._sequence
+        assert str(style) == CSI + '2;32m'
+        assert style.default == CSI + '0m'      # different classes
+        assert (fg.red + fg.blue).default == CSI + '39m'  # same class
+        assert str(fx.dim + fg.green + bg.blue) == CSI + '2;32;44m'
+        assert str(fg.green + fx.dim) == CSI + '32;2m'  # order matters
+
+        buffer = StringIO()                     # redirection isn't shared
+        orig_stdout = sys.stdout
+        style.set_output(buffer)
+        try:
+            assert other._stream is not buffer
+            assert (fx.dim + fg.green)._stream is not buffer
+        finally:
+            sys.stdout = orig_stdout
+
+        core._composites.clear()
+        assert str(fx.dim + fg.green) == str(style)
+        assert len(core._composites) == 1
+
+    def test_palette_entry_stream():
+        ''' Chunked styling matches the call form, lines span chunks. '''
+        import io
+
+        text = 'x' * 5000 + '\nlate newline\n\nend'  # past old search limit
+        expected = fg.red(text)
+        assert expected.count(CSI + '31m') == 4
+        assert ''.join(fg.red.stream([text])) == expected
+        assert ''.join(fg.red.stream(io.StringIO(text), chunk_size=7)) == expected
+        assert ''.join(fg.red.stream(['a\n', 'b\n'])) == fg.red('a\nb') + '\n'
+        assert list(fg.red.stream([])) == []
+        with pytest.raises(TypeError):  # binary, would never see ''
+            list(fg.red.stream(io.BytesIO(b'abc')))
+        with pytest.raises(TypeError):
+            fg.red.stream(io.BytesIO(b'abc'), file=io.StringIO())
+
+        out = io.StringIO()
+        written = (fg.red + fx.b).stream(['a', 'b\nc'], file=out)
+        assert out.getvalue() == (fg.red + fx.b)('ab\nc')
+        assert written == len(out.getvalue())
+
     def test_style_plus_call_construct():
         ''' test warning on inefficient/problematic form '''
         import warnings
@@ -933,3 +1506,241 @@ if True:  # fold
 
         assert result == expected
         assert len(result) == columns + _ansi_chars
+
+
+# SGR state
+# ----------------------------------------------------------------------------
+if True:  # fold
+    from . import sgr
+
+    def test_sgr_parse():
+        assert sgr.parse_sgr(str(fx.b + fg.i196)) == (('bold', '1'),
+                                                     ('fg', '38;5;196'))
+        assert sgr.parse_sgr(f'{CSI}1;2;31m{CSI}22;2m') == (('dim', '2'),
+                                                            ('fg', '31'))
+        assert sgr.parse_sgr(str(bg.t_010203 + fx.curly_underline)) == (
+            ('underline', '4:3'), ('bg', '48:2::1:2:3'))
+        assert sgr.parse_sgr(f'{CSI}1;31m{CSI}m') == ()
+
+    def test_sgr_transition():
+        red, bold_red = sgr.parse_sgr(str(fg.red)), sgr.parse_sgr(
+                                                    str(fg.red + fx.b))
+        assert sgr.transition(red, red) == ''
+        assert sgr.transition(red, bold_red) == CSI + '1m'
+        assert sgr.transition(bold_red, red) == CSI + '22m'
+        assert sgr.transition(bold_red, ()) == CSI + 'm'
+        both = sgr.parse_sgr(f'{CSI}1;2;31m')  # 22 clears both, re-set dim
+        assert sgr.transition(both, sgr.parse_sgr(f'{CSI}2;31m')) == (
+                                                                CSI + '22;2m')
+
+    def test_sgr_render_spans():
+        spans = [('a', fg.red), ('b', fg.red), ('c', fg.red + fx.b),
+                 ('', fg.blue), ('d', None), ('e', fx.dim)]
+        result = sgr.render_spans(spans)
+        assert result == f'{CSI}31mab{CSI}1mc{CSI}md{CSI}2me{CSI}m'
+        assert len(result) < len(''.join(style(text) if style else text
+                                         for text, style in spans))
+        tracker = sgr.SGRTracker()
+        tracker.update(str(fg.red + bg.i22 + fx.b))
+        assert (tracker.fg, tracker.bg, tracker.effects) == ('31', '48:5:22',
+                                                             ('1',))
+
+
+# Fitting styled text
+# ----------------------------------------------------------------------------
+if True:  # fold
+    from . import text as ansitext
+
+    def test_text_slice():
+        text = fg.red('Hello ') + fx.b('World')
+        assert ansitext.slice(text, 6) == fx.b('World')
+        assert ansitext.slice(text, 3, 8) == f'{CSI}31mlo {CSI}39m{CSI}1mWo{CSI}m'
+        assert ansitext.slice('日本語', 1, 4) == ' 本'  # half a wide char
+
+    def test_text_truncate():
+        text = f'{CSI}1;31mbold red{CSI}0m text'
+        assert ansitext.truncate(text, 13) == text  # fits
+        assert ansitext.truncate(text, 6) == f'{CSI}1;31mbold …{CSI}m'
+        assert ansitext.truncate(text, 6, '') == f'{CSI}1;31mbold r{CSI}m'
+        assert ansitext.truncate('日本語', 4) == '日 …'  # to the column
+        assert ansitext.truncate('abc', 2, ellipsis='...') == '..'  # cut too
+        assert ansitext.truncate('日本語', 2, ellipsis='...') == '..'
+        assert ansitext.truncate('abc', 3, ellipsis='...') == 'abc'  # fits
+
+    def test_text_pad():
+        text = fg.red('日本')
+        assert ansitext.ljust(text, 6, '.') == text + '..'
+        assert ansitext.rjust(text, 6) == '  ' + text
+        assert ansitext.center(text, 7) == '  ' + text + ' '
+        assert ansitext.center('ab', 5) == 'ab'.center(5)
+
+    def test_text_wrap():
+        text = f'{CSI}1;31mbold red text that wraps{CSI}0m plain'
+        assert ansitext.wrap(text, 9) == [
+            f'{CSI}1;31mbold red{CSI}m',        # styles carried over
+            f'{CSI}1;31mtext that{CSI}m',
+            f'{CSI}1;31mwraps{CSI}0m',
+            'plain',
+        ]
+        assert ansitext.wrap('abcdefg hi\njk', 3) == ['abc', 'def', 'g',
+                                                      'hi', 'jk']
+        assert ansitext.wrap('中文', 1) == ['中', '文']  # too wide, alone
+        assert ansitext.wrap('a中', 1) == ['a', '中']
+
+    def test_text_hyperlinks():
+        ''' Links open at a cut are closed, and reopened on the next line. '''
+        link, end = '\x1b]8;;http://x.org\x1b\\', '\x1b]8;;\x1b\\'
+        text = f'{link}{CSI}1mlink text{CSI}m{end} after'
+        assert ansitext.truncate(text, 3) == f'{link}{CSI}1mli…{CSI}m{end}'
+        assert ansitext.slice(text, 5, 8) == f'{CSI}1m{link}tex{CSI}m{end}'
+        assert ansitext.slice(text, 10) == 'after'          # closed before
+        assert ansitext.wrap(text, 4)[:2] == [
+            f'{link}{CSI}1mlink{CSI}m{end}',
+            f'{CSI}1m{link}text{CSI}m{end}',
+        ]
+        bell_link = '\x1b]8;;http://x.org\a'                # same terminator
+        assert ansitext.wrap(f'{bell_link}ab cd', 2) == [
+            f'{bell_link}ab\x1b]8;;\a', f'{bell_link}cd\x1b]8;;\a']
+
+
+# Tokenizer
+# ----------------------------------------------------------------------------
+if True:  # fold
+    from .tokens import Token, tokenize, tokenize_stream
+
+    def test_tokenize():
+        text = (f'{CSI}1;;38:5:196mHi{CSI}0m\x1b]8;;http://x.org\x1b\\'
+                f'{CSI}?25l\x1b(B{CSI}')  # unfinished
+        expected = [
+            Token('csi', f'{CSI}1;;38:5:196m', (1, None, (38, 5, 196)), 'm'),
+            Token('text', 'Hi', (), ''),
+            Token('csi', f'{CSI}0m', (0,), 'm'),
+            Token('osc', '\x1b]8;;http://x.org\x1b\\', (';http://x.org',), '8'),
+            Token('csi', f'{CSI}?25l', (25,), '?l'),
+            Token('esc', '\x1b(B', (), '(B'),
+            Token('text', CSI, (), ''),
+        ]
+        assert list(tokenize(text)) == expected
+        assert [token.kind for token in tokenize(text.encode('utf8'))] == [
+            token.kind for token in expected]
+        assert list(tokenize('\x9b2J\x85', c1=True)) == [
+            Token('csi', '\x9b2J', (2,), 'J'), Token('c1', '\x85', (), '\x85')]
+        assert list(tokenize('\x9b2J')) == [Token('text', '\x9b2J', (), '')]
+
+    def test_tokenize_stream():
+        from io import BytesIO
+        text = f'a{CSI}1mb\x1b]0;title\x1b\\c{CSI}'
+        expected = [token for token in tokenize(text)]
+        for size in (1, 2, 5):
+            chunks = [text[i:i+size] for i in range(0, len(text), size)]
+            tokens = list(tokenize_stream(chunks))
+            assert [token for token in tokens if token.kind != 'text'] == [
+                token for token in expected if token.kind != 'text']
+            assert ''.join(token.data for token in tokens) == text
+
+            data = BytesIO(text.encode('utf8'))
+            tokens = list(tokenize_stream(data, chunk_size=size))
+            assert b''.join(token.data for token in tokens) == data.getvalue()
+            assert [token.command for token in tokens if token.kind != 'text'
+                    ] == ['m', '0']
+
+
+# Frame buffer
+# ----------------------------------------------------------------------------
+if True:  # fold
+    from .framebuffer import FrameBuffer
+
+    def test_framebuffer_diff():
+        stream = StringIO()
+        frame = FrameBuffer(20, 3, stream=stream, screen=sc)
+        frame.put(0, 0, 'Hello World', fg.green)
+        frame.put(2, 1, '日本x')
+        count = frame.flush()
+        assert stream.getvalue() == (f'{CSI}m{CSI}2J{CSI}H{CSI}32m'
+                                     f'Hello World{CSI}2;3H{CSI}m日本x')
+        assert count == frame.frame_bytes == len(stream.getvalue().encode())
+
+        stream.seek(0); stream.truncate()
+        frame.put(6, 0, 'Earth', fg.green)      # 'r' is rewritten, cheaper
+        frame.put(4, 1, 'a')                    # over half of a wide char
+        assert frame.flush() == len(stream.getvalue())
+        assert stream.getvalue() == (f'{CSI}A\b{CSI}32mEarth'
+                                     f'{CSI}2;5H{CSI}ma ')
+        assert frame.flush() == 0               # nothing changed
+        assert frame.frame_count == 3
+
+    def test_framebuffer_erase():
+        stream = StringIO()
+        frame = FrameBuffer(20, 2, stream=stream, screen=sc)
+        frame.flush()
+        stream.seek(0); stream.truncate()
+        frame.fill(0, 1, 10, 1, style=bg.blue)  # erased, not written
+        frame.fill(12, 1, style=bg.blue)        # to the end of the line
+        frame.flush()
+        assert stream.getvalue() == (f'{CSI}2H{CSI}44m{CSI}10X'
+                                     f'{CSI}12C{CSI}K')  # ECH doesn't move
+
+
+# Cursor planner
+# ----------------------------------------------------------------------------
+if True:  # fold
+    from .cursor import CursorPlanner
+
+    def test_cursor_planner():
+        cursor = CursorPlanner(sc)
+        assert cursor.move_to(4, 5) == f'{CSI}6;5H'     # position unknown
+        assert cursor.move_to(4, 5) == ''
+        cursor.advance('Hello')
+        assert cursor.move_to(12, 5) == f'{CSI}3C'
+        assert cursor.move_to(10, 5) == '\b\b'
+        assert cursor.move_to(0, 6) == f'{CSI}E'
+        assert cursor.move_to(0, 3) == f'{CSI}4H'        # ties absolute
+        assert cursor.move_to(30, 3) == f'{CSI}30C'
+        assert cursor.move_to(5, 3) == f'{CSI}6G'
+        assert cursor.move_to(70, 20) == f'{CSI}21;71H'
+        assert (cursor.bytes_planned, cursor.bytes_absolute) == (36, 55)
+
+        cursor = CursorPlanner(sc, 78, 0, width=80)
+        cursor.advance('日')                            # wrap pending
+        assert cursor.move_to(0, 1) == f'{CSI}2H'
+
+
+# Terminfo
+# ----------------------------------------------------------------------------
+if True:  # fold
+    from . import terminfo
+
+    def test_terminfo_snapshot(monkeypatch, tmp_path):
+        import console, json
+        curses = pytest.importorskip('curses')
+        monkeypatch.setattr(console, '_curses', curses, raising=False)
+        monkeypatch.setattr(terminfo, '_snapshot', None)
+        monkeypatch.setattr(terminfo, '_is_setup', False)
+        monkeypatch.setenv('XDG_CACHE_HOME', str(tmp_path))
+        monkeypatch.setenv('TERM', 'xterm')
+        if not terminfo.find_terminfo_file():
+            pytest.skip('xterm terminfo entry not found')
+
+        snapshot = terminfo.load_snapshot(cache=True)
+        assert snapshot['cup'] == '\x1b[%i%p1%d;%p2%dH'
+        assert snapshot['am'] is True
+        assert 'lines' not in snapshot                  # live, not cached
+        assert json.loads(json.dumps(snapshot)) == snapshot
+        assert (tmp_path / 'console' / 'terminfo-xterm.json').exists()
+
+        # a later session loads it, without curses setup:
+        monkeypatch.setattr(terminfo, '_snapshot', None)
+        monkeypatch.setattr(terminfo, '_is_setup', False)
+        assert terminfo.load_snapshot(cache=True) == snapshot
+        assert not terminfo._is_setup
+        assert terminfo.get_capability('cuf') == '\x1b[%p1%dC'
+        assert terminfo.get_capability('smxx') in (None, '\x1b[9m')
+        assert not terminfo._is_setup
+
+        # valid JSON of another shape is retaken, not an error:
+        cache_path = tmp_path / 'console' / 'terminfo-xterm.json'
+        key = json.loads(cache_path.read_text())['key']
+        for data in ([1, 2], dict(key=key), dict(key=key, capabilities=[])):
+            cache_path.write_text(json.dumps(data))
+            monkeypatch.setattr(terminfo, '_snapshot', None)
+            assert terminfo.load_snapshot(cache=True)['cup'] == snapshot['cup']
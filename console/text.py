@@ -0,0 +1,320 @@
+# -*- coding: future_fstrings -*-
+'''
+    .. console - Comprehensive utility library for ANSI terminals.
+    .. © 2018, Mike Miller - Released under the LGPL, version 3+.
+
+    Functions to fit styled text into columns—wrap, truncate, pad and slice
+    it—measured in terminal columns rather than characters,
+    without losing its styles.
+
+    Each works in one pass over the text and its escape sequences,
+    tracking the SGR state and any open hyperlink along the way,
+    so both carry over to the pieces and none are left "open" at the end.
+    Other sequences, e.g. titles, are passed through when in range.
+'''
+import re
+
+from .sgr import parse_sgr, sgr_finder, transition
+from .utils import (MAX_OSC_LEN, _ansi_csi0_pattern, _ansi_osc0_pattern,
+                    _iter_char_widths, display_width)
+
+
+# text & sequences alternate in the result of split, text at even indexes:
+_sequence_splitter = re.compile(
+    f'({_ansi_csi0_pattern}|{_ansi_osc0_pattern % MAX_OSC_LEN})'
+)
+
+
+_link_finder = re.compile(r'\x1b\]8;[^;\a\x1b]*;([^\a\x1b]*)(\a|\x1b\\)')
+
+
+def _is_simple(part):
+    ''' Printable ASCII, one column per character. '''
+    return part.isascii() and part.isprintable()
+
+
+def _update(sequence, state, link):
+    ''' Returns the SGR state and open hyperlink after a sequence,
+        the latter as the sequence that opened it, or None.
+    '''
+    match = _link_finder.fullmatch(sequence)
+    if match:
+        return state, (sequence if match.group(1) else None)
+    return parse_sgr(sequence, state), link
+
+
+def _open(state, link):
+    ''' Returns the sequences to restart a style and hyperlink. '''
+    return transition((), state) + (link or '')
+
+
+def _close(state, link):
+    ''' Returns the sequences to end a style and hyperlink. '''
+    closing = transition(state, ())
+    if link:                                    # w/ the same terminator
+        closing += '\x1b]8;;' + _link_finder.fullmatch(link).group(2)
+    return closing
+
+
+def _slice(text, start, stop, ellipsis=''):
+    ''' Returns the columns from start to stop of text, and whether text was
+        cut short at stop.  With an ellipsis, it replaces the last columns
+        when cut.
+    '''
+    cut = stop - display_width(ellipsis) if ellipsis else stop
+    output = []
+    state = ()
+    link = None             # open hyperlink
+    col = 0
+    opened = False          # the style at start emitted
+    mark = None             # output index, state, link, padding at cut
+    over = False
+
+    for i, part in enumerate(_sequence_splitter.split(text)):
+        if over:
+            break
+        if i % 2:                                   # sequence
+            if col < start or not opened and sgr_finder.fullmatch(part):
+                state, link = _update(part, state, link)  # folded in opening
+            elif stop is None or col < stop:
+                if not opened:
+                    output.append(_open(state, link))
+                    opened = True
+                output.append(part)
+                state, link = _update(part, state, link)
+
+        elif _is_simple(part):                      # fast path
+            end = col + len(part)
+            lo = max(start - col, 0)
+            hi = len(part)
+            if stop is not None and end > stop:
+                hi = stop - col
+                over = True
+            if lo < hi:
+                if not opened:
+                    output.append(_open(state, link))
+                    opened = True
+                if (cut is not None and mark is None and
+                    col + lo <= cut <= col + hi):
+                    output.append(part[lo:cut - col])
+                    mark = (len(output), state, link, 0)
+                    lo = cut - col
+                output.append(part[lo:hi])
+            col = end
+
+        else:
+            for char, width in _iter_char_widths(part):
+                if col < start:
+                    end = col + width
+                    if stop is not None:
+                        end = min(end, stop)
+                    if end > start:                 # half of a wide char
+                        output.append(_open(state, link))
+                        output.append(' ' * (end - start))
+                        opened = True
+                    col += width
+                    continue
+                if not opened:
+                    output.append(_open(state, link))
+                    opened = True
+                if cut is not None and mark is None and col + width > cut:
+                    mark = (len(output), state, link, cut - col)
+                if stop is not None and col + width > stop:
+                    over = True
+                    output.append(' ' * (stop - col))  # half a wide char
+                    break
+                output.append(char)
+                col += width
+
+    if over and ellipsis and mark:
+        index, state, link, padding = mark
+        del output[index:]
+        output.append(' ' * padding + ellipsis)
+
+    if opened:
+        output.append(_close(state, link))
+    return ''.join(output), over
+
+
+def slice(text, start=0, stop=None):
+    ''' Returns a slice of styled text by column, keeping the styles active
+        at the start.  Half of a wide character at either end becomes a space.
+
+        Arguments:
+            text:   str
+            start:  int - column to start from.
+            stop:   int - column to stop before, None for the end.
+
+        Example::
+
+            slice(fg.red('Hello World'), 6) → fg.red('World')
+    '''
+    result, over = _slice(text, start, stop)
+    return result
+
+
+def truncate(text, width, ellipsis='…'):
+    ''' Shorten styled text to fit the width, ending with an ellipsis when cut.
+        Text that fits is returned as is.
+
+        Arguments:
+            text:       str
+            width:      int - in columns.
+            ellipsis:   str - to mark the cut, may be empty,
+                        itself cut when wider than the width.
+    '''
+    if width <= 0:
+        return ''
+    if display_width(ellipsis) > width:         # no room left, cut it too
+        ellipsis = _slice(ellipsis, 0, width)[0]
+    result, over = _slice(text, 0, width, ellipsis)
+    return result if over else text
+
+
+def ljust(text, width, fillchar=' '):
+    ''' Pad styled text on the right to fill the width, like str.ljust. '''
+    return text + fillchar * (width - display_width(text))
+
+
+def rjust(text, width, fillchar=' '):
+    ''' Pad styled text on the left to fill the width, like str.rjust. '''
+    return fillchar * (width - display_width(text)) + text
+
+
+def center(text, width, fillchar=' '):
+    ''' Pad styled text on both sides to fill the width, like str.center. '''
+    padding = width - display_width(text)
+    if padding <= 0:
+        return text
+    left = padding // 2 + (padding & width & 1)  # same as str.center
+    return fillchar * left + text + fillchar * (padding - left)
+
+
+class _Wrapper:
+    ''' State of wrap in progress.  Words are gathered as pieces of
+        (str, width, state after), then committed to lines.
+        States are pairs of SGR state and open hyperlink.
+    '''
+    def __init__(self, width):
+        self.width = width
+        self.lines = []
+        self.line = []
+        self.line_width = 0
+        self.start_state = self.end_state = ((), None)  # of current line
+        self.word = []
+        self.word_width = 0
+        self.space = ''                         # pending, before the word
+        self.state = ((), None)
+
+    def add_sequence(self, sequence):
+        self.state = _update(sequence, *self.state)
+        self.word.append((sequence, 0, self.state))
+
+    def add_text(self, text):
+        for piece in re.split(r'(\s+)', text):
+            if not piece:
+                continue
+            if piece.isspace():
+                for i, spaces in enumerate(piece.split('\n')):
+                    if i:                       # hard break
+                        self.commit_word()
+                        self.finish_line()
+                    elif spaces:
+                        self.commit_word()
+                if spaces and self.line:
+                    self.space = spaces
+            else:
+                width = (len(piece) if _is_simple(piece) else
+                         display_width(piece))
+                self.word.append((piece, width, self.state))
+                self.word_width += width
+
+    def commit_word(self):
+        if not self.word:
+            return
+        room = self.width - self.line_width - len(self.space)
+        if self.word_width > self.width:        # too long, break it up
+            if self.line_width and room > 0:    # starting here, as textwrap
+                self.append(self.space, len(self.space), self.end_state)
+            elif self.line_width:
+                self.finish_line()
+            self.split_word()
+            return
+        if self.word_width <= room:
+            if self.word_width and self.line:
+                self.append(self.space, len(self.space), self.end_state)
+        elif self.word_width and self.line_width:
+            self.finish_line()
+        for piece in self.word:
+            self.append(*piece)
+        self.word = []
+        self.word_width = 0
+        self.space = ''
+
+    def split_word(self):
+        for piece, width, state in self.word:
+            if not width:
+                self.append(piece, width, state)
+                continue
+            chars = (((char, 1) for char in piece) if _is_simple(piece) else
+                     _iter_char_widths(piece))
+            for char, char_width in chars:
+                if (self.line_width and  # wider than all, on its own
+                    self.line_width + char_width > self.width):
+                    self.finish_line()
+                self.append(char, char_width, state)
+        self.word = []
+        self.word_width = 0
+        self.space = ''
+
+    def append(self, piece, width, state):
+        self.line.append(piece)
+        self.line_width += width
+        self.end_state = state
+
+    def finish_line(self):
+        self.lines.append(_open(*self.start_state) + ''.join(self.line) +
+                          _close(*self.end_state))
+        self.line = []
+        self.line_width = 0
+        self.start_state = self.end_state
+        self.space = ''
+
+    def close(self):
+        self.commit_word()
+        if self.line_width:
+            self.finish_line()
+        return self.lines
+
+
+def wrap(text, width=70):
+    ''' Wrap styled text to lines of the given width, at whitespace.
+        Each line is styled on its own: styles active at the end of one
+        are restarted at the next, so they may be printed separately,
+        e.g. in columns.
+
+        Arguments:
+            text:   str - newlines are kept as line breaks.
+            width:  int - in columns.
+
+        Returns: list of lines
+    '''
+    wrapper = _Wrapper(width)
+    for i, part in enumerate(_sequence_splitter.split(text)):
+        if i % 2:
+            wrapper.add_sequence(part)
+        elif part:
+            wrapper.add_text(part)
+    return wrapper.close()
+
+
+if __name__ == '__main__':
+
+    from . import fg, fx
+
+    text = (f'The {fg.red}quick {fx.bold}brown{fx.end} fox jumps over the '
+            f'{fg.blue}lazy 犬, {fx.i}naïvely{fx.end}.')
+    for line in wrap(text, 16):
+        print(f'|{ljust(line, 16)}|')
+    print(truncate(text, 20))
+    print(slice(text, 4, 25) + '|')
@@ -0,0 +1,224 @@
+# -*- coding: future_fstrings -*-
+'''
+    .. console - Comprehensive utility library for ANSI terminals.
+    .. © 2018, Mike Miller - Released under the LGPL, version 3+.
+
+    A tokenizer for text containing ANSI escape sequences,
+    yielding typed tokens lazily from str, bytes, or a stream of chunks::
+
+        >>> list(tokenize('\\x1b[1;31mHi\\x1b[0m'))
+        [Token(kind='csi', data='\\x1b[1;31m', params=(1, 31), command='m'),
+         Token(kind='text', data='Hi', params=(), command=''),
+         Token(kind='csi', data='\\x1b[0m', params=(0,), command='m')]
+
+    Kinds of tokens:
+
+        - text: plain text, which may arrive in several tokens.
+        - csi:  Control Sequence Introducer, e.g. SGR.
+                Params are ints, None where omitted, or a tuple of ints for
+                colon sub-parameters.  The command holds a private marker,
+                intermediates, and final character, e.g. 'm', '?h', ' q'.
+        - osc:  Operating System Command, command is its number,
+                e.g. '8', params a one-tuple of the rest of the payload.
+        - esc:  other escape sequences, command holds what follows ESC,
+                e.g. '7', '(B'.
+        - c1:   other 8-bit C1 control characters, when enabled.
+
+    Unfinished sequences are passed as text, as strip_ansi does,
+    unless at the end of a chunk in a stream, where they are carried over.
+'''
+import re
+from collections import namedtuple
+
+from .utils import (MAX_OSC_LEN, _csi_command, _csi_params, _osc0_body,
+                    _osc0_end, _osc1_body, _osc1_end, _read_chunks)
+from .meta import defaults
+
+
+Token = namedtuple('Token', 'kind data params command')
+MAX_PARAMS_CACHE = 4096
+MAX_TOKEN_CACHE = 4096
+
+# built from the parts strip_ansi uses, to agree on what is a sequence:
+_max = '%(max)s'                            # OSC payload length, later
+_pattern = (
+    r'(?P<csi>\x1b\[(?P<csi_params>' + _csi_params + ')'
+    '(?P<csi_command>' + _csi_command + '))'
+    r'|(?P<osc>\x1b\](?P<osc_body>' + _osc0_body % _max + ')' + _osc0_end + ')'
+    r'|(?P<esc>\x1b(?P<esc_command>[ -/]*[0-Z\\^-~]))'  # not [ or ]
+)
+_c1_pattern = (
+    r'|(?P<csi1>\x9b(?P<csi1_params>' + _csi_params + ')'
+    '(?P<csi1_command>' + _csi_command + '))'
+    r'|(?P<osc1>\x9d(?P<osc1_body>' + _osc1_body % _max + ')' + _osc1_end + ')'
+    r'|(?P<c1>[\x80-\x9a\x9c\x9e\x9f])'
+)
+# unfinished sequences at the end of a chunk:
+_partial_pattern = (
+    r'\x1b(?:\[[0-?]{0,%(max)s}[ -/]{0,%(max)s}'
+    r'|\][^\a\x1b\n]{0,%(max)s}\x1b?|[ -/]{0,%(max)s})\Z'
+)
+_c1_partial_pattern = (
+    r'|\x9b[0-?]{0,%(max)s}[ -/]{0,%(max)s}\Z'
+    r'|\x9d[^\a\x1b\x9b\x9c\x9d\n]{0,%(max)s}\Z'
+)
+_finders = {}  # by options
+_params_cache = {}
+_token_cache = {}  # by sequence
+
+
+def _get_finders(c1, max_osc_len, binary):
+    ''' Returns compiled patterns to match sequences, split on them,
+        and match partial ones.
+    '''
+    key = (c1, max_osc_len, binary)
+    finders = _finders.get(key)
+    if finders is None:
+        values = dict(max='' if max_osc_len is None else max_osc_len)
+        pattern = _pattern % values
+        partial = _partial_pattern % values
+        if c1:
+            pattern += _c1_pattern % values
+            partial += _c1_partial_pattern % values
+        # the same, without groups:
+        splitter = '(%s)' % re.sub(r'\(\?P<\w+>', '(?:', pattern)
+        if binary:  # latin1 maps the C1 range to single bytes
+            pattern = pattern.encode('latin1')
+            partial = partial.encode('latin1')
+            splitter = splitter.encode('latin1')
+        finders = _finders[key] = (re.compile(pattern), re.compile(splitter),
+                                   re.compile(partial))
+    return finders
+
+
+def _parse_param(param):
+    if not param:
+        return None
+    if ':' in param:
+        return tuple(int(sub) if sub else None for sub in param.split(':'))
+    return int(param)
+
+
+def parse_params(params):
+    ''' Parse the parameters of a CSI sequence, e.g.:
+
+            '1;;38:5:196' → (1, None, (38, 5, 196))
+
+        Arguments:
+            params:     str or bytes, without the private marker.
+    '''
+    result = _params_cache.get(params)
+    if result is None:
+        text = params.decode('ascii') if type(params) is bytes else params
+        try:
+            result = tuple(_parse_param(param) for param in text.split(';'))
+        except ValueError:  # stray characters in range, e.g. '1<2'
+            result = (text,)
+        if len(_params_cache) >= MAX_PARAMS_CACHE:
+            _params_cache.clear()
+        _params_cache[params] = result
+    return result
+
+
+def _make_token(match, binary):
+    ''' Build a token from a match of a sequence. '''
+    kind = match.lastgroup
+    data = match.group()
+    if kind in ('csi', 'csi1'):
+        params = match.group(kind + '_params')
+        command = match.group(kind + '_command')
+        if binary:
+            command = command.decode('latin1')
+        marker = params[:1]
+        if marker and marker in (b'<=>?' if binary else '<=>?'):  # private
+            command = (marker.decode('latin1') if binary else marker) + command
+            params = params[1:]
+        return Token('csi', data, parse_params(params) if params else (),
+                     command)
+
+    elif kind in ('osc', 'osc1'):
+        body = match.group(kind + '_body')
+        sep = b';' if binary else ';'
+        number, _, payload = body.partition(sep)
+        if binary:
+            number = number.decode('latin1')
+        return Token('osc', data, (payload,), number)
+
+    elif kind == 'esc':
+        command = match.group('esc_command')
+        if binary:
+            command = command.decode('latin1')
+        return Token('esc', data, (), command)
+
+    return Token('c1', data, (), data.decode('latin1') if binary else data)
+
+
+def _tokenize(text, finders, binary):
+    finder, splitter = finders
+    new = tuple.__new__  # skip the namedtuple constructor, hot loop
+    cache = _token_cache
+    # split in C, to alternate text & sequences, text at even indexes:
+    for i, part in enumerate(splitter.split(text)):
+        if i % 2:
+            token = cache.get(part)  # same sequences are used over & over
+            if token is None:
+                token = _make_token(finder.match(part), binary)
+                if len(cache) >= MAX_TOKEN_CACHE:
+                    cache.clear()
+                cache[part] = token
+            yield token
+        elif part:
+            yield new(Token, ('text', part, (), ''))
+
+
+def tokenize(text, c1=False, max_osc_len=MAX_OSC_LEN):
+    ''' Yield the tokens of a str or bytes, lazily.
+        The text is split at once, for large inputs see tokenize_stream.
+
+        Arguments:
+            text:           str or bytes
+            c1:             bool - recognize 8-bit C1 controls,
+                                   off by default as they may be UTF-8.
+            max_osc_len:    int - longer OSC payloads are left as text,
+                                  None for no limit.
+    '''
+    binary = type(text) is not str
+    finder, splitter, _ = _get_finders(c1, max_osc_len, binary)
+    return _tokenize(text, (finder, splitter), binary)
+
+
+def tokenize_stream(chunks, c1=False, max_osc_len=MAX_OSC_LEN,
+                    chunk_size=defaults.STREAM_CHUNK_SIZE):
+    ''' Yield the tokens of an iterable of str or bytes chunks, or a file,
+        lazily.  Sequences split across chunks are carried over.
+        See tokenize for arguments.
+    '''
+    if hasattr(chunks, 'read'):
+        chunks = _read_chunks(chunks, chunk_size)
+    carry = None
+    finders = partial_finder = binary = None
+    for chunk in chunks:
+        if finders is None:
+            binary = type(chunk) is not str
+            *finders, partial_finder = _get_finders(c1, max_osc_len, binary)
+        text = carry + chunk if carry else chunk
+        partial = None
+        # search from the ESC before last, in case the last begins an ST:
+        esc = b'\x1b' if binary else '\x1b'
+        last = text.rfind(esc)
+        start = max(text.rfind(esc, 0, last), 0) if last > 0 else last
+        if c1:
+            for intro in ((b'\x9b', b'\x9d') if binary else ('\x9b', '\x9d')):
+                index = text.rfind(intro)
+                if index >= 0:
+                    start = index if start < 0 else min(start, index)
+        if start >= 0:
+            partial = partial_finder.search(text, start)
+        if partial:
+            carry = text[partial.start():]
+            text = text[:partial.start()]
+        else:
+            carry = None
+        yield from _tokenize(text, finders, binary)
+    if carry:  # never finished
+        yield from _tokenize(carry, finders, binary)
@@ -15,25 +15,245 @@
 import logging
 import re
 import sys, os
+import threading
+from bisect import bisect_right
 from time import sleep
 from urllib.parse import quote
 from itertools import zip_longest, chain
 
 from . import ansi_capable as _ansi_capable
-from .constants import OSC, ST, _MODE_MAP, _TITLE_MODE_MAP
+from .constants import CSI, OSC, ST, TermLevel, _MODE_MAP, _TITLE_MODE_MAP
 from .screen import sc
+from .proximity import (build_color_tables, color_table4, color_table8,
+                        find_nearest_color_index)
+from .sgr import parse_sgr, sgr_finder, split_params, transition
 from .detection import (get_size, is_a_tty, os_name, _read_clipboard,
                         _sized_char_support)
 from .meta import defaults
+from .width_table import width_ranges
 
 
 log = logging.getLogger(__name__)
+MAX_DOWNGRADE_CACHE = 65536
+MAX_WIDTH_CACHE = 4096
+
+MAX_OSC_LEN = defaults.MAX_OSC_LEN
+
+# Parts of sequences, shared with the tokenizer.
+# OSC payloads may not contain the introducer of another sequence,
+# so a scan for the terminator never overlaps the next, keeping it linear:
+_csi_params = r'[0-?]*'                     # w/ private markers
+_csi_command = r'[ -/]*[@-~]'               # intermediates, final
+_osc0_body = r'[^\a\x1b\n]{0,%s}'
+_osc0_end = r'(?:\a|\x1b\\)'
+_osc1_body = r'[^\a\x1b\x9b\x9c\x9d\n]{0,%s}'
+_osc1_end = r'(?:\a|\x9c)'
+
+_ansi_csi0_pattern = r'\x1b\[' + _csi_params + _csi_command
+_ansi_csi1_pattern = r'\x9b' + _csi_params + _csi_command
+_ansi_osc0_pattern = r'\x1b\]' + _osc0_body + _osc0_end
+_ansi_osc1_pattern = r'\x9d' + _osc1_body + _osc1_end
+
+# partial sequences at the end of a chunk, to carry over to the next:
+_ansi_csi0_partial = r'\x1b(?:\[[0-?]{0,%s}[ -/]{0,%s})?\Z'
+_ansi_csi1_partial = r'\x9b[0-?]{0,%s}[ -/]{0,%s}\Z'
+_ansi_osc0_partial = r'\x1b\][^\a\x1b\n]{0,%s}\x1b?\Z'
+_ansi_osc1_partial = r'\x9d[^\a\x1b\x9b\x9c\x9d\n]{0,%s}\Z'
+
+ansi_csi0_finder = re.compile(_ansi_csi0_pattern)
+ansi_csi1_finder = re.compile(_ansi_csi1_pattern)
+ansi_osc0_finder = re.compile(_ansi_osc0_pattern % MAX_OSC_LEN)
+ansi_osc1_finder = re.compile(_ansi_osc1_pattern % MAX_OSC_LEN)
+_ansi_finders = {}  # combined, by options
+_sgr_run_finder = re.compile(r'(?:\x1b\[[0-9:;]*m)+')
+_partial_sgr_finder = re.compile(r'\x1b(\[[0-9:;]*)?\Z')
+
+_width_starts = [start for start, end, width in width_ranges]
+_char_widths = {chr(i): 1 for i in range(0x20, 0x7F)}  # by char, grows
+_width_cache = {}
+_batch_state = threading.local()  # writers: active, innermost last
+_capture_lock = threading.Lock()
+_capture_count = 0  # active writers capturing stdout, of all threads
+
+
+class BatchWriter:
+    ''' Gathers the output of the helper functions below, e.g. clear_line,
+        set_title, and print(), into one write of encoded bytes to the file
+        descriptor of the stream, on exit of the block,
+        or when the threshold is exceeded.
+
+        .. code-block:: python
+
+            with BatchWriter():
+                clear_screen()
+                set_title('Hello')
+                print(fg.green('Hello World'))
 
-ansi_csi0_finder = re.compile(r'\x1b\[[0-?]*[ -/]*[@-~]')
-ansi_csi1_finder = re.compile(r'\x9b[0-?]*[ -/]*[@-~]')
+        Arguments:
+            stream          To write to, sys.stdout by default.
+            flush_threshold Bytes to buffer before writing through.
+            encoding        Of str written, by default that of the stream.
+
+        Counters of write calls issued and bytes written to the
+        underlying stream are kept in write_count and bytes_written.
 
-ansi_osc0_finder = re.compile(r'\x1b\].*?(\a|\x1b\\)')
-ansi_osc1_finder = re.compile(r'\x9b.*?(\a|\x9d)')
+        Note:
+            Writers are active in the thread that entered them.
+            Output to sys.stdout is captured when it is the stream,
+            as in Screen.frame(), that of other threads passes through.
+    '''
+    flush_threshold = defaults.WRITE_BATCH_SIZE
+
+    def __init__(self, stream=None, flush_threshold=None, encoding=None):
+        self.stream = stream
+        if flush_threshold is not None:
+            self.flush_threshold = flush_threshold
+        self.encoding = encoding
+        self.bytes_written = 0
+        self.write_count = 0
+        self._buffer = bytearray()
+        self._target = None             # stream while active
+        self._captures = False
+
+    def __enter__(self):
+        global _capture_count
+        stdout = sys.stdout
+        if type(stdout) is _StdoutRouter:
+            stdout = stdout._stream
+        stream = stdout if self.stream is None else self.stream
+        self._target = stream
+        if stream is stdout:
+            with _capture_lock:
+                if not _capture_count:
+                    sys.stdout = _StdoutRouter(stdout)
+                _capture_count += 1
+            self._captures = True
+        _get_batch_writers().append(self)
+        return self
+
+    def __exit__(self, *args):
+        global _capture_count
+        _get_batch_writers().remove(self)
+        if self._captures:
+            with _capture_lock:
+                _capture_count -= 1
+                if not _capture_count and type(sys.stdout) is _StdoutRouter:
+                    sys.stdout = sys.stdout._stream
+            self._captures = False
+        try:
+            self.flush()
+        finally:
+            self._target = None
+
+    def _get_stream(self):
+        if self._target is not None:
+            return self._target
+        return sys.stdout if self.stream is None else self.stream
+
+    def write(self, data):
+        ''' Buffer str or bytes, writing through when over the threshold. '''
+        if type(data) is str:
+            stream = self._get_stream()
+            data = data.encode(self.encoding or
+                               getattr(stream, 'encoding', None) or 'utf8',
+                               getattr(stream, 'errors', None) or 'strict')
+        self._buffer += data
+        if len(self._buffer) > self.flush_threshold:
+            self.flush()
+        return len(data)
+
+    def flush(self):
+        ''' Write out pending output, straight to the file descriptor
+            when the stream has one.
+        '''
+        if not self._buffer:
+            return
+        data = bytes(self._buffer)
+        self._buffer.clear()
+        stream = self._get_stream()
+        try:
+            fd = stream.fileno()
+        except (AttributeError, OSError, ValueError):  # StringIO, etc.
+            fd = None
+
+        if fd is None:
+            encoding = (self.encoding or
+                        getattr(stream, 'encoding', None) or 'utf8')
+            stream.write(data.decode(encoding, 'surrogateescape'))
+            stream.flush()
+            self.write_count += 1
+        else:
+            stream.flush()                          # earlier output first
+            view = memoryview(data)
+            while view:                             # in case of short writes
+                view = view[os.write(fd, view):]
+                self.write_count += 1
+        self.bytes_written += len(data)
+
+    def __repr__(self):
+        return (f'{self.__class__.__name__}(writes={self.write_count}, '
+                f'bytes={self.bytes_written}, pending={len(self._buffer)})')
+
+
+class _StdoutRouter:
+    ''' Stands in for sys.stdout while BatchWriters capture it,
+        passing writes to the innermost capturing writer of the thread,
+        or through to the original stream.  Flushes are deferred to the
+        writer, as print(flush=True) would defeat it.
+    '''
+    def __init__(self, stream):
+        self._stream = stream
+
+    def _get_writer(self):
+        for writer in reversed(getattr(_batch_state, 'writers', ())):
+            if writer._captures:
+                return writer
+        return None
+
+    def write(self, text):
+        writer = self._get_writer()
+        if writer is None:
+            return self._stream.write(text)
+        writer.write(text)
+        return len(text)
+
+    def flush(self):
+        if self._get_writer() is None:
+            self._stream.flush()
+
+    def __getattr__(self, name):  # encoding, fileno, isatty, etc.
+        return getattr(self._stream, name)
+
+
+def _get_batch_writers():
+    ''' Returns the stack of active writers of the current thread. '''
+    try:
+        return _batch_state.writers
+    except AttributeError:
+        writers = _batch_state.writers = []
+        return writers
+
+
+def _write(text, flush=False):
+    ''' Write a sequence of the helpers below, to the active BatchWriter
+        of the thread, or out immediately.
+    '''
+    writers = getattr(_batch_state, 'writers', None)
+    if writers:
+        writer = writers[-1]
+        writer.write(text)
+        if flush:
+            writer.flush()
+    elif type(text) is bytes:
+        # https://stackoverflow.com/a/908440/450917
+        if hasattr(sys.stdout, 'buffer'):  # slightly more direct route
+            sys.stdout.buffer.write(text)
+            sys.stdout.flush()
+        else:
+            # bytes --> unicode --> bytes :-/
+            print(text.decode('ascii'), end='', flush=True)
+    else:
+        print(text, end='', flush=True)
 
 
 def clear_line(mode=2):
@@ -54,7 +274,7 @@ def clear_line(mode=2):
     '''
     text = sc.clear_line(_MODE_MAP.get(mode, mode))
     if _ansi_capable:
-        print(text, end='', flush=True)
+        _write(text)
     return text
 
 
@@ -82,7 +302,7 @@ def clear_lines(lines: int, mode=2):
 
     text = ''.join(commands)
     if _ansi_capable:
-        print(text, end='', flush=True)
+        _write(text)
     return text
 
 
@@ -103,7 +323,7 @@ def clear_screen(mode=2):
     '''
     text = sc.clear(_MODE_MAP.get(mode, mode))
     if _ansi_capable:
-        print(text, end='', flush=True)
+        _write(text)
     return text
 
 
@@ -117,9 +337,9 @@ def flash(seconds=.1):
         Returns: text sequence to be written, for testing.
     '''
     if _ansi_capable:
-        print(sc.enable_flash, end='', flush=True)
+        _write(sc.enable_flash, flush=True)
         sleep(seconds)
-        print(sc.disable_flash, end='', flush=True)
+        _write(sc.disable_flash, flush=True)
         return sc.enable_flash + sc.disable_flash  # for testing
 
 
@@ -371,7 +591,7 @@ def notify_cwd(path=None):
 
     text = f'{OSC}{code};{path}{ST}'
     if _ansi_capable:
-        print(text, end='', flush=True)
+        _write(text)
     return text
 
 
@@ -396,7 +616,7 @@ def notify_message(message, title=''):
 
     text = f'{OSC}{code};{message}{ST}'
     if _ansi_capable:
-        print(text, end='', flush=True)
+        _write(text)
     return text
 
 
@@ -419,7 +639,7 @@ if os_name == 'nt':
 
         text = f'{OSC}9;9;"{path}"{ST}'
         if _ansi_capable:
-            print(text, end='', flush=True)
+            _write(text)
         return text
 
 
@@ -464,7 +684,7 @@ if os_name == 'nt':
 
         text = f'{OSC}9;4;{mode};{value}{ST}'
         if _ansi_capable:
-            print(text, end='', flush=True)
+            _write(text)
         return text
 
 else:
@@ -491,7 +711,7 @@ else:
 
         text = f'{OSC}7;{path}{ST}'
         if _ansi_capable:
-            print(text, end='', flush=True)
+            _write(text)
         return text
 
 
@@ -512,7 +732,7 @@ def reset_terminal():
     else:
         text = sc.reset
         if _ansi_capable:
-            print(text, end='', flush=True)
+            _write(text)
         return text  # for testing
 
 
@@ -549,14 +769,7 @@ def set_clipboard(data, destination='c', encoding='utf8',
         payload = b64encode(data)
         envelope = f'{OSC}52;{destination};%b{ST}'.encode('ascii')
         text = envelope % payload
-
-        # https://stackoverflow.com/a/908440/450917
-        if hasattr(sys.stdout, 'buffer'):  # slightly more direct route
-            sys.stdout.buffer.write(text)
-            sys.stdout.flush()
-        else:
-            # bytes --> unicode --> bytes :-/
-            print(text.decode('ascii'), end='', flush=True)
+        _write(text)
         return text
 
 
@@ -577,11 +790,41 @@ def set_title(title, mode=0):
     else:
         text = f'{OSC}{_TITLE_MODE_MAP.get(mode, mode)};{title}{ST}'
         if _ansi_capable:
-            print(text, end='', flush=True)
+            _write(text)
         return text
 
 
-def strip_ansi(text, c1=False, osc=False):
+def _get_ansi_finder(c1, osc, max_osc_len, binary=False, partial=False):
+    ''' Returns one compiled pattern matching the requested sequences,
+        or partial ones at the end of text.
+    '''
+    key = (c1, osc, max_osc_len, binary, partial)
+    finder = _ansi_finders.get(key)
+    if finder is None:
+        max_len = '' if max_osc_len is None else max_osc_len  # {0,}
+        if partial:
+            csi0, csi1 = (_ansi_csi0_partial % (max_len, max_len),
+                          _ansi_csi1_partial % (max_len, max_len))
+            osc0, osc1 = _ansi_osc0_partial, _ansi_osc1_partial
+        else:
+            csi0, csi1 = _ansi_csi0_pattern, _ansi_csi1_pattern
+            osc0, osc1 = _ansi_osc0_pattern, _ansi_osc1_pattern
+
+        patterns = [csi0]
+        if osc:
+            patterns.append(osc0 % max_len)
+        if c1:
+            patterns.append(csi1)  # go first, less destructive
+            if osc:
+                patterns.append(osc1 % max_len)
+        pattern = '|'.join(patterns)
+        if binary:
+            pattern = pattern.encode('ascii')
+        finder = _ansi_finders[key] = re.compile(pattern)
+    return finder
+
+
+def strip_ansi(text, c1=False, osc=False, max_osc_len=MAX_OSC_LEN):
     ''' Strip ANSI escape sequences from a portion of text.
         https://stackoverflow.com/a/38662876/450917
 
@@ -589,31 +832,592 @@ def strip_ansi(text, c1=False, osc=False):
             line: str
             c1:  bool  - include C1 based commands in the strippage.
             osc: bool  - include OSC commands in the strippage.
+            max_osc_len: int - longer OSC payloads are left alone,
+                               None for no limit.
 
         Returns: stripped text
 
         Notes:
-            Enabling both C1 and OSC stripping is less efficient and the two
-            options can mildly conflict with one another.
-            The less problematic order was chosen,
-            but there may still be rare C1/OSC fragments left over.
-    '''
-    text = ansi_csi0_finder.sub('', text)
-    if osc:
-        text = ansi_osc0_finder.sub('', text)
-    if c1:
-        text = ansi_csi1_finder.sub('', text)  # go first, less destructive
-        if osc:
-            text = ansi_osc1_finder.sub('', text)
-    return text
+            Runs in a single pass, in linear time,
+            even on unterminated sequences.
+            OSC commands end at BEL or ST, and may not contain other
+            escape sequences or newlines.
+            When enabling both C1 and OSC stripping,
+            C1 CSI sequences take precedence.
+    '''
+    if '\x1b' not in text and not (c1 and ('\x9b' in text or
+                                          '\x9d' in text)):
+        return text  # nothing to do
+    return _get_ansi_finder(c1, osc, max_osc_len).sub('', text)
 
 
 def len_stripped(text):
     ''' Convenience - returns the length of a string minus escape sequences.
 
-        Useful to find if a string will fit inside a given length on screen.
+        Useful to find if a string will fit inside a given length on screen,
+        though see display_width for wide characters.
+    '''
+    if '\x1b' not in text:
+        return len(text)
+    return len(ansi_csi0_finder.sub('', text))
+
+
+def display_width(text):
+    ''' Returns the count of columns a string occupies on a terminal,
+        not counting escape sequences.
+        East Asian wide characters and emoji take two columns,
+        combining marks and control characters none.
+
+        Results are cached, as the same strings tend to be measured again.
+    '''
+    if text.isascii() and text.isprintable():  # fast path, no escapes either
+        return len(text)
+    width = _width_cache.get(text)
+    if width is not None:
+        return width
+
+    plain = strip_ansi(text, osc=True)
+    if plain.isascii() and plain.isprintable():
+        width = len(plain)
+    else:
+        width = sum(width for char, width in _iter_char_widths(plain))
+
+    if len(_width_cache) >= MAX_WIDTH_CACHE:
+        _width_cache.clear()
+    _width_cache[text] = width
+    return width
+
+
+def _iter_char_widths(text):
+    ''' Yield (char, width) pairs of plain text, in columns. '''
+    last = 0
+    joined = False
+    for char in text:
+        width = _char_widths.get(char)
+        if width is None:
+            width = _char_widths[char] = _get_char_width(ord(char))
+        if joined:                          # part of a ZWJ emoji sequence
+            width = joined = 0
+        elif char == '\u200d':
+            joined = True
+        elif char == '\ufe0f' and last == 1:  # emoji presentation
+            width = 1
+        yield char, width
+        last = width
+
+
+def _get_char_width(codepoint):
+    ''' Look up the width of a codepoint in the table of ranges. '''
+    i = bisect_right(_width_starts, codepoint) - 1
+    if i >= 0:
+        start, end, width = width_ranges[i]
+        if codepoint <= end:
+            return width
+    return 1
+
+
+def _read_chunks(infile, size):
+    ''' Read a file of str or bytes in chunks, until the end. '''
+    while True:
+        chunk = infile.read(size)
+        if not chunk:
+            break
+        yield chunk
+
+
+class AnsiStripper:
+    ''' Incremental form of strip_ansi, for streams of text in chunks.
+        Sequences split across chunks are carried over to the next.
+
+        Chunks may be str, or bytes which are handled natively,
+        without decoding.
+        Memory use is bounded by chunk size, and max_osc_len.
+
+        Arguments:
+            c1:  bool  - include C1 based commands in the strippage.
+                         With bytes, suitable for single-byte encodings only,
+                         as they clash with UTF-8.
+            osc: bool  - include OSC commands in the strippage.
+            max_osc_len: int - longer sequences are left alone.
+
+        Example::
+
+            stripper = AnsiStripper(osc=True)
+            with open('huge.log', 'rb') as infile:
+                for chunk in stripper(infile):
+                    sys.stdout.buffer.write(chunk)
+    '''
+    def __init__(self, c1=False, osc=False, max_osc_len=MAX_OSC_LEN):
+        self.c1 = c1
+        self.osc = osc
+        self.max_osc_len = max_osc_len
+        self._carry = None
+
+    def strip(self, chunk):
+        ''' Returns the given chunk stripped, minus any partial sequence at
+            its end, which is held until the next.
+        '''
+        binary = not isinstance(chunk, str)
+        if self._carry:
+            chunk = self._carry + chunk
+            self._carry = None
+        elif binary:
+            if b'\x1b' not in chunk and not (self.c1 and (
+               b'\x9b' in chunk or b'\x9d' in chunk)):
+                return chunk  # nothing to do
+        elif '\x1b' not in chunk and not (self.c1 and (
+             '\x9b' in chunk or '\x9d' in chunk)):
+            return chunk
+
+        # a partial seq. holds two ESCs at most, e.g. OSC…ESC, look from there
+        introducers = (b'\x1b', b'\x9b', b'\x9d') if binary else (
+                       '\x1b', '\x9b', '\x9d')
+        last = chunk.rfind(introducers[0])
+        starts = [max(chunk.rfind(introducers[0], 0, last), 0)
+                  if last > 0 else last]
+        if self.c1:
+            starts.extend(chunk.rfind(intro) for intro in introducers[1:])
+        starts = [start for start in starts if start > -1]
+
+        options = (self.c1, self.osc, self.max_osc_len, binary)
+        partial = starts and _get_ansi_finder(*options, partial=True).search(
+                                                            chunk, min(starts))
+        if partial:
+            self._carry = chunk[partial.start():]
+            chunk = chunk[:partial.start()]
+        return _get_ansi_finder(*options).sub(b'' if binary else '', chunk)
+
+    def flush(self):
+        ''' Returns what was held over at the end of the stream, stripped,
+            though an unfinished sequence itself remains.
+        '''
+        carry, self._carry = self._carry, None
+        if carry:
+            binary = not isinstance(carry, str)
+            finder = _get_ansi_finder(self.c1, self.osc, self.max_osc_len,
+                                      binary)
+            carry = finder.sub(b'' if binary else '', carry)
+        return carry
+
+    def __call__(self, source, chunk_size=defaults.STREAM_CHUNK_SIZE):
+        ''' Strip an iterable of chunks or a file, yielding the results.
+
+            Arguments:
+                source:     iterable of str or bytes, or a file object.
+                chunk_size: int - to read at a time from files.
+        '''
+        if hasattr(source, 'read'):
+            source = _read_chunks(source, chunk_size)
+        for chunk in source:
+            chunk = self.strip(chunk)
+            if chunk:
+                yield chunk
+        carry = self.flush()
+        if carry:
+            yield carry
+
+
+def _optimize_ansi(text, emitted, pending):
+    ''' Rewrite SGR sequences of text, deferring each until text follows.
+
+        Arguments:
+            text:  str
+            emitted: tuple  - SGR state written so far.
+            pending: tuple  - SGR state requested so far.
+
+        Returns: (output, emitted, pending)
+    '''
+    output = []
+    pos = 0
+    for match in _sgr_run_finder.finditer(text):
+        start = match.start()
+        if start > pos:  # text, or another escape seq: bring state current
+            if pending != emitted:
+                output.append(transition(emitted, pending))
+                emitted = pending
+            output.append(text[pos:start])
+        pending = parse_sgr(match.group(), pending)  # cached
+        pos = match.end()
+
+    if pos < len(text):
+        if pending != emitted:
+            output.append(transition(emitted, pending))
+            emitted = pending
+        output.append(text[pos:])
+    return ''.join(output), emitted, pending
+
+
+def optimize_ansi(text):
+    ''' Rewrite a string's SGR (color/effect) sequences to a minimal
+        equivalent, e.g. after concatenating several styled strings.
+
+        Back-to-back sequences are merged,
+        resets followed by re-sets and no-op changes are dropped.
+        Other escape sequences are kept as-is.
+
+        Arguments:
+            text: str
+
+        Returns: optimized text
+
+        Note:
+            Output is assumed to start without any style in effect.
+    '''
+    output, emitted, pending = _optimize_ansi(text, (), ())
+    return output + transition(emitted, pending)
+
+
+def optimize_ansi_stream(chunks):
+    ''' Incremental form of optimize_ansi, for an iterable of str chunks,
+        such as a file.  Sequences split across chunks are carried over.
+
+        Returns: generator of optimized str chunks
+    '''
+    emitted = pending = ()
+    carry = ''
+    for chunk in chunks:
+        text = carry + chunk
+        partial = _partial_sgr_finder.search(text)
+        if partial:
+            carry = text[partial.start():]
+            text = text[:partial.start()]
+        else:
+            carry = ''
+        output, emitted, pending = _optimize_ansi(text, emitted, pending)
+        if output:
+            yield output
+
+    # an unfinished sequence at the end is passed through as is
+    output = transition(emitted, pending) + carry
+    if output:
+        yield output
+
+
+def _downgrade_group(group, level, nearest):
+    ''' Rewrite one group of SGR params to the given level.
+
+        Returns: str of params, or None if dropped.
+    '''
+    value = group[0]
+    sep = ':' if ':' in value else ';'
+    parts = value.split(':') if sep == ':' else group
+    code = parts[0].lstrip('0')
+
+    if code in ('38', '48', '58'):
+        kind = parts[1] if len(parts) > 1 else ''
+        try:
+            if kind == '2':                 # direct, maybe w/ colorspace id
+                rgb = tuple(int(part) for part in parts[-3:])
+                index = None
+            elif kind == '5':
+                rgb, index = None, int(parts[2])
+                if not 0 <= index <= 255:   # out of range, leave it be
+                    return sep.join(parts)
+            else:
+                return sep.join(parts)
+        except (ValueError, IndexError):    # malformed, leave it be
+            return sep.join(parts)
+
+        if level is TermLevel.ANSI_EXTENDED:
+            if index is None:
+                index = nearest(rgb, color_table8)
+            return sep.join((code, '5', str(index)))
+
+        elif level is TermLevel.ANSI_BASIC and code != '58':  # no ul color
+            if index is None:
+                index = nearest(rgb, color_table4)
+            elif index > 15:
+                from .color_tables import index_to_rgb8
+                index = nearest(index_to_rgb8[str(index)], color_table4)
+            base = 30 if code == '38' else 40
+            if index > 7:
+                base, index = base + 60, index - 8  # bright
+            return str(base + index)
+        return None                         # no color at all
+
+    elif level is TermLevel.ANSI_MONOCHROME and code.isdigit() and (
+        30 <= int(code) <= 37 or 40 <= int(code) <= 47 or
+        90 <= int(code) <= 97 or 100 <= int(code) <= 107):
+        return None
+    return value
+
+
+def _downgrade_params(params, level, nearest):
+    ''' Rewrite the params of an SGR sequence, None if it is dropped. '''
+    if level < TermLevel.ANSI_MONOCHROME:
+        return None
+    groups = []
+    for group in split_params(params):
+        group = _downgrade_group(group, level, nearest)
+        if group is not None:
+            groups.append(group)
+    if params and not groups:               # don't turn it into a reset
+        return None
+    return ';'.join(groups)
+
+
+def _get_downgrader(level, method):
+    ''' Returns a function that rewrites an SGR match for the given level,
+        caching results, so each distinct sequence is resolved once.
+    '''
+    if level is None:
+        from . import term_level as level
+    level = level or TermLevel.DUMB
+    if not color_table4:  # not built when output isn't a terminal
+        build_color_tables()
+    cache = {}
+    colors = {}
+
+    def nearest(rgb, table):
+        key = (rgb, id(table))
+        index = colors.get(key)
+        if index is None:
+            index = colors[key] = find_nearest_color_index(
+                                    *rgb, color_table=table, method=method)
+        return index
+
+    def downgrade(match):
+        params = match.group(1)
+        result = cache.get(params)
+        if result is None:
+            result = _downgrade_params(params, level, nearest)
+            result = '' if result is None else f'{CSI}{result}m'
+            if len(cache) >= MAX_DOWNGRADE_CACHE:
+                cache.clear()
+            cache[params] = result
+        return result
+
+    return level, downgrade
+
+
+def downgrade_ansi(text, level=None, method='euclid'):
+    ''' Rewrite the colors of existing ANSI text to those available at a
+        lesser terminal level, e.g. to view truecolor logs on a
+        256 or 16 color console.
+
+        Arguments:
+            text:   str
+            level:  TermLevel - defaults to that detected.
+                                Colors are removed at ANSI_MONOCHROME,
+                                SGR sequences at DUMB.
+            method: str - distance method to find the nearest color,
+                          see proximity.distance_methods.
+
+        Returns: downgraded text
+    '''
+    level, downgrade = _get_downgrader(level, method)
+    if level >= TermLevel.ANSI_DIRECT:
+        return text
+    return sgr_finder.sub(downgrade, text)
+
+
+def downgrade_ansi_stream(chunks, level=None, method='euclid'):
+    ''' Incremental form of downgrade_ansi, for an iterable of str chunks,
+        such as a file.  Sequences split across chunks are carried over.
+
+        Returns: generator of downgraded str chunks
+    '''
+    level, downgrade = _get_downgrader(level, method)
+    carry = ''
+    for chunk in chunks:
+        if level >= TermLevel.ANSI_DIRECT:
+            yield chunk
+            continue
+        text = carry + chunk
+        partial = _partial_sgr_finder.search(text)
+        if partial:
+            carry = text[partial.start():]
+            text = text[:partial.start()]
+        else:
+            carry = ''
+        if text:
+            yield sgr_finder.sub(downgrade, text)
+    if carry:
+        yield carry
+
+
+def downgrade_pipe(level=None, method='euclid'):
+    ''' Rewrite the colors of ANSI text from stdin to stdout,
+        to suit the level of the terminal, or another.
+
+        Arguments:
+            level:  str - basic, extended, direct, monochrome, or dumb;
+                          defaults to the detected level.
+            method: str - distance method to find the nearest color.
+    '''
+    level = _get_term_level(level)
+    write = sys.stdout.write
+    for chunk in downgrade_ansi_stream(sys.stdin, level, method):
+        write(chunk)
+
+
+def _get_term_level(level):
+    ''' Returns a TermLevel given a name such as "basic", or as is. '''
+    if isinstance(level, str):
+        names = {member.name: member for member in TermLevel}
+        name = level.upper()
+        level = names.get(name)
+        if level is None:
+            level = names.get('ANSI_' + name)
+        if level is None:
+            raise ValueError(f'level not recognized, try one of: '
+                             f'{", ".join(names).lower()}')
+    return level
+
+
+def _get_file_spans(data, chunk_size):
+    ''' Yield (start, end) offsets dividing data into chunks of about
+        chunk_size bytes, ending just after a newline.
+
+        None of the sequences handled here may contain a newline,
+        so no sequence is left open at one of these boundaries,
+        and none falls inside a multi-byte UTF-8 character either.
+    '''
+    start, size = 0, len(data)
+    while start < size:
+        end = data.find(b'\n', min(start + chunk_size, size) - 1)
+        end = size if end == -1 else end + 1
+        yield start, end
+        start = end
+
+
+def _process_file_span(task):
+    ''' Worker: map a span of the file and return it processed, as bytes.
+        The file is mapped again here so only offsets travel to the pool.
+    '''
+    import mmap
+
+    path, start, end, action, options = task
+    with open(path, 'rb') as infile:
+        with mmap.mmap(infile.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            chunk = data[start:end]
+
+    if action == 'strip':
+        c1, osc, max_osc_len = options
+        if not c1:  # bytes are fine, sequences are ASCII
+            return _get_ansi_finder(c1, osc, max_osc_len, binary=True).sub(
+                b'', chunk)
+        # 0x80-0x9f are also UTF-8 continuation bytes, strip code points:
+        text = chunk.decode('utf8', 'surrogateescape')
+        return _get_ansi_finder(c1, osc, max_osc_len).sub('', text).encode(
+            'utf8', 'surrogateescape')
+    else:  # downgrade
+        level, method = options
+        text = chunk.decode('utf8', 'surrogateescape')
+        return downgrade_ansi(text, level, method).encode('utf8',
+                                                          'surrogateescape')
+
+
+def _process_file(path, outfile, action, options, workers, chunk_size):
+    ''' Process a file in spans, in a pool of worker processes,
+        writing results to outfile in order.
+
+        Returns: count of bytes written
+    '''
+    import mmap
+
+    with open(path, 'rb') as infile:
+        if not os.fstat(infile.fileno()).st_size:  # can't map empty files
+            return 0
+        with mmap.mmap(infile.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            tasks = [(path, start, end, action, options)
+                     for start, end in _get_file_spans(data, chunk_size)]
+
+    if outfile is None:
+        outfile = sys.stdout.buffer
+    if isinstance(outfile, str):
+        with open(outfile, 'wb') as outfile:
+            return _write_spans(tasks, outfile, workers)
+    count = _write_spans(tasks, outfile, workers)
+    outfile.flush()
+    return count
+
+
+def _write_spans(tasks, outfile, workers):
+    workers = workers or os.cpu_count() or 1
+    if workers == 1 or len(tasks) == 1:  # skip the overhead
+        results = map(_process_file_span, tasks)
+        return sum(outfile.write(result) for result in results)
+
+    from collections import deque
+    from concurrent.futures import ProcessPoolExecutor
+
+    count = 0
+    with ProcessPoolExecutor(workers) as pool:
+        pending = deque()  # in order, limited to bound memory
+        for task in tasks:
+            if len(pending) >= workers * 2:
+                count += outfile.write(pending.popleft().result())
+            pending.append(pool.submit(_process_file_span, task))
+        while pending:
+            count += outfile.write(pending.popleft().result())
+    return count
+
+
+def strip_ansi_file(infile, outfile=None, workers=0, c1=False, osc=False,
+                    max_osc_len=MAX_OSC_LEN, chunk_size=defaults.FILE_CHUNK_SIZE):
+    ''' Strip ANSI escape sequences from a large file,
+        in parallel on multiple cores.
+
+        The file is memory-mapped and split at newlines into chunks for
+        a pool of processes, while results are written in order.
+
+        Arguments:
+            infile:     str - path of the file to read.
+            outfile:    str - path of the file to write, or a binary file
+                              object; default stdout.
+            workers:    int - count of processes, 0: one per CPU.
+            c1, osc, max_osc_len: - see strip_ansi.
+            chunk_size: int - bytes per task, approximately.
+
+        Returns: count of bytes written
+    '''
+    return _process_file(infile, outfile, 'strip', (c1, osc, max_osc_len),
+                         workers, chunk_size)
+
+
+def downgrade_ansi_file(infile, outfile=None, workers=0, level=None,
+                        method='euclid', chunk_size=defaults.FILE_CHUNK_SIZE):
+    ''' Rewrite the colors of a large ANSI file to suit a lesser terminal
+        level, in parallel on multiple cores.  See strip_ansi_file.
+
+        Arguments:
+            infile:     str - path of the file to read.
+            outfile:    str - path of the file to write, or a binary file
+                              object; default stdout.
+            workers:    int - count of processes, 0: one per CPU.
+            level:      str | TermLevel - see downgrade_pipe.
+            method:     str - distance method to find the nearest color.
+            chunk_size: int - bytes per task, approximately.
+
+        Returns: count of bytes written
     '''
-    return len(strip_ansi(text))
+    level = _get_term_level(level)
+    if level is None:  # resolve here, workers may detect differently
+        from . import term_level as level
+    return _process_file(infile, outfile, 'downgrade', (level, method),
+                         workers, chunk_size)
+
+
+def filter_file(infile, action='strip', outfile=None, workers=0, level=None,
+                c1=False, osc=False):
+    ''' Strip or downgrade the ANSI sequences of a large file, in parallel,
+        to stdout or another file.
+
+        Arguments:
+            infile:     str - path of the file to read.
+            action:     str - strip or downgrade.
+            outfile:    str - path of the file to write, default stdout.
+            workers:    int - count of processes, 0: one per CPU.
+            level:      str - downgrade level, see downgrade_pipe.
+            c1, osc:    bool - stripping options, see strip_ansi.
+    '''
+    if action == 'strip':
+        strip_ansi_file(infile, outfile, workers, c1=c1, osc=osc)
+    elif action == 'downgrade':
+        downgrade_ansi_file(infile, outfile, workers, level=level)
+    else:
+        raise ValueError('action not recognized, try one of: strip, downgrade')
 
 
 # shortcuts for convenience, compatibility: